@@ -1,17 +1,175 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, Response
 import os
 import sys
-from src.pipeline.predict_pipeline import Predictor
-from src.pipeline.water_predict_pipeline import WaterPredictor
+import time
+import itertools
+from src.pipeline.model_registry import ModelRegistry
+from src.pipeline.prediction_cache import PredictionCache
+from src.pipeline.micro_batcher import MicroBatcher, MicroBatcherConfig
+from src.pipeline.request_trace import start_trace, end_trace, format_trace, format_trace_text
+from src.pipeline.metrics import REGISTRY, prediction_stage_seconds, histogram_samples
+from src.pipeline.profiler import RequestProfiler, MODES as PROFILE_MODES
+from src.utils import memory_usage_mb
+from src.logger import dropped_records
 
 app = Flask(__name__)
 
-# Initialize predictors
-from src.pipeline.wine_predict_pipeline import WinePredictor
+# Predictors are loaded on first use; PRELOAD_MODELS and MODEL_MEMORY_BUDGET_MB tune this.
+# Repeat queries are answered from the cache (PREDICTION_CACHE_SIZE=0 turns it off)
+prediction_cache = PredictionCache()
+model_registry = ModelRegistry(prediction_cache=prediction_cache if prediction_cache.max_entries > 0 else None)
+model_registry.preload()
 
-milk_predictor = Predictor(dataset_name='milk')
-water_predictor = WaterPredictor()
-wine_predictor = WinePredictor()
+# Concurrent single-sample requests are coalesced per dataset when MICRO_BATCH_WINDOW_MS > 0
+micro_batchers = {
+    dataset_name: MicroBatcher(
+        lambda rows, dataset_name=dataset_name: model_registry.get(dataset_name).predict_batch(rows),
+        name=dataset_name
+    )
+    for dataset_name in ('milk', 'water', 'wine')
+} if MicroBatcherConfig().max_wait_ms > 0 else {}
+
+def predict_one(dataset_name, features):
+    """Predict a single sample, through the dataset's micro-batcher when batching is on"""
+    if dataset_name in micro_batchers:
+        return micro_batchers[dataset_name].submit(features)
+    return model_registry.get(dataset_name).predict(features)
+
+def predict_one_traced(dataset_name, features):
+    """Predict in the request's own context so the stage events land in its trace buffer"""
+    token = start_trace()
+    try:
+        prediction = model_registry.get(dataset_name).predict(features)
+    finally:
+        events = end_trace(token)
+    return prediction, events
+
+# Per-process request counter; under serve.py every worker reports its own
+_request_counter = itertools.count(1)  # next() is atomic under the GIL
+worker_stats = {'pid': os.getpid(), 'requests': 0, 'startup_memory': memory_usage_mb()}
+
+@app.after_request
+def count_request(response):
+    worker_stats['requests'] = next(_request_counter)
+    return response
+
+# Prometheus metrics served by /metrics; like worker_stats they are per process
+ENDPOINT_DATASETS = {
+    'predict_milk': 'milk', 'predict_milk_batch': 'milk',
+    'predict_water': 'water', 'predict_water_batch': 'water',
+    'predict_wine': 'wine', 'predict_wine_batch': 'wine',
+}
+http_requests_total = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route, dataset and status', ('route', 'dataset', 'status')
+)
+http_request_errors_total = REGISTRY.counter(
+    'http_request_errors_total', 'HTTP requests answered with a 4xx or 5xx status', ('route', 'dataset')
+)
+http_request_seconds = REGISTRY.histogram(
+    'http_request_seconds', 'HTTP request latency by route and dataset', ('route', 'dataset')
+)
+http_requests_in_flight = REGISTRY.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled', ('route',)
+)
+
+def request_labels():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    return route, ENDPOINT_DATASETS.get(request.endpoint, '')
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_labels = request_labels()
+    http_requests_in_flight.add(g.metrics_labels[:1], 1)
+
+@app.after_request
+def record_request_metrics(response):
+    labels = g.get('metrics_labels') or request_labels()
+    http_request_seconds.observe(labels, time.perf_counter() - g.get('metrics_start', time.perf_counter()))
+    http_requests_total.inc(labels + (str(response.status_code),))
+    if response.status_code >= 400:
+        http_request_errors_total.inc(labels)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exception):
+    # Runs even when the request failed, so the gauge always comes back down
+    if 'metrics_labels' in g:
+        http_requests_in_flight.add(g.metrics_labels[:1], -1)
+
+# On-demand profiling of live requests; without PROFILER_ADMIN_TOKEN no hooks are installed
+profiler = RequestProfiler()
+
+def start_request_profile():
+    if profiler.capture is not None:
+        g.profile_token = profiler.begin_request(*g.metrics_labels)
+
+def end_request_profile(exception):
+    token = g.pop('profile_token', None)
+    if token is not None:
+        token[0].end_request(token)
+
+if profiler.enabled:
+    app.before_request(start_request_profile)
+    app.teardown_request(end_request_profile)
+
+def observe_parse(dataset_name, start):
+    """Record the JSON parsing and field validation time of a request"""
+    prediction_stage_seconds.observe((dataset_name, 'parse'), time.perf_counter() - start)
+
+def collect_serving_metrics():
+    """Model, prediction cache and micro-batcher statistics, read when /metrics is scraped"""
+    stats = model_registry.stats()
+    models = stats['models']
+    families = [
+        ('models_resident', 'gauge', 'Predictors currently loaded', [('', (), len(models))]),
+        ('models_resident_bytes', 'gauge', 'Estimated size of the loaded predictors',
+         [('', (), stats['resident_mb'] * 1024 * 1024)]),
+        ('model_size_bytes', 'gauge', 'Estimated size of each loaded predictor',
+         [('', (('dataset', name),), model['size_mb'] * 1024 * 1024) for name, model in models.items()]),
+        ('model_last_load_seconds', 'gauge', 'Load time of each loaded predictor',
+         [('', (('dataset', name),), model['load_seconds']) for name, model in models.items()]),
+        ('model_evictions_total', 'counter', 'Predictors evicted to stay within the memory budget',
+         [('', (), stats['evictions'])]),
+    ]
+    cache = stats['prediction_cache']
+    if cache is not None:
+        families += [
+            ('prediction_cache_hits_total', 'counter', 'Rows answered from the prediction cache', [('', (), cache['hits'])]),
+            ('prediction_cache_misses_total', 'counter', 'Rows not found in the prediction cache', [('', (), cache['misses'])]),
+            ('prediction_cache_hit_ratio', 'gauge', 'Share of cache lookups that hit', [('', (), cache['hit_ratio'])]),
+            ('prediction_cache_entries', 'gauge', 'Rows held in the prediction cache', [('', (), cache['entries'])]),
+        ]
+    if micro_batchers:
+        batcher_stats = {name: batcher.stats() for name, batcher in micro_batchers.items()}
+        families += [
+            ('micro_batch_size', 'histogram', 'Rows per micro-batch',
+             [sample for name, item in batcher_stats.items()
+              for sample in histogram_samples(item['batch_size'], (('dataset', name),))]),
+            ('micro_batch_queue_wait_ms', 'histogram', 'Time a request waited for its micro-batch, in milliseconds',
+             [sample for name, item in batcher_stats.items()
+              for sample in histogram_samples(item['queue_wait_ms'], (('dataset', name),))]),
+        ]
+    return families
+
+REGISTRY.register_collector(collect_serving_metrics)
+
+# Request keys accepted by the API mapped to the feature names the models were trained on
+MILK_API_FIELDS = {
+    'pH': 'pH', 'temperature': 'Temprature', 'taste': 'Taste', 'odor': 'Odor',
+    'fat': 'Fat', 'turbidity': 'Turbidity', 'colour': 'Colour'
+}
+WATER_API_FIELDS = {
+    'ph': 'ph', 'hardness': 'Hardness', 'solids': 'Solids', 'chloramines': 'Chloramines',
+    'sulfate': 'Sulfate', 'conductivity': 'Conductivity', 'organic_carbon': 'Organic_carbon',
+    'trihalomethanes': 'Trihalomethanes', 'turbidity': 'Turbidity'
+}
+WINE_API_FIELDS = {
+    'fixed_acidity': 'fixed acidity', 'volatile_acidity': 'volatile acidity', 'citric_acid': 'citric acid',
+    'residual_sugar': 'residual sugar', 'chlorides': 'chlorides', 'free_sulfur_dioxide': 'free sulfur dioxide',
+    'total_sulfur_dioxide': 'total sulfur dioxide', 'density': 'density', 'ph': 'pH',
+    'sulphates': 'sulphates', 'alcohol': 'alcohol'
+}
 
 @app.route('/')
 def index():
@@ -37,6 +195,7 @@ def wine():
 def predict_milk():
     """API endpoint for milk quality prediction"""
     try:
+        start = time.perf_counter()
         data = request.json
         features = {
             'pH': float(data['pH']),
@@ -47,8 +206,9 @@ def predict_milk():
             'Turbidity': int(data['turbidity']),
             'Colour': float(data['colour'])
         }
+        observe_parse('milk', start)
 
-        prediction = milk_predictor.predict(features)
+        prediction = predict_one('milk', features)
 
         return jsonify({
             'status': 'success',
@@ -64,8 +224,8 @@ def predict_milk():
 def predict_water():
     """API endpoint for water quality prediction"""
     try:
+        start = time.perf_counter()
         data = request.json
-        print("Received data for water prediction:", data)
         features = {
             'ph': float(data['ph']),
             'Hardness': float(data['hardness']),
@@ -77,17 +237,15 @@ def predict_water():
             'Trihalomethanes': float(data['trihalomethanes']),
             'Turbidity': float(data['turbidity'])
         }
-        print("Features prepared for prediction:", features)
+        observe_parse('water', start)
 
-        prediction = water_predictor.predict(features)
-        print("Prediction result:", prediction)
+        prediction = predict_one('water', features)
 
         return jsonify({
             'status': 'success',
             'prediction': prediction
         })
     except Exception as e:
-        print("Error during water prediction:", e)
         return jsonify({
             'status': 'error',
             'message': str(e)
@@ -97,6 +255,7 @@ def predict_water():
 def predict_wine():
     """API endpoint for wine quality prediction"""
     try:
+        start = time.perf_counter()
         data = request.json
         features = {
             'fixed acidity': float(data['fixed_acidity']),
@@ -111,28 +270,51 @@ def predict_wine():
             'sulphates': float(data['sulphates']),
             'alcohol': float(data['alcohol'])
         }
+        observe_parse('wine', start)
+
+        # ?trace=1 records the stages of this request only
+        if request.args.get('trace') == '1':
+            prediction, events = predict_one_traced('wine', features)
+            return jsonify({
+                'status': 'success',
+                'prediction': prediction,
+                'trace': format_trace(events),
+                'logs': format_trace_text(events)
+            })
+
+        prediction = predict_one('wine', features)
 
-        # Capture logs during prediction
-        import io
-        import logging
-        log_stream = io.StringIO()
-        handler = logging.StreamHandler(log_stream)
-        logger = logging.getLogger()
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
+        return jsonify({
+            'status': 'success',
+            'prediction': prediction
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
 
-        prediction = wine_predictor.predict(features)
+def predict_batch_response(dataset_name, api_fields):
+    """Score every sample of a batch request, reporting invalid samples without failing the batch"""
+    try:
+        start = time.perf_counter()
+        data = request.json
+        samples = data.get('samples') if isinstance(data, dict) else None
+        if not isinstance(samples, list):
+            raise ValueError("Request body must contain a 'samples' list")
 
-        # Flush and remove handler
-        handler.flush()
-        logger.removeHandler(handler)
-        log_contents = log_stream.getvalue()
-        log_stream.close()
+        rows = [
+            {feature: sample[key] for key, feature in api_fields.items() if key in sample}
+            if isinstance(sample, dict) else sample
+            for sample in samples
+        ]
+        observe_parse(dataset_name, start)
+        predictions, errors = model_registry.get(dataset_name).predict_batch(rows)
 
         return jsonify({
             'status': 'success',
-            'prediction': prediction,
-            'logs': log_contents
+            'predictions': predictions,
+            'errors': errors
         })
     except Exception as e:
         return jsonify({
@@ -140,6 +322,100 @@ def predict_wine():
             'message': str(e)
         }), 400
 
+@app.route('/api/predict_batch', methods=['POST'])
+def predict_milk_batch():
+    """API endpoint for batch milk quality prediction"""
+    return predict_batch_response('milk', MILK_API_FIELDS)
+
+@app.route('/api/predict_water_batch', methods=['POST'])
+def predict_water_batch():
+    """API endpoint for batch water quality prediction"""
+    return predict_batch_response('water', WATER_API_FIELDS)
+
+@app.route('/api/predict_wine_batch', methods=['POST'])
+def predict_wine_batch():
+    """API endpoint for batch wine quality prediction"""
+    return predict_batch_response('wine', WINE_API_FIELDS)
+
+@app.route('/api/models', methods=['GET'])
+def model_stats():
+    """Resident predictors with their size, load time and usage"""
+    return jsonify(model_registry.stats())
+
+@app.route('/api/worker', methods=['GET'])
+def worker_info():
+    """Requests served and memory of the process handling this request"""
+    return jsonify({**worker_stats, 'memory': memory_usage_mb(), 'log_records_dropped': dropped_records()})
+
+@app.route('/api/batching', methods=['GET'])
+def batching_stats():
+    """Batch-size and queue-wait histograms of the micro-batchers"""
+    return jsonify({name: batcher.stats() for name, batcher in micro_batchers.items()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, stage latency, model and cache metrics of this process in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def admin_error():
+    """Error response when profiling is off (404) or the admin token is wrong or missing (403), else None"""
+    if not profiler.enabled:
+        return jsonify({'status': 'error', 'message': "Profiling is disabled"}), 404
+    token = request.headers.get('X-Admin-Token')
+    if token is None and request.headers.get('Authorization', '').startswith('Bearer '):
+        token = request.headers['Authorization'][len('Bearer '):]
+    if not profiler.authorized(token):
+        return jsonify({'status': 'error', 'message': "Invalid admin token"}), 403
+    return None
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def profile_control():
+    """Start a capture (POST), list captures (GET) or stop the running one (DELETE)"""
+    error = admin_error()
+    if error is not None:
+        return error
+    if request.method == 'GET':
+        return jsonify(profiler.status())
+    if request.method == 'DELETE':
+        capture = profiler.stop()
+        return jsonify({'status': 'success', 'capture': capture.summary() if capture is not None else None})
+    try:
+        options = request.get_json(silent=True) or {}
+        mode = options.get('mode', 'sampling')
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {list(PROFILE_MODES)}")
+        capture = profiler.start(
+            mode=mode,
+            seconds=options.get('seconds'),
+            max_requests=options.get('requests'),
+            route=options.get('route'),
+            dataset=options.get('dataset'),
+        )
+        return jsonify({'status': 'success', 'capture': capture.summary()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+
+@app.route('/admin/profile/<int:capture_id>.<kind>', methods=['GET'])
+def profile_download(capture_id, kind):
+    """Download a capture as pstats data or as collapsed stacks for flame graphs"""
+    error = admin_error()
+    if error is not None:
+        return error
+    capture = profiler.get(capture_id)
+    if capture is None or kind not in ('pstats', 'collapsed'):
+        return jsonify({'status': 'error', 'message': "Unknown capture or format"}), 404
+    if not capture.done.is_set():
+        return jsonify({'status': 'error', 'message': "Capture is still running"}), 409
+    try:
+        if kind == 'pstats':
+            return Response(
+                capture.pstats_bytes(), mimetype='application/octet-stream',
+                headers={'Content-Disposition': f'attachment; filename=profile-{capture_id}.pstats'}
+            )
+        return Response(capture.collapsed_stacks(), mimetype='text/plain')
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors"""
@@ -206,6 +482,10 @@ def cli_main():
 if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '--cli':
         cli_main()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--bulk':
+        # Offline scoring of whole CSV files, e.g. python app.py --bulk readings.csv --dataset wine
+        from src.pipeline.bulk_scoring import main as bulk_main
+        bulk_main(sys.argv[2:])
     else:
         # Get port from environment variable or use 5000 as default
         port = int(os.environ.get('PORT', 5005))
@@ -0,0 +1,89 @@
+import os
+import gc
+import multiprocessing
+from dataclasses import dataclass
+from gunicorn.app.base import BaseApplication
+
+from src.logger import logging
+from src.utils import memory_usage_mb
+
+@dataclass
+class ServeConfig:
+    """Settings of the production server, overridable through environment variables"""
+    port: int = int(os.environ.get('PORT', 5005))
+    workers: int = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+    threads: int = int(os.environ.get('WORKER_THREADS', 1))
+    # Recycle a worker after this many requests (0 = never); jitter spreads restarts out
+    max_requests: int = int(os.environ.get('MAX_REQUESTS', 0))
+    max_requests_jitter: int = int(os.environ.get('MAX_REQUESTS_JITTER', 0))
+    timeout: int = int(os.environ.get('WORKER_TIMEOUT', 30))
+    graceful_timeout: int = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+    # Log the worker's request count and memory every N requests (0 = only at exit)
+    report_every: int = int(os.environ.get('REPORT_EVERY_REQUESTS', 1000))
+    preload_models: str = os.environ.get('PRELOAD_MODELS', 'all')
+
+serve_config = ServeConfig()
+
+def format_memory(usage):
+    private = f", private {usage['private_mb']:.1f} MB" if usage['private_mb'] is not None else ""
+    return f"RSS {usage['rss_mb']:.1f} MB{private}"
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's reach so collections in the
+    # workers do not touch (and un-share) the preloaded model pages
+    gc.freeze()
+    logging.info(f"Master {os.getpid()} ready with models loaded: {format_memory(memory_usage_mb())}")
+
+def post_fork(server, worker):
+    from app import worker_stats
+    worker_stats['pid'] = worker.pid
+    worker_stats['requests'] = 0
+    worker_stats['startup_memory'] = memory_usage_mb()
+    logging.info(f"Worker {worker.pid} started: {format_memory(worker_stats['startup_memory'])}")
+
+def post_request(worker, req, environ, resp):
+    from app import worker_stats
+    report_every = serve_config.report_every
+    if report_every and worker_stats['requests'] and worker_stats['requests'] % report_every == 0:
+        logging.info(
+            f"Worker {worker.pid} served {worker_stats['requests']} requests: {format_memory(memory_usage_mb())}"
+        )
+
+def worker_exit(server, worker):
+    from app import worker_stats
+    logging.info(
+        f"Worker {worker.pid} exiting after {worker_stats['requests']} requests: {format_memory(memory_usage_mb())}"
+    )
+
+class ProductionServer(BaseApplication):
+    """Prefork gunicorn server that loads the Flask app and its models once in the master"""
+    def __init__(self, config=None):
+        self.serve_config = config or serve_config
+        super().__init__()
+
+    def load_config(self):
+        config = self.serve_config
+        settings = {
+            'bind': f"0.0.0.0:{config.port}",
+            'workers': config.workers,
+            'threads': config.threads,
+            'max_requests': config.max_requests,
+            'max_requests_jitter': config.max_requests_jitter,
+            'timeout': config.timeout,
+            'graceful_timeout': config.graceful_timeout,
+            'preload_app': True,
+            'when_ready': when_ready,
+            'post_fork': post_fork,
+            'post_request': post_request,
+            'worker_exit': worker_exit,
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app, model_registry
+        model_registry.preload(self.serve_config.preload_models)
+        return app
+
+if __name__ == '__main__':
+    ProductionServer().run()
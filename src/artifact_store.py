@@ -0,0 +1,272 @@
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import platform
+from datetime import datetime
+import dill
+import numpy as np
+from sklearn.tree._tree import Tree
+
+from src.exception import CustomException
+from src.logger import logging
+
+BUNDLE_FORMAT = 'fqp-artifact'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_SUFFIX = '.bundle'
+MANIFEST_FILE = 'manifest.json'
+SKELETON_FILE = 'skeleton.pkl'
+# Arrays smaller than this stay inside the pickled skeleton
+MIN_ARRAY_BYTES = 256
+# Objects whose __setstate__ copies the arrays it is given, so memory-mapping them gains nothing
+COPYING_TYPES = (Tree,)
+# A bundle is only loaded by default when it loads at least this many times, and this many ms, faster than its pickle
+MIN_LOAD_SPEEDUP = float(os.environ.get('BUNDLE_MIN_SPEEDUP', 1.25))
+MIN_LOAD_SAVING_MS = float(os.environ.get('BUNDLE_MIN_SAVING_MS', 1.0))
+
+def bundle_path_for(pickle_path):
+    '''artifact/wine_model.pkl -> artifact/wine_model.bundle'''
+    return os.path.splitext(pickle_path)[0] + BUNDLE_SUFFIX
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _library_versions():
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    for name in ('sklearn', 'catboost', 'xgboost'):
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, '__version__', 'unknown')
+    return versions
+
+def _describe_schema(obj):
+    '''Feature schema and class mapping of a fitted estimator, when it has them'''
+    schema = {}
+    if hasattr(obj, 'feature_names_in_'):
+        schema['feature_names_in'] = [str(name) for name in obj.feature_names_in_]
+    if hasattr(obj, 'n_features_in_'):
+        schema['n_features_in'] = int(obj.n_features_in_)
+    class_mapping = None
+    if hasattr(obj, 'classes_'):
+        class_mapping = {str(i): label for i, label in enumerate(np.asarray(obj.classes_).tolist())}
+    return schema, class_mapping
+
+class _ArrayExtractingPickler(pickle.Pickler):
+    '''Pickles the object graph but hands numeric arrays out to be stored as .npy files'''
+    def __init__(self, file, arrays):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = arrays
+        self._array_ids = {}
+        self._inline_ids = set()
+        # Keeps the temporary states alive so the ids in _inline_ids are not reused
+        self._inline_states = []
+
+    def reducer_override(self, obj):
+        if isinstance(obj, COPYING_TYPES):
+            # sklearn's Tree copies its node arrays on load: store them inline in the skeleton
+            reduced = obj.__reduce__()
+            self._inline_states.append(reduced)
+            for part in reduced[1:]:
+                values = part.values() if isinstance(part, dict) else part if isinstance(part, tuple) else ()
+                self._inline_ids.update(id(value) for value in values if isinstance(value, np.ndarray))
+            return reduced
+        return NotImplemented
+
+    def persistent_id(self, obj):
+        if id(obj) in self._inline_ids:
+            return None
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject and obj.nbytes >= MIN_ARRAY_BYTES:
+            index = self._array_ids.get(id(obj))
+            if index is None:
+                index = len(self.arrays)
+                self._array_ids[id(obj)] = index
+                self.arrays.append(np.ascontiguousarray(obj))
+            return ('ndarray', index)
+        return None
+
+class _ArrayLoadingUnpickler(pickle.Unpickler):
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        if kind != 'ndarray':
+            raise pickle.UnpicklingError(f"Unknown persistent id {pid}")
+        return self.arrays[index]
+
+def _best_load_ms(load, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def _load_pickle(file_path):
+    with open(file_path, 'rb') as f:
+        return dill.load(f)
+
+def save_artifact_bundle(bundle_path, obj, source_path=None):
+    '''
+    Write obj as a bundle directory: numeric arrays as .npy files that can be memory-mapped,
+    the rest of the object graph as a small pickle, and a JSON manifest with schema and checksums.
+    With a source pickle, both loads are timed and the manifest records whether the bundle is
+    the faster one, which is what load_object goes by.
+    '''
+    try:
+        tmp_path = bundle_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(os.path.join(tmp_path, 'arrays'))
+
+        arrays = []
+        buffer = io.BytesIO()
+        _ArrayExtractingPickler(buffer, arrays).dump(obj)
+        with open(os.path.join(tmp_path, SKELETON_FILE), 'wb') as f:
+            f.write(buffer.getvalue())
+
+        array_entries = []
+        for index, array in enumerate(arrays):
+            file_name = os.path.join('arrays', f"{index:04d}.npy")
+            np.save(os.path.join(tmp_path, file_name), array, allow_pickle=False)
+            array_entries.append({
+                'file': file_name,
+                'dtype': str(array.dtype),
+                'shape': list(array.shape),
+                'sha256': file_sha256(os.path.join(tmp_path, file_name)),
+            })
+
+        schema, class_mapping = _describe_schema(obj)
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'object_type': f"{type(obj).__module__}.{type(obj).__qualname__}",
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'library_versions': _library_versions(),
+            'schema': schema,
+            'class_mapping': class_mapping,
+            'skeleton': {'file': SKELETON_FILE, 'sha256': file_sha256(os.path.join(tmp_path, SKELETON_FILE))},
+            'arrays': array_entries,
+            'source': None,
+        }
+        if source_path is not None:
+            stat = os.stat(source_path)
+            manifest['source'] = {
+                'file': os.path.basename(source_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': file_sha256(source_path),
+            }
+            pickle_ms = _best_load_ms(lambda: _load_pickle(source_path))
+            bundle_ms = _best_load_ms(lambda: _load_bundle_files(tmp_path, manifest))
+            manifest['load_ms'] = {'pickle': pickle_ms, 'bundle': bundle_ms}
+            manifest['preferred'] = bundle_ms * MIN_LOAD_SPEEDUP <= pickle_ms and pickle_ms - bundle_ms >= MIN_LOAD_SAVING_MS
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+
+        # Swap the finished bundle in so readers never see a half-written one
+        shutil.rmtree(bundle_path, ignore_errors=True)
+        os.replace(tmp_path, bundle_path)
+        return manifest
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def read_manifest(bundle_path):
+    with open(os.path.join(bundle_path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != BUNDLE_FORMAT or manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact bundle format in {bundle_path}")
+    return manifest
+
+def verify_artifact_bundle(bundle_path):
+    '''Recompute the checksum of every file in the bundle; returns the list of mismatching files'''
+    manifest = read_manifest(bundle_path)
+    entries = [manifest['skeleton']] + manifest['arrays']
+    return [
+        entry['file'] for entry in entries
+        if file_sha256(os.path.join(bundle_path, entry['file'])) != entry['sha256']
+    ]
+
+def load_artifact_bundle(bundle_path, mmap_mode='r', verify=False):
+    '''Load a bundle; with mmap_mode='r' arrays are read-only views on the page cache'''
+    try:
+        manifest = read_manifest(bundle_path)
+        if verify:
+            corrupted = verify_artifact_bundle(bundle_path)
+            if corrupted:
+                raise ValueError(f"Checksum mismatch in {bundle_path}: {corrupted}")
+
+        return _load_bundle_files(bundle_path, manifest, mmap_mode)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def _load_bundle_files(bundle_path, manifest, mmap_mode='r'):
+    arrays = [
+        np.load(os.path.join(bundle_path, entry['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        for entry in manifest['arrays']
+    ]
+    with open(os.path.join(bundle_path, manifest['skeleton']['file']), 'rb') as f:
+        return _ArrayLoadingUnpickler(f, arrays).load()
+
+def _source_matches(source, source_path):
+    '''True when the manifest's source entry describes the current contents of source_path'''
+    if not source:
+        return False
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return False
+    if source['size'] != stat.st_size:
+        return False
+    # An unchanged size and modification time is taken as unchanged contents; only a touched file is hashed
+    if source.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    return source['sha256'] == file_sha256(source_path)
+
+def bundle_matches_source(bundle_path, source_path):
+    '''True when the bundle was converted from the current contents of source_path'''
+    try:
+        source = read_manifest(bundle_path).get('source')
+    except (OSError, ValueError):
+        return False
+    return _source_matches(source, source_path)
+
+def preferred_bundle(source_path, mode=None):
+    '''
+    Bundle to load instead of the pickle at source_path, or None. ARTIFACT_BUNDLES picks the policy:
+    'auto' (default) uses an up-to-date bundle only when it measured faster to load than the pickle,
+    'always' uses any up-to-date bundle and 'never' ignores bundles.
+    '''
+    mode = mode or os.environ.get('ARTIFACT_BUNDLES', 'auto')
+    bundle_path = bundle_path_for(source_path)
+    if mode == 'never' or not os.path.isdir(bundle_path):
+        return None
+    try:
+        manifest = read_manifest(bundle_path)
+    except (OSError, ValueError):
+        logging.warning(f"Ignoring unreadable artifact bundle {bundle_path}")
+        return None
+    if mode != 'always' and not manifest.get('preferred', False):
+        return None
+    if not _source_matches(manifest.get('source'), source_path):
+        logging.warning(f"Ignoring stale artifact bundle {bundle_path}")
+        return None
+    return bundle_path
+
+def convert_pickle_to_bundle(pickle_path, load_pickle):
+    '''Convert an existing dill pickle into a bundle next to it'''
+    bundle_path = bundle_path_for(pickle_path)
+    manifest = save_artifact_bundle(bundle_path, load_pickle(pickle_path), source_path=pickle_path)
+    logging.info(
+        f"Converted {pickle_path} to {bundle_path} ({len(manifest['arrays'])} arrays); loads in "
+        f"{manifest['load_ms']['bundle']:.2f} ms against {manifest['load_ms']['pickle']:.2f} ms for the pickle"
+    )
+    return bundle_path
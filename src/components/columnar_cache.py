@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+
+MANIFEST_FILE = 'manifest.json'
+
+# Explicit dtypes of the source CSVs, by header name without surrounding spaces
+# ('category' columns are dictionary-encoded into int32 codes)
+SOURCE_SCHEMAS = {
+    'milk': {
+        'pH': 'float64', 'Temprature': 'int64', 'Taste': 'int64', 'Odor': 'int64',
+        'Fat': 'int64', 'Turbidity': 'int64', 'Colour': 'int64', 'Grade': 'category',
+    },
+    'wine': {
+        'fixed acidity': 'float64', 'volatile acidity': 'float64', 'citric acid': 'float64',
+        'residual sugar': 'float64', 'chlorides': 'float64', 'free sulfur dioxide': 'float64',
+        'total sulfur dioxide': 'float64', 'density': 'float64', 'pH': 'float64',
+        'sulphates': 'float64', 'alcohol': 'float64', 'quality': 'int64', 'Id': 'int64',
+    },
+    'water': {
+        'ph': 'float64', 'Hardness': 'float64', 'Solids': 'float64', 'Chloramines': 'float64',
+        'Sulfate': 'float64', 'Conductivity': 'float64', 'Organic_carbon': 'float64',
+        'Trihalomethanes': 'float64', 'Turbidity': 'float64', 'Potability': 'int64',
+    },
+}
+
+def _read_header(source_path):
+    return list(pd.read_csv(source_path, nrows=0).columns)
+
+def _resolve_dtypes(header, schema):
+    '''Map the schema onto the file's own header names (milk has 'Fat ' with a trailing space)'''
+    by_name = {column.strip(): column for column in header}
+    missing = [name for name in schema if name not in by_name]
+    extra = [column for column in header if column.strip() not in schema]
+    if missing or extra:
+        raise ValueError(f"Source columns do not match the schema: missing {missing}, unexpected {extra}")
+    return {column: schema[column.strip()] for column in header}
+
+def write_columnar_cache(source_path, cache_dir, schema, content_hash, chunk_rows=100000, raw_copy_path=None):
+    '''
+    Stream the source CSV in chunks into one raw binary file per column plus a JSON manifest.
+    Category columns are stored as int32 codes with their dictionary in the manifest. Memory use
+    is bounded by one chunk. Optionally writes a normalized CSV copy of the source in the same pass.
+    '''
+    try:
+        header = _read_header(source_path)
+        dtypes = _resolve_dtypes(header, schema)
+        tmp_dir = cache_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        files = {}
+        dictionaries = {column: {} for column, dtype in dtypes.items() if dtype == 'category'}
+        read_dtypes = {column: (str if dtype == 'category' else dtype) for column, dtype in dtypes.items()}
+        n_rows = 0
+        raw_tmp_path = raw_copy_path + '.tmp' if raw_copy_path else None
+        try:
+            for index, column in enumerate(header):
+                files[column] = open(os.path.join(tmp_dir, f"{index:04d}.bin"), 'wb')
+            for chunk_index, chunk in enumerate(pd.read_csv(source_path, dtype=read_dtypes, chunksize=chunk_rows)):
+                for column in header:
+                    values = chunk[column]
+                    if column in dictionaries:
+                        dictionary = dictionaries[column]
+                        for value in values.unique():
+                            dictionary.setdefault(value, len(dictionary))
+                        data = values.map(dictionary).to_numpy(dtype=np.int32)
+                    else:
+                        data = values.to_numpy(dtype=dtypes[column])
+                    files[column].write(np.ascontiguousarray(data).tobytes())
+                if raw_tmp_path:
+                    chunk.to_csv(raw_tmp_path, index=False, header=chunk_index == 0, mode='w' if chunk_index == 0 else 'a')
+                n_rows += len(chunk)
+        finally:
+            for f in files.values():
+                f.close()
+
+        manifest = {
+            'source_path': source_path,
+            'source_sha256': content_hash,
+            'n_rows': n_rows,
+            'columns': [
+                {
+                    'name': column,
+                    'file': f"{index:04d}.bin",
+                    'dtype': 'int32' if column in dictionaries else dtypes[column],
+                    'categories': list(dictionaries[column]) if column in dictionaries else None,
+                }
+                for index, column in enumerate(header)
+            ],
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+        if raw_tmp_path:
+            os.replace(raw_tmp_path, raw_copy_path)
+        logging.info(f"Columnar cache of {source_path} ({n_rows} rows) written to {cache_dir}")
+        return ColumnarTable(cache_dir)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+class ColumnarTable:
+    '''Read-only view of a columnar cache; columns are memory-mapped and rows are decoded on demand'''
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.n_rows = self.manifest['n_rows']
+        self.columns = [column['name'] for column in self.manifest['columns']]
+        self._data = {}
+        self._categories = {}
+        for column in self.manifest['columns']:
+            path = os.path.join(cache_dir, column['file'])
+            if self.n_rows:
+                self._data[column['name']] = np.memmap(path, dtype=column['dtype'], mode='r', shape=(self.n_rows,))
+            else:
+                self._data[column['name']] = np.empty(0, dtype=column['dtype'])
+            if column['categories'] is not None:
+                self._categories[column['name']] = np.asarray(column['categories'], dtype=object)
+
+    @staticmethod
+    def exists(cache_dir):
+        return os.path.exists(os.path.join(cache_dir, MANIFEST_FILE))
+
+    def column(self, name):
+        '''Raw stored values: numbers, or int32 codes for category columns'''
+        return self._data[name]
+
+    def take(self, indices):
+        '''DataFrame of the given rows, in the given order, with the source header and decoded categories'''
+        indices = np.asarray(indices)
+        frame = {}
+        for name in self.columns:
+            values = self._data[name][indices]
+            if name in self._categories:
+                values = self._categories[name][values]
+            frame[name] = values
+        return pd.DataFrame(frame, columns=self.columns)
+
+    def write_csv(self, file_path, indices, chunk_rows=100000):
+        '''Write the given rows to a CSV, chunk by chunk, replacing the file atomically'''
+        try:
+            tmp_path = file_path + '.tmp'
+            if len(indices) == 0:
+                pd.DataFrame(columns=self.columns).to_csv(tmp_path, index=False, header=True)
+            for start in range(0, len(indices), chunk_rows):
+                self.take(indices[start:start + chunk_rows]).to_csv(
+                    tmp_path, index=False, header=start == 0, mode='w' if start == 0 else 'a'
+                )
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -1,5 +1,32 @@
+import os
+import sys
+import shutil
+import tempfile
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 
+from src.exception import CustomException
+from src.logger import logging
+
+@dataclass
+class DataAnalysisConfig:
+    chunk_rows: int = int(os.environ.get('ANALYSIS_CHUNK_ROWS', 500000))
+    # Approximate duplicates differ by at most this much in every numeric feature, in standard deviations
+    tolerance: float = float(os.environ.get('ANALYSIS_TOLERANCE', 0.25))
+    # Shifted grids searched for approximate duplicates, and their cell width in tolerances;
+    # more rounds and wider cells find more pairs, wider cells also need a larger window
+    rounds: int = int(os.environ.get('ANALYSIS_ROUNDS', 8))
+    cell_width: float = float(os.environ.get('ANALYSIS_CELL_WIDTH', 4))
+    # Rows of a cell, ordered by their first scaled feature, that each row is compared with
+    window: int = int(os.environ.get('ANALYSIS_WINDOW', 16))
+    # Spill files per index; the grid index gets more of them on large files, so that one
+    # partition (which is sorted in memory) stays near partition_mb
+    partitions: int = int(os.environ.get('ANALYSIS_PARTITIONS', 64))
+    partition_mb: float = float(os.environ.get('ANALYSIS_PARTITION_MB', 64))
+    spill_dir: str = os.environ.get('ANALYSIS_SPILL_DIR') or None
+    random_state: int = 42
+
 def analyze_duplicates_and_leakage(file_path: str, target_column: str):
     df = pd.read_csv(file_path)
     analysis_report = {}
@@ -26,3 +53,272 @@ def analyze_duplicates_and_leakage(file_path: str, target_column: str):
         analysis_report['note'] = "Target column is non-numeric; correlation check skipped."
 
     return analysis_report
+
+def _combine(hashes, values):
+    '''Fold one uint64 column into running row hashes (multiply-xorshift mixing)'''
+    hashes = (hashes ^ values) * np.uint64(0x9E3779B97F4A7C15)
+    return hashes ^ (hashes >> np.uint64(29))
+
+def _float_bits(values):
+    '''float64 values as uint64 bits, with -0.0 and every NaN mapped to one representation'''
+    values = np.where(np.isnan(values), np.nan, values + 0.0)
+    return values.view(np.uint64)
+
+class PairwiseMoments:
+    '''
+    Running means, variances and covariance of column pairs (x_j, y_j) over streamed chunks,
+    merged with Chan's parallel update so large files keep float64 accuracy; rows where either
+    value is NaN are skipped pair by pair, as pandas' corr does
+    '''
+    def __init__(self, n_columns):
+        self.n = np.zeros(n_columns)
+        self.mean_x = np.zeros(n_columns)
+        self.mean_y = np.zeros(n_columns)
+        self.m2_x = np.zeros(n_columns)
+        self.m2_y = np.zeros(n_columns)
+        self.c_xy = np.zeros(n_columns)
+
+    def update(self, x, y):
+        valid = ~(np.isnan(x) | np.isnan(y))
+        n = valid.sum(axis=0).astype(np.float64)
+        safe_n = np.maximum(n, 1)
+        x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+        mean_x, mean_y = x.sum(axis=0) / safe_n, y.sum(axis=0) / safe_n
+        dx, dy = np.where(valid, x - mean_x, 0.0), np.where(valid, y - mean_y, 0.0)
+
+        total = self.n + n
+        weight = np.where(total > 0, self.n * n / np.maximum(total, 1), 0.0)
+        delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+        self.m2_x += (dx * dx).sum(axis=0) + delta_x * delta_x * weight
+        self.m2_y += (dy * dy).sum(axis=0) + delta_y * delta_y * weight
+        self.c_xy += (dx * dy).sum(axis=0) + delta_x * delta_y * weight
+        share = np.where(total > 0, n / np.maximum(total, 1), 0.0)
+        self.mean_x += delta_x * share
+        self.mean_y += delta_y * share
+        self.n = total
+
+    def std_x(self):
+        return np.sqrt(self.m2_x / np.maximum(self.n - 1, 1))
+
+    def correlation(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.c_xy / np.sqrt(self.m2_x * self.m2_y)
+
+class SpillPartitions:
+    '''Records appended to one of `partitions` files by key, so each partition can be sorted on its own'''
+    def __init__(self, directory, name, dtype, partitions):
+        self.dtype = np.dtype(dtype)
+        self.paths = [os.path.join(directory, f"{name}_{index:04d}.bin") for index in range(partitions)]
+        self.files = [open(path, 'wb') for path in self.paths]
+
+    def append(self, records, keys):
+        partition = (keys % np.uint64(len(self.files))).astype(np.intp)
+        order = np.argsort(partition, kind='stable')
+        bounds = np.cumsum(np.bincount(partition, minlength=len(self.files)))
+        for index, (start, end) in enumerate(zip(np.r_[0, bounds[:-1]], bounds)):
+            if end > start:
+                self.files[index].write(records[order[start:end]].tobytes())
+
+    def __iter__(self):
+        for f in self.files:
+            f.close()
+        for path in self.paths:
+            yield np.fromfile(path, dtype=self.dtype)
+
+EXACT_RECORD = [('features', 'u8'), ('target', 'i4')]
+def _cell_record(n_numeric):
+    # Scaled features are in tolerances, so two rows are approximate duplicates when no coordinate differs by more than 1
+    return [('cell', 'u8'), ('features', 'u8'), ('target', 'i4'), ('row', 'i8'), ('coords', 'f4', (max(n_numeric, 1),))]
+
+def _group_starts(*sorted_keys):
+    '''Start index of every run of equal keys in arrays sorted by them'''
+    change = np.zeros(len(sorted_keys[0]), dtype=bool)
+    change[0] = True
+    for keys in sorted_keys:
+        change[1:] |= keys[1:] != keys[:-1]
+    return np.flatnonzero(change)
+
+def _scan_cells(records, window):
+    '''
+    (rows with an approximate duplicate, rows with an approximate label conflict) of one partition.
+    Copies with equal features and target are collapsed first, so they cannot fill the window;
+    each remaining row is then compared with the next `window` rows of its cell in the order of
+    the first scaled feature, which is near-linear in the number of rows.
+    '''
+    records = records[np.lexsort((records['target'], records['features'], records['cell']))]
+    starts = _group_starts(records['cell'], records['features'], records['target'])
+    copies = np.zeros(len(records), dtype=np.int64)
+    copies[starts[1:]] = 1
+    copies = np.cumsum(copies)
+    unique = records[starts]
+    order = np.lexsort((unique['coords'][:, 0], unique['cell']))
+    representative = np.argsort(order)
+    unique = unique[order]
+    cell, features, target = unique['cell'], unique['features'], unique['target']
+    coords = np.ascontiguousarray(unique['coords'].T)
+    first = coords[0]
+
+    duplicate = np.zeros(len(unique), dtype=bool)
+    conflict = np.zeros(len(unique), dtype=bool)
+    # Rows whose next rows in the cell may still be within the tolerance; sorted by the first
+    # coordinate, a row leaves for good once a neighbour is further than 1 away in it
+    active = np.arange(len(unique) - 1)
+    for offset in range(1, window + 1):
+        active = active[active + offset < len(unique)]
+        other = active + offset
+        keep = (cell[active] == cell[other]) & ~(first[other] - first[active] > 1)
+        active, other = active[keep], other[keep]
+        if len(active) == 0:
+            break
+        # Column by column, so pairs that are far apart in an early feature drop out early
+        left, right = active, other
+        for column in coords[1:]:
+            close = np.abs(column[left] - column[right]) <= 1
+            left, right = left[close], right[close]
+        for flags, differs in ((duplicate, features[left] != features[right]),
+                               (conflict, target[left] != target[right])):
+            flags[left[differs]] = True
+            flags[right[differs]] = True
+    rows = records['row']
+    return rows[duplicate[representative][copies]], rows[conflict[representative][copies]]
+
+def analyze_duplicates_streaming(file_path: str, target_column: str, config=None):
+    '''
+    Same report as analyze_duplicates_and_leakage, computed in two passes over the CSV with memory
+    bounded by one chunk plus one spill partition (and two flags per row), plus approximate
+    duplicates: rows whose numeric features, scaled by their standard deviation, are all within
+    `tolerance` of another row with different values and equal other features.
+    - pass 1: 64-bit fingerprints of each row's features, partitioned on disk, give exact
+      duplicates and label conflicts; running moments give the scaling and target correlations
+    - pass 2: every row goes into a grid cell `cell_width` tolerances wide in each of `rounds`
+      randomly shifted grids, and rows sharing a cell are compared (see _scan_cells); each extra
+      round finds more of the pairs that straddle a cell border. Every reported pair is within
+      the tolerance; the search may miss some pairs but never reports a false one.
+    '''
+    config = config or DataAnalysisConfig()
+    work_dir = tempfile.mkdtemp(prefix='analysis_', dir=config.spill_dir)
+    try:
+        header = list(pd.read_csv(file_path, nrows=0).columns)
+        if target_column not in header:
+            raise ValueError(f"Target column {target_column!r} is not in {file_path}")
+        feature_columns = [column for column in header if column != target_column]
+        first = pd.read_csv(file_path, nrows=1000)
+        numeric_columns = [column for column in feature_columns if pd.api.types.is_numeric_dtype(first[column])]
+        other_columns = [column for column in feature_columns if column not in numeric_columns]
+        numeric_target = pd.api.types.is_numeric_dtype(first[target_column])
+
+        def chunks():
+            return pd.read_csv(file_path, chunksize=config.chunk_rows)
+
+        def other_hash(chunk):
+            hashes = np.zeros(len(chunk), dtype=np.uint64)
+            for column in other_columns:
+                hashes = _combine(hashes, pd.util.hash_array(chunk[column].to_numpy(dtype=object)))
+            return hashes
+
+        # Pass 1: exact fingerprints and moments
+        targets = {}
+        # Feature moments (each column paired with itself) scale the grid; target moments give correlations
+        feature_moments = PairwiseMoments(len(numeric_columns))
+        target_moments = PairwiseMoments(len(numeric_columns)) if numeric_target else None
+        exact = SpillPartitions(work_dir, 'exact', EXACT_RECORD, config.partitions)
+        n_rows = 0
+        for chunk in chunks():
+            numeric = chunk[numeric_columns].to_numpy(dtype=np.float64)
+            hashes = other_hash(chunk)
+            for j in range(numeric.shape[1]):
+                hashes = _combine(hashes, _float_bits(numeric[:, j]))
+            target = chunk[target_column]
+            for value in target.dropna().unique():
+                targets.setdefault(value, len(targets))
+            records = np.empty(len(chunk), dtype=EXACT_RECORD)
+            records['features'] = hashes
+            records['target'] = target.map(targets).fillna(-1).to_numpy(dtype=np.int32)
+            exact.append(records, hashes)
+
+            feature_moments.update(numeric, numeric)
+            if numeric_target:
+                target_moments.update(
+                    numeric, np.repeat(target.to_numpy(dtype=np.float64)[:, None], numeric.shape[1], axis=1)
+                )
+            n_rows += len(chunk)
+
+        num_duplicates = num_conflict_groups = 0
+        for records in exact:
+            if len(records) == 0:
+                continue
+            records = records[np.lexsort((records['target'], records['features']))]
+            num_duplicates += len(records) - len(_group_starts(records['features'], records['target']))
+            starts = _group_starts(records['features'])
+            conflicting = (np.minimum.reduceat(records['target'], starts)
+                           != np.maximum.reduceat(records['target'], starts))
+            num_conflict_groups += int(conflicting.sum())
+
+        # Pass 2: shifted grid cells over the scaled numeric features
+        center, scale = feature_moments.mean_x, feature_moments.std_x()
+        scale[~(scale > 0)] = 1.0
+        rng = np.random.default_rng(config.random_state)
+        shifts = rng.uniform(0, 1, size=(config.rounds, len(numeric_columns)))
+        round_seeds = rng.integers(1, 2 ** 63, size=config.rounds, dtype=np.int64).astype(np.uint64)
+        cell_record = _cell_record(len(numeric_columns))
+        spill_bytes = n_rows * config.rounds * np.dtype(cell_record).itemsize
+        partitions = max(config.partitions, int(np.ceil(spill_bytes / (config.partition_mb * 1024 * 1024))))
+        cells = SpillPartitions(work_dir, 'cells', cell_record, partitions)
+        row_start = 0
+        for chunk in chunks():
+            numeric = chunk[numeric_columns].to_numpy(dtype=np.float64)
+            base = other_hash(chunk)
+            features = base.copy()
+            for j in range(numeric.shape[1]):
+                features = _combine(features, _float_bits(numeric[:, j]))
+            target = chunk[target_column].map(targets).fillna(-1).to_numpy(dtype=np.int32)
+            scaled = (numeric - center) / (scale * config.tolerance)
+            rows = np.arange(row_start, row_start + len(chunk))
+            for round_index in range(config.rounds):
+                cell_index = np.floor(scaled / config.cell_width + shifts[round_index])
+                # Missing values only share a cell with missing values
+                cell_index = np.where(np.isnan(cell_index), np.iinfo(np.int64).min, cell_index).astype(np.int64)
+                keys = _combine(base, np.full(len(chunk), round_seeds[round_index], dtype=np.uint64))
+                for j in range(cell_index.shape[1]):
+                    keys = _combine(keys, cell_index[:, j].view(np.uint64))
+                records = np.zeros(len(chunk), dtype=cell_record)
+                records['cell'], records['features'], records['target'], records['row'] = keys, features, target, rows
+                if numeric_columns:
+                    # Rows share a cell only with rows missing the same features, so a missing
+                    # feature can count as 0 when their distance is measured
+                    records['coords'] = np.nan_to_num(scaled, nan=0.0)
+                cells.append(records, keys)
+            row_start += len(chunk)
+
+        near_duplicate = np.zeros(n_rows, dtype=bool)
+        near_conflict = np.zeros(n_rows, dtype=bool)
+        for records in cells:
+            if len(records) == 0:
+                continue
+            duplicate_rows, conflict_rows = _scan_cells(records, config.window)
+            near_duplicate[duplicate_rows] = True
+            near_conflict[conflict_rows] = True
+
+        report = {
+            'num_rows': n_rows,
+            'num_duplicates': int(num_duplicates),
+            'num_near_duplicates': int(num_conflict_groups),
+            'num_approximate_duplicate_rows': int(near_duplicate.sum()),
+            'num_approximate_conflict_rows': int(near_conflict.sum()),
+            'tolerance': config.tolerance,
+            'rounds': config.rounds,
+        }
+        if numeric_target:
+            correlations = target_moments.correlation()
+            report['high_corr_features'] = [
+                column for column, value in zip(numeric_columns, correlations) if abs(value) > 0.95
+            ]
+        else:
+            report['high_corr_features'] = []
+            report['note'] = "Target column is non-numeric; correlation check skipped."
+        logging.info(f"Streaming analysis of {file_path}: {report}")
+        return report
+    except Exception as e:
+        raise CustomException(e, sys)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
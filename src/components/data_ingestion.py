@@ -1,13 +1,17 @@
 import os
 import sys
+import json
 import time
 from src.logger import logging
 from src.exception import CustomException
 
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
+from sklearn.model_selection import ShuffleSplit
 from dataclasses import dataclass
 
+from src.artifact_store import file_sha256
+from src.components.columnar_cache import SOURCE_SCHEMAS, ColumnarTable, write_columnar_cache
+
 from src.components.data_transformation import DataTransformation, DataTransformationWine, DataTransformationWater
 from src.components.model_trainer import ModelTrainer
 
@@ -26,11 +30,52 @@ class DataIngestionConfig:
     water_test_data_path: str = os.path.join('src', 'water', 'test_data.csv')
     water_raw_data_path: str = os.path.join('src', 'water', 'raw_data.csv')
 
+    # Columnar copies of the source CSVs, one directory per source content hash
+    cache_dir: str = os.path.join('artifact', 'data_cache')
+    chunk_rows: int = int(os.environ.get('INGESTION_CHUNK_ROWS', 100000))
+    test_size: float = 0.2
+    random_state: int = 42
+
 class DataIngestion:
     def __init__(self, dataset_name='milk'):
         self.data_ingestion_config = DataIngestionConfig()
         self.dataset_name = dataset_name.lower()
     
+    @staticmethod
+    def split_manifest_path(train_path):
+        return os.path.join(os.path.dirname(train_path), 'split_manifest.json')
+
+    def split_is_current(self, manifest_path, source_hash, train_path, test_path, raw_path):
+        '''True when the split and raw files were written from this source content with the current settings'''
+        if not all(os.path.exists(path) for path in (manifest_path, train_path, test_path, raw_path)):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        config = self.data_ingestion_config
+        if (manifest.get('source_sha256') != source_hash or manifest.get('test_size') != config.test_size
+                or manifest.get('random_state') != config.random_state):
+            logging.info(f"Split in {os.path.dirname(train_path)} was made from other source data or settings")
+            return False
+        # Guards against the split files being edited or replaced by hand
+        return (manifest.get('train_sha256') == file_sha256(train_path)
+                and manifest.get('test_sha256') == file_sha256(test_path)
+                and manifest.get('raw_sha256') == file_sha256(raw_path))
+
+    def write_split_manifest(self, manifest_path, source_hash, dataset_path, train_path, test_path, raw_path, n_rows):
+        config = self.data_ingestion_config
+        manifest = {
+            'source_path': dataset_path,
+            'source_sha256': source_hash,
+            'n_rows': n_rows,
+            'test_size': config.test_size,
+            'random_state': config.random_state,
+            'train_sha256': file_sha256(train_path),
+            'test_sha256': file_sha256(test_path),
+            'raw_sha256': file_sha256(raw_path),
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
     def initiate_data_ingestion(self):
         """This function initiates data ingestion process"""
         logging.info("Entered the data ingestion method or component")
@@ -54,27 +99,40 @@ class DataIngestion:
             else:
                 raise CustomException(f"Unsupported dataset: {self.dataset_name}", sys)
 
-            # Check if train and test data files already exist
-            if os.path.exists(train_path) and os.path.exists(test_path):
-                logging.info("Train and test data files already exist. Skipping data split.")
-                return train_path, test_path, 0.0
-
+            config = self.data_ingestion_config
             start_time = time.time()
-            df = pd.read_csv(dataset_path)
-            logging.info(f"Dataset {self.dataset_name} loaded as dataframe")
+            source_hash = file_sha256(dataset_path)
 
-            os.makedirs(os.path.dirname(train_path), exist_ok=True)
+            # The split is reused only if it was made from this exact source content
+            manifest_path = self.split_manifest_path(train_path)
+            if self.split_is_current(manifest_path, source_hash, train_path, test_path, raw_path):
+                logging.info("Train and test data are up to date with the source. Skipping data split.")
+                return train_path, test_path, 0.0
 
-            # Save raw data in dataset-specific folder
-            df.to_csv(raw_path, index=False, header=True)
+            os.makedirs(os.path.dirname(train_path), exist_ok=True)
+            cache_dir = os.path.join(config.cache_dir, self.dataset_name, source_hash[:16])
+            if ColumnarTable.exists(cache_dir):
+                table = ColumnarTable(cache_dir)
+                logging.info(f"Dataset {self.dataset_name} opened from columnar cache {cache_dir}")
+                # An existing raw copy may come from other source content (A -> B -> A), so it is always rewritten
+                table.write_csv(raw_path, np.arange(table.n_rows), config.chunk_rows)
+            else:
+                # Save raw data in dataset-specific folder while building the cache
+                table = write_columnar_cache(
+                    dataset_path, cache_dir, SOURCE_SCHEMAS[self.dataset_name], source_hash,
+                    chunk_rows=config.chunk_rows, raw_copy_path=raw_path,
+                )
             logging.info(f"Raw data saved at {raw_path}")
 
-            # Split train test
-            train_set, test_set = train_test_split(df, test_size=0.2, random_state=42)
+            # Same permutation as train_test_split(df, test_size=0.2, random_state=42), computed
+            # from the row count alone
+            splitter = ShuffleSplit(n_splits=1, test_size=config.test_size, random_state=config.random_state)
+            train_index, test_index = next(splitter.split(np.empty((table.n_rows, 0))))
 
             # Save train and test sets in dataset-specific folder
-            train_set.to_csv(train_path, index=False, header=True)
-            test_set.to_csv(test_path, index=False, header=True)
+            table.write_csv(train_path, train_index, config.chunk_rows)
+            table.write_csv(test_path, test_index, config.chunk_rows)
+            self.write_split_manifest(manifest_path, source_hash, dataset_path, train_path, test_path, raw_path, table.n_rows)
 
             logging.info(f"Train data saved at {train_path}")
             logging.info(f"Test data saved at {test_path}")
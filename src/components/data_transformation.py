@@ -1,7 +1,12 @@
 from dataclasses import dataclass
 import sys
+import json
+import shutil
+import hashlib
 import numpy as np
 import pandas as pd
+import sklearn
+from numpy.lib.format import open_memmap
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
@@ -11,6 +16,7 @@ from src.exception import CustomException
 from src.logger import logging
 import os
 from src.utils import save_object
+from src.artifact_store import file_sha256
 
 @dataclass
 class DataTransformationConfig:
@@ -20,10 +26,144 @@ class DataTransformationConfig:
     wine_label_encoder_path = os.path.join('artifact', 'wine_label_encoder.pkl')
     water_preprocessor_ob_file_path = os.path.join('artifact', 'water_preprocessor.pkl')
     water_label_encoder_path = os.path.join('artifact', 'water_label_encoder.pkl')
+    # Transformed train/test arrays, one directory per (split content, preprocessor definition)
+    cache_dir = os.path.join('artifact', 'transform_cache')
+    cache_entries_kept = 3
+    chunk_rows = int(os.environ.get('TRANSFORM_CHUNK_ROWS', 100000))
+    # Compact mode: float32 features and small-integer labels kept as separate arrays
+    compact = os.environ.get('COMPACT_PIPELINE', '0') == '1'
+
+def transformation_cache_key(train_path, test_path, preprocessor, target_column, compact=False):
+    '''Hash of the split files, the unfitted preprocessor's full definition and the sklearn version'''
+    definition = {
+        'train_sha256': file_sha256(train_path),
+        'test_sha256': file_sha256(test_path),
+        'preprocessor': type(preprocessor).__name__,
+        'params': {key: repr(value) for key, value in sorted(preprocessor.get_params(deep=True).items())},
+        'target_column': target_column,
+        'compact': compact,
+        'sklearn': sklearn.__version__,
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+def _write_transformed(directory, split, preprocessor, features_df, labels, chunk_rows, compact=False):
+    '''
+    Transform features chunk by chunk straight into .npy files. By default one (n, n_features + 1)
+    float64 array with the labels as the last column, the layout np.c_ used to build in memory;
+    in compact mode float32 features in <split>_X.npy and labels in <split>_y.npy
+    '''
+    n_features = len(preprocessor.get_feature_names_out())
+    if compact:
+        features = open_memmap(os.path.join(directory, f"{split}_X.npy"), mode='w+',
+                               dtype=np.float32, shape=(len(features_df), n_features))
+        np.save(os.path.join(directory, f"{split}_y.npy"), labels)
+    else:
+        array = open_memmap(os.path.join(directory, f"{split}.npy"), mode='w+',
+                            dtype=np.float64, shape=(len(features_df), n_features + 1))
+        features = array[:, :-1]
+        array[:, -1] = labels
+    for start in range(0, len(features_df), chunk_rows):
+        stop = start + chunk_rows
+        features[start:stop] = preprocessor.transform(features_df.iloc[start:stop])
+    features.flush()
+    del features
+
+def _open_transformed(directory, split, compact=False):
+    '''Read-only memory maps of a cached split: one array, or (features, labels) in compact mode'''
+    if compact:
+        return (np.load(os.path.join(directory, f"{split}_X.npy"), mmap_mode='r'),
+                np.load(os.path.join(directory, f"{split}_y.npy"), mmap_mode='r'))
+    return np.load(os.path.join(directory, f"{split}.npy"), mmap_mode='r')
+
+def _publish_if_changed(source_path, target_path):
+    '''Copy a cached pickle over the artifact only when the bytes differ, keeping its mtime otherwise'''
+    if os.path.exists(target_path) and file_sha256(target_path) == file_sha256(source_path):
+        return
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+def _prune_cache(dataset_dir, keep):
+    entries = sorted(
+        (entry for entry in os.scandir(dataset_dir) if entry.is_dir() and not entry.name.endswith('.tmp')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True,
+    )
+    for entry in entries[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+def transform_with_cache(dataset_name, preprocessor, target_column, train_path, test_path,
+                         preprocessor_path, label_encoder_path, config, compact=False):
+    '''
+    Fit the preprocessor and label encoder on the train split and return (train_arr, test_arr,
+    preprocessor_path), with the label as the last column of each array, or in compact mode
+    ((X_train, y_train), (X_test, y_test), preprocessor_path). The arrays are read-only
+    memory-mapped .npy files cached under the hash of the split files and the preprocessor
+    definition; a rerun on the same inputs opens them without parsing the CSVs or refitting.
+    '''
+    key = transformation_cache_key(train_path, test_path, preprocessor, target_column, compact)
+    dataset_dir = os.path.join(config.cache_dir, dataset_name)
+    entry_dir = os.path.join(dataset_dir, key[:16])
+
+    if not os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+        train_df = pd.read_csv(train_path)
+        test_df = pd.read_csv(test_path)
+
+        train_df.columns = train_df.columns.str.strip()
+        test_df.columns = test_df.columns.str.strip()
+
+        logging.info(f"Train dataframe columns: {train_df.columns.tolist()}")
+        logging.info(f"Test dataframe columns: {test_df.columns.tolist()}")
+
+        input_feature_train_df = train_df.drop(columns=[target_column], axis=1)
+        target_feature_train_df = train_df[target_column]
+
+        input_feature_test_df = test_df.drop(columns=[target_column], axis=1)
+        target_feature_test_df = test_df[target_column]
+
+        label_encoder = LabelEncoder()
+        target_feature_train_df = label_encoder.fit_transform(target_feature_train_df)
+        target_feature_test_df = label_encoder.transform(target_feature_test_df)
+        if compact:
+            label_dtype = np.min_scalar_type(max(len(label_encoder.classes_) - 1, 0))
+            target_feature_train_df = target_feature_train_df.astype(label_dtype)
+            target_feature_test_df = target_feature_test_df.astype(label_dtype)
+
+        preprocessor.fit(input_feature_train_df)
+
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        _write_transformed(tmp_dir, 'train', preprocessor, input_feature_train_df,
+                           target_feature_train_df, config.chunk_rows, compact)
+        _write_transformed(tmp_dir, 'test', preprocessor, input_feature_test_df,
+                           target_feature_test_df, config.chunk_rows, compact)
+        save_object(file_path=os.path.join(tmp_dir, 'preprocessor.pkl'), obj=preprocessor)
+        save_object(file_path=os.path.join(tmp_dir, 'label_encoder.pkl'), obj=label_encoder)
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump({'key': key, 'train_path': train_path, 'test_path': test_path,
+                       'target_column': target_column, 'compact': compact}, f, indent=2)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        _prune_cache(dataset_dir, config.cache_entries_kept)
+        logging.info(f"Preprocessing completed")
+    else:
+        # Mark the entry as recently used for pruning
+        os.utime(entry_dir)
+        logging.info(f"Transformed {dataset_name} arrays reused from {entry_dir}")
+
+    _publish_if_changed(os.path.join(entry_dir, 'preprocessor.pkl'), preprocessor_path)
+    _publish_if_changed(os.path.join(entry_dir, 'label_encoder.pkl'), label_encoder_path)
+
+    train_arr = _open_transformed(entry_dir, 'train', compact)
+    test_arr = _open_transformed(entry_dir, 'test', compact)
+    return (train_arr, test_arr, preprocessor_path)
 
 class DataTransformation:
-    def __init__(self):
+    def __init__(self, compact=None):
         self.data_transformation_config = DataTransformationConfig()
+        self.compact = self.data_transformation_config.compact if compact is None else compact
     
     def get_data_transformer_object(self):
         ''' This function returns a data transformer object for milk dataset'''
@@ -46,56 +186,25 @@ class DataTransformation:
 
     def initiate_data_transformation(self, train_path, test_path):
         try:
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
-
-            train_df.columns = train_df.columns.str.strip()
-            test_df.columns = test_df.columns.str.strip()
-
-            logging.info(f"Train dataframe columns: {train_df.columns.tolist()}")
-            logging.info(f"Test dataframe columns: {test_df.columns.tolist()}")
-
-            preprocessor = self.get_data_transformer_object()
-            target_column = "Grade"
-
-            input_feature_train_df = train_df.drop(columns=[target_column], axis=1)
-            target_feature_train_df = train_df[target_column]
-
-            input_feature_test_df = test_df.drop(columns=[target_column], axis=1)
-            target_feature_test_df = test_df[target_column]
-
-            label_encoder = LabelEncoder()
-            target_feature_train_df = label_encoder.fit_transform(target_feature_train_df)
-            target_feature_test_df = label_encoder.transform(target_feature_test_df)
-
-            input_feature_train_arr = preprocessor.fit_transform(input_feature_train_df)
-            input_feature_test_arr = preprocessor.transform(input_feature_test_df)
-
-            train_arr = np.c_[
-                input_feature_train_arr, np.array(target_feature_train_df)
-            ]
-            test_arr = np.c_[
-                input_feature_test_arr, np.array(target_feature_test_df)
-            ]
-            logging.info(f"Preprocessing completed")
-
-            save_object(
-                file_path=self.data_transformation_config.milk_preprocessor_ob_file_path,
-                obj=preprocessor
+            return transform_with_cache(
+                dataset_name='milk',
+                preprocessor=self.get_data_transformer_object(),
+                target_column="Grade",
+                train_path=train_path,
+                test_path=test_path,
+                preprocessor_path=self.data_transformation_config.milk_preprocessor_ob_file_path,
+                label_encoder_path=self.data_transformation_config.milk_label_encoder_path,
+                config=self.data_transformation_config,
+                compact=self.compact,
             )
-            save_object(
-                file_path=self.data_transformation_config.milk_label_encoder_path,
-                obj=label_encoder
-            )
-
-            return (train_arr, test_arr, self.data_transformation_config.milk_preprocessor_ob_file_path)
 
         except Exception as e:
             raise CustomException(e, sys)
 
 class DataTransformationWine:
-    def __init__(self):
+    def __init__(self, compact=None):
         self.data_transformation_config = DataTransformationConfig()
+        self.compact = self.data_transformation_config.compact if compact is None else compact
     
     def get_data_transformer_object(self):
         ''' This function returns a data transformer object for wine dataset'''
@@ -118,56 +227,25 @@ class DataTransformationWine:
 
     def initiate_data_transformation(self, train_path, test_path):
         try:
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
-
-            train_df.columns = train_df.columns.str.strip()
-            test_df.columns = test_df.columns.str.strip()
-
-            logging.info(f"Train dataframe columns: {train_df.columns.tolist()}")
-            logging.info(f"Test dataframe columns: {test_df.columns.tolist()}")
-
-            preprocessor = self.get_data_transformer_object()
-            target_column = "quality"
-
-            input_feature_train_df = train_df.drop(columns=[target_column], axis=1)
-            target_feature_train_df = train_df[target_column]
-
-            input_feature_test_df = test_df.drop(columns=[target_column], axis=1)
-            target_feature_test_df = test_df[target_column]
-
-            label_encoder = LabelEncoder()
-            target_feature_train_df = label_encoder.fit_transform(target_feature_train_df)
-            target_feature_test_df = label_encoder.transform(target_feature_test_df)
-
-            input_feature_train_arr = preprocessor.fit_transform(input_feature_train_df)
-            input_feature_test_arr = preprocessor.transform(input_feature_test_df)
-
-            train_arr = np.c_[
-                input_feature_train_arr, np.array(target_feature_train_df)
-            ]
-            test_arr = np.c_[
-                input_feature_test_arr, np.array(target_feature_test_df)
-            ]
-            logging.info(f"Preprocessing completed")
-
-            save_object(
-                file_path=self.data_transformation_config.wine_preprocessor_ob_file_path,
-                obj=preprocessor
-            )
-            save_object(
-                file_path=self.data_transformation_config.wine_label_encoder_path,
-                obj=label_encoder
+            return transform_with_cache(
+                dataset_name='wine',
+                preprocessor=self.get_data_transformer_object(),
+                target_column="quality",
+                train_path=train_path,
+                test_path=test_path,
+                preprocessor_path=self.data_transformation_config.wine_preprocessor_ob_file_path,
+                label_encoder_path=self.data_transformation_config.wine_label_encoder_path,
+                config=self.data_transformation_config,
+                compact=self.compact,
             )
 
-            return (train_arr, test_arr, self.data_transformation_config.wine_preprocessor_ob_file_path)
-
         except Exception as e:
             raise CustomException(e, sys)
 
 class DataTransformationWater:
-    def __init__(self):
+    def __init__(self, compact=None):
         self.data_transformation_config = DataTransformationConfig()
+        self.compact = self.data_transformation_config.compact if compact is None else compact
     
     def get_data_transformer_object(self):
         ''' This function returns a data transformer object for water dataset'''
@@ -190,49 +268,17 @@ class DataTransformationWater:
 
     def initiate_data_transformation(self, train_path, test_path):
         try:
-            train_df = pd.read_csv(train_path)
-            test_df = pd.read_csv(test_path)
-
-            train_df.columns = train_df.columns.str.strip()
-            test_df.columns = test_df.columns.str.strip()
-
-            logging.info(f"Train dataframe columns: {train_df.columns.tolist()}")
-            logging.info(f"Test dataframe columns: {test_df.columns.tolist()}")
-
-            preprocessor = self.get_data_transformer_object()
-            target_column = "Potability"
-
-            input_feature_train_df = train_df.drop(columns=[target_column], axis=1)
-            target_feature_train_df = train_df[target_column]
-
-            input_feature_test_df = test_df.drop(columns=[target_column], axis=1)
-            target_feature_test_df = test_df[target_column]
-
-            label_encoder = LabelEncoder()
-            target_feature_train_df = label_encoder.fit_transform(target_feature_train_df)
-            target_feature_test_df = label_encoder.transform(target_feature_test_df)
-
-            input_feature_train_arr = preprocessor.fit_transform(input_feature_train_df)
-            input_feature_test_arr = preprocessor.transform(input_feature_test_df)
-
-            train_arr = np.c_[
-                input_feature_train_arr, np.array(target_feature_train_df)
-            ]
-            test_arr = np.c_[
-                input_feature_test_arr, np.array(target_feature_test_df)
-            ]
-            logging.info(f"Preprocessing completed")
-
-            save_object(
-                file_path=self.data_transformation_config.water_preprocessor_ob_file_path,
-                obj=preprocessor
+            return transform_with_cache(
+                dataset_name='water',
+                preprocessor=self.get_data_transformer_object(),
+                target_column="Potability",
+                train_path=train_path,
+                test_path=test_path,
+                preprocessor_path=self.data_transformation_config.water_preprocessor_ob_file_path,
+                label_encoder_path=self.data_transformation_config.water_label_encoder_path,
+                config=self.data_transformation_config,
+                compact=self.compact,
             )
-            save_object(
-                file_path=self.data_transformation_config.water_label_encoder_path,
-                obj=label_encoder
-            )
-
-            return (train_arr, test_arr, self.data_transformation_config.water_preprocessor_ob_file_path)
 
         except Exception as e:
             raise CustomException(e, sys)
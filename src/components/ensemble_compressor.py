@@ -0,0 +1,227 @@
+import os
+import sys
+import copy
+from dataclasses import dataclass
+import numpy as np
+from sklearn.tree._tree import Tree, TREE_LEAF, TREE_UNDEFINED
+from sklearn.tree import DecisionTreeClassifier, ExtraTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier
+
+from src.exception import CustomException
+from src.logger import logging
+from src.components.model_selection import SelectionPolicyConfig, measure_inference_cost
+
+FOREST_TYPES = (RandomForestClassifier, ExtraTreesClassifier)
+SINGLE_TREE_TYPES = (DecisionTreeClassifier, ExtraTreeClassifier)
+
+@dataclass
+class EnsembleCompressorConfig:
+    enabled: bool = os.environ.get('COMPRESSION', '1') == '1'
+    # Largest drop in held-out accuracy, against the uncompressed model, the compressed one may show
+    tolerance: float = float(os.environ.get('COMPRESSION_TOLERANCE', 0.005))
+    # Forests keep at least this many trees
+    min_trees: int = int(os.environ.get('COMPRESSION_MIN_TREES', 5))
+    # Try capping tree depth after choosing the trees
+    cap_depth: bool = os.environ.get('COMPRESSION_CAP_DEPTH', '1') == '1'
+    # Seed of the split of the held-out rows into a half that drives every choice and a half
+    # kept unseen for the reported accuracy
+    random_state: int = 42
+
+def node_depths(tree):
+    '''Depth of every node of a fitted sklearn Tree, found level by level'''
+    left, right = tree.children_left, tree.children_right
+    depths = np.zeros(tree.node_count, dtype=np.int64)
+    frontier, depth = np.array([0]), 0
+    while len(frontier):
+        depths[frontier] = depth
+        internal = frontier[left[frontier] != TREE_LEAF]
+        frontier = np.concatenate([left[internal], right[internal]])
+        depth += 1
+    return depths
+
+def truncate_tree(tree, max_depth, depths=None):
+    '''
+    Copy of a fitted sklearn Tree cut at max_depth: nodes at that depth become leaves holding the
+    class fractions sklearn already stores for every node, and the nodes below them are dropped
+    '''
+    state = tree.__getstate__()
+    depths = node_depths(tree) if depths is None else depths
+    keep = depths <= max_depth
+    new_index = np.cumsum(keep) - 1
+
+    nodes = state['nodes'][keep].copy()
+    internal = (nodes['left_child'] != TREE_LEAF) & (depths[keep] < max_depth)
+    nodes['left_child'] = np.where(internal, new_index[nodes['left_child']], TREE_LEAF)
+    nodes['right_child'] = np.where(internal, new_index[nodes['right_child']], TREE_LEAF)
+    nodes['feature'] = np.where(internal, nodes['feature'], TREE_UNDEFINED)
+    nodes['threshold'] = np.where(internal, nodes['threshold'], TREE_UNDEFINED)
+    nodes['missing_go_to_left'] = np.where(internal, nodes['missing_go_to_left'], 0)
+
+    truncated = Tree(tree.n_features, np.asarray(tree.n_classes, dtype=np.intp), tree.n_outputs)
+    truncated.__setstate__({
+        'max_depth': int(depths[keep].max()),
+        'node_count': int(keep.sum()),
+        'nodes': nodes,
+        'values': np.ascontiguousarray(state['values'][keep]),
+    })
+    return truncated
+
+def _cap_estimator(estimator, max_depth, depths=None):
+    capped = copy.copy(estimator)
+    capped.tree_ = truncate_tree(estimator.tree_, max_depth, depths)
+    capped.max_depth = max_depth
+    return capped
+
+def _trees(model):
+    if isinstance(model, FOREST_TYPES):
+        return list(model.estimators_)
+    if isinstance(model, SINGLE_TREE_TYPES):
+        return [model]
+    return [tree for stage in model.estimators_ for tree in stage]
+
+def describe(model):
+    '''Tree count, node count and deepest tree of a tree model'''
+    trees = _trees(model)
+    return {
+        'n_trees': len(trees),
+        'n_nodes': int(sum(tree.tree_.node_count for tree in trees)),
+        'max_depth': int(max(tree.tree_.max_depth for tree in trees)),
+    }
+
+class EnsembleCompressor:
+    '''
+    Shrinks a fitted tree model while its accuracy on one half of the held-out rows stays within
+    `tolerance` of the original's, and reports both models' accuracy on the other, unseen half:
+    - forests: greedy forward selection of trees, each step adding the tree that most improves
+      the accuracy of the averaged probabilities, until the target is reached
+    - gradient boosting: the shortest prefix of boosting stages that reaches the target
+    - forests and single trees: then the smallest depth cap that still reaches it
+    Other models are returned as None.
+    '''
+    def __init__(self, config=None):
+        self.config = config or EnsembleCompressorConfig()
+
+    def supports(self, model):
+        return isinstance(model, FOREST_TYPES + SINGLE_TREE_TYPES + (GradientBoostingClassifier,))
+
+    def _select_trees(self, model, X, y, select, meets):
+        '''Indices of the greedily chosen trees, in the forest's order'''
+        # Per-tree class probabilities, averaged by the forest exactly as predict_proba does
+        probabilities = np.stack([tree.predict_proba(X) for tree in model.estimators_])
+        y_index = np.searchsorted(model.classes_, y[select])
+        full_votes = probabilities[:, select].sum(axis=0).argmax(axis=1)
+
+        chosen, remaining = [], list(range(len(model.estimators_)))
+        total = np.zeros_like(probabilities[0])
+        while remaining:
+            predicted = (total[None, select] + probabilities[remaining][:, select]).argmax(axis=2)
+            accuracy = (predicted == y_index).mean(axis=1)
+            # Ties go to the tree that agrees more with the full forest
+            agreement = (predicted == full_votes).mean(axis=1)
+            best = int(np.lexsort((-agreement, -accuracy))[0])
+            total += probabilities[remaining[best]]
+            chosen.append(remaining.pop(best))
+            if len(chosen) >= self.config.min_trees and meets(model.classes_[total.argmax(axis=1)]):
+                break
+        return sorted(chosen)
+
+    def _subset_forest(self, model, indices):
+        compressed = copy.copy(model)
+        compressed.estimators_ = [model.estimators_[i] for i in indices]
+        compressed.n_estimators = len(indices)
+        for attribute in ('oob_score_', 'oob_decision_function_'):
+            # Out-of-bag estimates were computed with the full forest
+            compressed.__dict__.pop(attribute, None)
+        return compressed
+
+    def _truncate_boosting(self, model, X, meets):
+        n_stages = model.n_estimators_
+        for stage, prediction in enumerate(model.staged_predict(X), 1):
+            if meets(prediction):
+                n_stages = stage
+                break
+        compressed = copy.copy(model)
+        compressed.estimators_ = model.estimators_[:n_stages]
+        compressed.n_estimators_ = n_stages
+        compressed.n_estimators = n_stages
+        compressed.train_score_ = model.train_score_[:n_stages]
+        return compressed
+
+    def _cap_depth(self, model, X, meets):
+        '''The model with the smallest depth cap that still reaches the target, or the model itself'''
+        trees = _trees(model)
+        depths = [node_depths(tree.tree_) for tree in trees]
+        for max_depth in range(1, describe(model)['max_depth']):
+            capped_trees = [_cap_estimator(tree, max_depth, tree_depths) for tree, tree_depths in zip(trees, depths)]
+            if isinstance(model, FOREST_TYPES):
+                capped = copy.copy(model)
+                capped.estimators_ = capped_trees
+                capped.max_depth = max_depth
+            else:
+                capped = capped_trees[0]
+            if meets(capped.predict(X)):
+                return capped
+        return model
+
+    def compress(self, model, X_val, y_val):
+        '''(compressed model, report) or (None, report) when it is unsupported or nothing could be cut'''
+        try:
+            if not self.supports(model):
+                return None, {'skipped': f"{type(model).__name__} is not a tree model"}
+            X_val = np.asarray(X_val, dtype=np.float32)
+            y_val = np.asarray(y_val)
+            # Every choice and acceptance uses the select half only; the unseen half is kept out of
+            # them so the accuracy reported on it is not biased by the selection
+            order = np.random.RandomState(self.config.random_state).permutation(len(y_val))
+            select, unseen = np.sort(order[::2]), np.sort(order[1::2])
+            target = float((model.predict(X_val[select]) == y_val[select]).mean()) - self.config.tolerance
+
+            def meets(predictions):
+                return (predictions[select] == y_val[select]).mean() >= target
+
+            if isinstance(model, FOREST_TYPES):
+                compressed = self._subset_forest(model, self._select_trees(model, X_val, y_val, select, meets))
+            elif isinstance(model, GradientBoostingClassifier):
+                compressed = self._truncate_boosting(model, X_val, meets)
+            else:
+                compressed = model
+            if self.config.cap_depth and not isinstance(model, GradientBoostingClassifier):
+                compressed = self._cap_depth(compressed, X_val, meets)
+
+            before, after = describe(model), describe(compressed)
+            if after['n_nodes'] >= before['n_nodes']:
+                return None, {'skipped': "no tree or depth could be cut within the tolerance", 'original': before}
+
+            report = {'tolerance': self.config.tolerance, 'selection_rows': len(select), 'unseen_rows': len(unseen)}
+            selection_config = SelectionPolicyConfig()
+            for name, variant, shape in (('original', model, before), ('compressed', compressed, after)):
+                predictions = variant.predict(X_val)
+                report[name] = {
+                    **shape,
+                    # Optimistic for the compressed model: these rows chose its trees
+                    'selection_accuracy': float((predictions[select] == y_val[select]).mean()),
+                    # Held-out rows no compression step has seen
+                    'unseen_accuracy': float((predictions[unseen] == y_val[unseen]).mean()),
+                    **measure_inference_cost(
+                        variant, X_val, selection_config.latency_iterations, selection_config.batch_rows
+                    ),
+                }
+            original, result = report['original'], report['compressed']
+            report['unseen_within_tolerance'] = (
+                result['unseen_accuracy'] >= original['unseen_accuracy'] - self.config.tolerance
+            )
+            if not report['unseen_within_tolerance']:
+                logging.warning(
+                    f"Compressed {type(model).__name__} loses more than {self.config.tolerance} accuracy on the unseen "
+                    f"held-out rows; check before serving it with MODEL_VARIANT=compressed"
+                )
+            logging.info(
+                f"Compressed {type(model).__name__}: {original['n_trees']} -> {result['n_trees']} trees, "
+                f"{original['n_nodes']} -> {result['n_nodes']} nodes, depth {original['max_depth']} -> {result['max_depth']}, "
+                f"{original['serialized_mb']:.2f} -> {result['serialized_mb']:.2f} MB, "
+                f"p99 {original['single_row_p99_us']:.0f} -> {result['single_row_p99_us']:.0f} us, "
+                f"accuracy on {len(unseen)} unseen held-out rows {original['unseen_accuracy']:.4f} -> {result['unseen_accuracy']:.4f}"
+            )
+            return compressed, report
+        except Exception as e:
+            raise CustomException(e, sys)
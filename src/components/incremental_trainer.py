@@ -0,0 +1,323 @@
+import os
+import sys
+import time
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import dill
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+from catboost import CatBoostClassifier
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import save_object, artifact_version, model_variant_path
+from src.artifact_store import bundle_path_for, save_artifact_bundle
+from src.components.data_ingestion import DataIngestionConfig
+from src.components.data_transformation import DataTransformationConfig
+from src.components.model_trainer import ModelTrainerConfig
+
+TARGET_COLUMNS = {'milk': 'Grade', 'wine': 'quality', 'water': 'Potability'}
+
+@dataclass
+class IncrementalTrainerConfig:
+    state_dir: str = os.path.join('artifact', 'incremental')
+    # Raw labeled rows kept (reservoir sampled) for the imputer medians and for replay
+    reservoir_size: int = int(os.environ.get('INCREMENTAL_RESERVOIR_SIZE', 5000))
+    # Past rows mixed into every update so each class is present and the model does not drift
+    replay_size: int = int(os.environ.get('INCREMENTAL_REPLAY_SIZE', 500))
+    # Trees grown per update by forests; the oldest are dropped beyond max_trees
+    new_trees: int = int(os.environ.get('INCREMENTAL_NEW_TREES', 10))
+    max_trees: int = int(os.environ.get('INCREMENTAL_MAX_TREES', 300))
+    # Boosting rounds appended per update by GradientBoosting and CatBoost; stages cannot be
+    # dropped like old trees, so past max_stages updates are skipped until a full retrain
+    boosting_rounds: int = int(os.environ.get('INCREMENTAL_BOOSTING_ROUNDS', 20))
+    max_stages: int = int(os.environ.get('INCREMENTAL_MAX_STAGES', 500))
+    # SGD settings for linear models
+    learning_rate: float = float(os.environ.get('INCREMENTAL_LEARNING_RATE', 0.01))
+    epochs: int = int(os.environ.get('INCREMENTAL_EPOCHS', 5))
+    random_state: int = 42
+
+class ReservoirSample:
+    '''Uniform sample of at most `size` labeled rows out of every row seen so far (algorithm R)'''
+    def __init__(self, size, n_features, random_state=42):
+        self.size = size
+        self.rows = np.empty((0, n_features))
+        self.labels = np.empty(0)
+        self.n_seen = 0
+        self.rng = np.random.RandomState(random_state)
+
+    def add(self, X, y):
+        free = max(self.size - len(self.rows), 0)
+        self.rows = np.vstack([self.rows, X[:free]])
+        self.labels = np.concatenate([self.labels, y[:free]])
+        self.n_seen += min(free, len(X))
+        for row, label in zip(X[free:], y[free:]):
+            self.n_seen += 1
+            slot = self.rng.randint(self.n_seen)
+            if slot < self.size:
+                self.rows[slot] = row
+                self.labels[slot] = label
+
+    def medians(self):
+        return np.nanmedian(self.rows, axis=0)
+
+    def sample(self, n):
+        index = self.rng.choice(len(self.rows), size=min(n, len(self.rows)), replace=False)
+        return self.rows[index], self.labels[index]
+
+def _scaler_stats(scaler):
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.with_mean and scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std and scaler.scale_ is not None else np.ones(n_features)
+    return np.array(mean, dtype=np.float64), np.array(scale, dtype=np.float64)
+
+def _trees_of(model):
+    if isinstance(model, DecisionTreeClassifier):
+        return [model]
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        return list(model.estimators_)
+    if isinstance(model, GradientBoostingClassifier):
+        return list(model.estimators_.ravel())
+    return None
+
+def remap_to_scaler(model, old_stats, new_stats):
+    '''
+    Re-express a fitted model in the coordinates of an updated StandardScaler so it makes the
+    same decisions on raw inputs: tree thresholds and linear weights are moved through the
+    per-feature affine change. Returns False for model types that cannot be remapped.
+    '''
+    old_mean, old_scale = old_stats
+    new_mean, new_scale = new_stats
+    if isinstance(model, (LogisticRegression, SGDClassifier)):
+        coef = np.asarray(model.coef_)
+        model.intercept_ = np.asarray(model.intercept_) + (coef * (new_mean - old_mean) / old_scale).sum(axis=1)
+        model.coef_ = coef * new_scale / old_scale
+        return True
+    trees = _trees_of(model)
+    if trees is None:
+        return False
+    for estimator in trees:
+        feature = estimator.tree_.feature
+        threshold = estimator.tree_.threshold
+        split = feature >= 0
+        f = feature[split]
+        threshold[split] = (old_mean[f] + threshold[split] * old_scale[f] - new_mean[f]) / new_scale[f]
+    return True
+
+class IncrementalModelTrainer:
+    '''
+    Folds small batches of newly labeled rows into the served artifacts without a full retrain:
+    the imputer medians come from a reservoir sample of every row seen, the scaler statistics
+    are updated with partial_fit (the model is remapped to the new scaling), and the model is
+    continued: SGD steps for linear models, extra trees for forests, extra boosting rounds for
+    GradientBoosting and CatBoost. The result is published atomically over the artifact files.
+    '''
+    def __init__(self, dataset_name='milk', config=None):
+        self.dataset_name = dataset_name.lower()
+        if self.dataset_name not in TARGET_COLUMNS:
+            raise CustomException(f"Unsupported dataset: {self.dataset_name}", sys)
+        self.config = config or IncrementalTrainerConfig()
+        self.target_column = TARGET_COLUMNS[self.dataset_name]
+        self.model_path = getattr(ModelTrainerConfig(), f"{self.dataset_name}_trained_model_file_path")
+        transformation_config = DataTransformationConfig()
+        self.preprocessor_path = getattr(transformation_config, f"{self.dataset_name}_preprocessor_ob_file_path")
+        self.label_encoder_path = getattr(transformation_config, f"{self.dataset_name}_label_encoder_path")
+        self.train_data_path = getattr(DataIngestionConfig(), f"{self.dataset_name}_train_data_path")
+        self.state_path = os.path.join(self.config.state_dir, f"{self.dataset_name}_state.pkl")
+
+    @staticmethod
+    def _load_pickle(file_path):
+        # Read the pickle itself: bundles are memory-mapped read-only and these objects get modified
+        with open(file_path, 'rb') as f:
+            return dill.load(f)
+
+    def _numeric_block(self, preprocessor):
+        if len(preprocessor.transformers_) != 1 and not all(
+                transformer == 'drop' for _, transformer, _ in preprocessor.transformers_[1:]):
+            raise ValueError("Only single-block preprocessors can be updated incrementally")
+        _, pipeline, columns = preprocessor.transformers_[0]
+        columns = list(columns)
+        steps = dict(pipeline.steps) if isinstance(pipeline, Pipeline) else {}
+        imputer = next((step for step in steps.values() if isinstance(step, SimpleImputer)), None)
+        poly = next((step for step in steps.values() if isinstance(step, PolynomialFeatures)), None)
+        scaler = next((step for step in steps.values() if isinstance(step, StandardScaler)), None)
+        if imputer is None or scaler is None or imputer.strategy != 'median':
+            raise ValueError("Expected a median SimpleImputer followed by a StandardScaler")
+        return pipeline, columns, imputer, poly, scaler
+
+    def _features_and_labels(self, df, columns, label_encoder):
+        df = df.rename(columns=lambda column: str(column).strip())
+        missing = [column for column in columns + [self.target_column] if column not in df.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+        X = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        y = label_encoder.transform(df[self.target_column]).astype(np.float64)
+        return X, y
+
+    def _load_state(self, versions, columns, label_encoder):
+        '''Reservoir of past rows, rebuilt from the training split whenever the artifacts were retrained'''
+        if os.path.exists(self.state_path):
+            state = self._load_pickle(self.state_path)
+            if state['artifact_version'] == versions:
+                return state
+            logging.info(f"Artifacts of {self.dataset_name} changed outside incremental updates; rebuilding state")
+        reservoir = ReservoirSample(self.config.reservoir_size, len(columns), self.config.random_state)
+        X, y = self._features_and_labels(pd.read_csv(self.train_data_path), columns, label_encoder)
+        reservoir.add(X, y)
+        return {'artifact_version': versions, 'reservoir': reservoir, 'updates': 0}
+
+    def _update_model(self, model, X, y, X_replay, y_replay, n_seen):
+        '''Continue training the model; returns (possibly new) model and the strategy used'''
+        X_blend = np.vstack([X, X_replay])
+        y_blend = np.concatenate([y, y_replay])
+        classes = model.classes_
+        covers_classes = np.isin(classes, y_blend).all()
+
+        if isinstance(model, LogisticRegression):
+            # LogisticRegression has no partial_fit; carry its weights over to an SGD model with the
+            # same loss and penalty (one-vs-rest, so only exact for binary problems)
+            sgd = SGDClassifier(
+                loss='log_loss', alpha=1.0 / (model.C * n_seen),
+                learning_rate='constant', eta0=self.config.learning_rate,
+                random_state=self.config.random_state,
+            )
+            sgd.coef_ = np.array(model.coef_, dtype=np.float64)
+            sgd.intercept_ = np.array(model.intercept_, dtype=np.float64)
+            model = sgd
+
+        if isinstance(model, SGDClassifier):
+            for _ in range(self.config.epochs):
+                model.partial_fit(X_blend, y_blend, classes=classes)
+            return model, 'sgd_partial_fit'
+
+        if not covers_classes:
+            logging.warning(f"Batch and replay sample miss some classes of {type(model).__name__}; model left unchanged")
+            return model, 'skipped_missing_classes'
+
+        if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            model.set_params(warm_start=True, n_estimators=len(model.estimators_) + self.config.new_trees)
+            model.fit(X_blend, y_blend)
+            excess = len(model.estimators_) - self.config.max_trees
+            if excess > 0:
+                # Forget the oldest trees so the forest tracks recent data and stays bounded
+                del model.estimators_[:excess]
+            model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+            return model, 'warm_start_trees'
+
+        if isinstance(model, (GradientBoostingClassifier, CatBoostClassifier)):
+            stages = model.n_estimators_ if isinstance(model, GradientBoostingClassifier) else model.tree_count_
+            if stages + self.config.boosting_rounds > self.config.max_stages:
+                logging.warning(
+                    f"{type(model).__name__} has {stages} boosting stages; {self.config.boosting_rounds} more would pass "
+                    f"INCREMENTAL_MAX_STAGES={self.config.max_stages}. Model left unchanged, a full retrain is needed"
+                )
+                return model, 'skipped_max_stages'
+
+        if isinstance(model, GradientBoostingClassifier):
+            model.set_params(warm_start=True, n_estimators=model.n_estimators_ + self.config.boosting_rounds)
+            model.fit(X_blend, y_blend)
+            model.set_params(warm_start=False)
+            return model, 'warm_start_boosting'
+
+        if isinstance(model, CatBoostClassifier):
+            params = model.get_params()
+            params['iterations'] = self.config.boosting_rounds
+            continued = CatBoostClassifier(**params)
+            continued.fit(X_blend, y_blend, init_model=model)
+            return continued, 'catboost_init_model'
+
+        raise ValueError(f"{type(model).__name__} has no incremental update path; run a full retrain")
+
+    def _publish(self, file_path, obj):
+        '''Replace an artifact atomically so readers see either the old or the new file'''
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        save_object(file_path=tmp_path, obj=obj)
+        os.replace(tmp_path, file_path)
+        bundle_path = bundle_path_for(file_path)
+        if os.path.isdir(bundle_path):
+            save_artifact_bundle(bundle_path, obj, source_path=file_path)
+
+    def update(self, new_data):
+        '''
+        new_data: DataFrame (or list of dicts) with the feature columns and the target column
+        Returns a dict describing the update, with the batch accuracy before and after it
+        '''
+        try:
+            start = time.perf_counter()
+            new_df = new_data if isinstance(new_data, pd.DataFrame) else pd.DataFrame(new_data)
+            model = self._load_pickle(self.model_path)
+            preprocessor = self._load_pickle(self.preprocessor_path)
+            label_encoder = self._load_pickle(self.label_encoder_path)
+            pipeline, columns, imputer, poly, scaler = self._numeric_block(preprocessor)
+
+            versions = artifact_version([self.model_path, self.preprocessor_path])
+            state = self._load_state(versions, columns, label_encoder)
+            X_raw, y = self._features_and_labels(new_df, columns, label_encoder)
+            if len(y) == 0:
+                raise ValueError("No rows to learn from")
+
+            def transform(X):
+                # The block pipeline is the whole output; other fitted columns (wine's Id) are dropped
+                return pipeline.transform(pd.DataFrame(X, columns=columns))
+
+            accuracy_before = float((model.predict(transform(X_raw)) == y).mean())
+
+            reservoir = state['reservoir']
+            reservoir.add(X_raw, y)
+            medians = reservoir.medians()
+            imputer.statistics_ = np.where(np.isnan(medians), imputer.statistics_, medians)
+
+            # Scaler statistics can only move if the model can follow them to the new scaling
+            old_stats = _scaler_stats(scaler)
+            unscaled = imputer.transform(pd.DataFrame(X_raw, columns=imputer.feature_names_in_))
+            if poly is not None:
+                unscaled = poly.transform(unscaled)
+            candidate_scaler = dill.copy(scaler).partial_fit(unscaled)
+            scaler_updated = remap_to_scaler(model, old_stats, _scaler_stats(candidate_scaler))
+            if scaler_updated:
+                for attribute in ('mean_', 'var_', 'scale_', 'n_samples_seen_'):
+                    setattr(scaler, attribute, getattr(candidate_scaler, attribute))
+
+            X_replay, y_replay = reservoir.sample(self.config.replay_size)
+            model, strategy = self._update_model(model, transform(X_raw), y, transform(X_replay), y_replay, reservoir.n_seen)
+            accuracy_after = float((model.predict(transform(X_raw)) == y).mean())
+
+            # The compressed variant was cut from the previous model and cannot follow the new scaling
+            compressed_path = model_variant_path(self.model_path, 'compressed')
+            if os.path.exists(compressed_path):
+                os.remove(compressed_path)
+            # Preprocessor first: a reader that loads in between gets a model remapped to the old
+            # scaling for one check interval at most, as the version changes again with the model
+            self._publish(self.preprocessor_path, preprocessor)
+            self._publish(self.model_path, model)
+            state['artifact_version'] = artifact_version([self.model_path, self.preprocessor_path])
+            state['updates'] += 1
+            os.makedirs(self.config.state_dir, exist_ok=True)
+            self._publish(self.state_path, state)
+
+            elapsed = time.perf_counter() - start
+            logging.info(
+                f"Incremental update of {self.dataset_name} with {len(y)} rows ({strategy}) published "
+                f"version {state['artifact_version']} in {elapsed:.2f}s"
+            )
+            return {
+                'dataset': self.dataset_name,
+                'n_rows': int(len(y)),
+                'model': type(model).__name__,
+                'strategy': strategy,
+                'retrain_required': strategy == 'skipped_max_stages',
+                'scaler_updated': scaler_updated,
+                'batch_accuracy_before': accuracy_before,
+                'batch_accuracy_after': accuracy_after,
+                'rows_seen': int(reservoir.n_seen),
+                'updates': state['updates'],
+                'artifact_version': state['artifact_version'],
+                'elapsed_seconds': elapsed,
+            }
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+import dill
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.compiled_preprocessor import model_input_dtype
+from src.pipeline.tree_engine import compile_model
+
+def _optional_float(name):
+    value = os.environ.get(name, '')
+    return float(value) if value else None
+
+@dataclass
+class SelectionPolicyConfig:
+    # Budgets of the selected model; unset means unlimited
+    max_p99_us: float = _optional_float('SELECTION_MAX_P99_US')
+    max_size_mb: float = _optional_float('SELECTION_MAX_SIZE_MB')
+    max_resident_mb: float = _optional_float('SELECTION_MAX_RESIDENT_MB')
+    # Any model within this CV score of the best admitted one may be picked; the fastest of them wins
+    score_tolerance: float = float(os.environ.get('SELECTION_SCORE_TOLERANCE', 0.0))
+    # Single-row predictions timed per model, and the rows of the batch measurement
+    latency_iterations: int = int(os.environ.get('SELECTION_LATENCY_ITERATIONS', 500))
+    batch_rows: int = int(os.environ.get('SELECTION_BATCH_ROWS', 1024))
+
+@dataclass
+class SelectionPolicy:
+    '''
+    Picks the model with the best CV score among those within every budget; with a score
+    tolerance, the lowest single-row p99 among the models that close to the best. Without
+    budgets this is the plain best-CV-score choice.
+    '''
+    max_p99_us: float = None
+    max_size_mb: float = None
+    max_resident_mb: float = None
+    score_tolerance: float = 0.0
+
+    @classmethod
+    def from_config(cls, config=None):
+        config = config or SelectionPolicyConfig()
+        return cls(config.max_p99_us, config.max_size_mb, config.max_resident_mb, config.score_tolerance)
+
+    def violations(self, profile):
+        '''Budgets the profiled model exceeds, as readable strings'''
+        checks = [
+            ('p99', profile['single_row_p99_us'], self.max_p99_us, 'us'),
+            ('size', profile['serialized_mb'], self.max_size_mb, 'MB'),
+            ('resident', profile['resident_mb'], self.max_resident_mb, 'MB'),
+        ]
+        return [
+            f"{name} {value:.1f} {unit} > {limit:g} {unit}"
+            for name, value, limit, unit in checks
+            if limit is not None and value > limit
+        ]
+
+    def select(self, profiles):
+        '''(name, within budget) of the chosen model; falls back to the fastest when none fits'''
+        admitted = {name: profile for name, profile in profiles.items() if not self.violations(profile)}
+        if not admitted:
+            return min(profiles, key=lambda name: profiles[name]['single_row_p99_us']), False
+        best_score = max(profile['cv_score'] for profile in admitted.values())
+        close = [name for name, profile in admitted.items() if profile['cv_score'] >= best_score - self.score_tolerance]
+        # Without a tolerance these are the models tied on the best score
+        return min(close, key=lambda name: admitted[name]['single_row_p99_us']), True
+
+def _resident_bytes(blob):
+    '''Python-heap bytes held by the model once unpickled (numpy buffers included)'''
+    tracemalloc.start()
+    try:
+        model = dill.loads(blob)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del model
+    return current
+
+def measure_inference_cost(model, X, latency_iterations=500, batch_rows=1024):
+    '''
+    Serving cost of a fitted model on the rows of X, through the same path as the predictors:
+    float32 input for tree models and the compiled tree engine where it applies
+    - single_row_p50_us / single_row_p99_us: predict() on one row at a time
+    - batch_us_per_row: best of three predict() calls on batch_rows rows
+    - serialized_mb: the pickle written to artifact/
+    - resident_mb: memory the loaded model holds, plus its compiled arrays
+    '''
+    try:
+        X = np.asarray(X, dtype=model_input_dtype(model))
+        compiled = compile_model(model)
+        served = compiled or model
+
+        rows = [X[i:i + 1] for i in range(min(len(X), latency_iterations))]
+        for row in rows[:20]:
+            served.predict(row)
+        timings = np.empty(latency_iterations)
+        for i in range(latency_iterations):
+            row = rows[i % len(rows)]
+            start = time.perf_counter()
+            served.predict(row)
+            timings[i] = time.perf_counter() - start
+        p50, p99 = np.percentile(timings * 1e6, [50, 99])
+
+        batch = np.resize(X, (batch_rows, X.shape[1]))
+        batch_seconds = np.inf
+        for _ in range(3):
+            start = time.perf_counter()
+            served.predict(batch)
+            batch_seconds = min(batch_seconds, time.perf_counter() - start)
+
+        blob = dill.dumps(model)
+        # Native allocations (CatBoost's C++ model) are invisible to tracemalloc; the pickle
+        # holds at least the same parameters, so it bounds the resident size from below
+        resident = max(_resident_bytes(blob), len(blob)) + (compiled.nbytes if compiled is not None else 0)
+        return {
+            'single_row_p50_us': float(p50),
+            'single_row_p99_us': float(p99),
+            'batch_us_per_row': float(batch_seconds * 1e6 / batch_rows),
+            'serialized_mb': len(blob) / 1e6,
+            'resident_mb': resident / 1e6,
+            'tree_engine': compiled is not None,
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def pareto_front(profiles):
+    '''Names of the models no other model beats on CV score without also being slower at p99'''
+    front = []
+    for name, profile in profiles.items():
+        dominated = any(
+            other['cv_score'] >= profile['cv_score']
+            and other['single_row_p99_us'] <= profile['single_row_p99_us']
+            and (other['cv_score'] > profile['cv_score'] or other['single_row_p99_us'] < profile['single_row_p99_us'])
+            for other_name, other in profiles.items() if other_name != name
+        )
+        if not dominated:
+            front.append(name)
+    return sorted(front, key=lambda name: profiles[name]['single_row_p99_us'])
+
+def select_model(results, X, policy, config=None):
+    '''
+    Profile every successfully searched candidate and apply the policy; returns the chosen
+    result and the selection report for the trainer's metrics
+    '''
+    config = config or SelectionPolicyConfig()
+    profiles = {}
+    for result in results:
+        if result['estimator'] is None:
+            continue
+        profile = measure_inference_cost(result['estimator'], X, config.latency_iterations, config.batch_rows)
+        profile['cv_score'] = float(result['cv_score'])
+        profiles[result['name']] = profile
+        logging.info(
+            f"Serving cost of {result['name']}: p50 {profile['single_row_p50_us']:.0f} us, "
+            f"p99 {profile['single_row_p99_us']:.0f} us, batch {profile['batch_us_per_row']:.2f} us/row, "
+            f"{profile['serialized_mb']:.2f} MB pickled, {profile['resident_mb']:.2f} MB resident"
+        )
+    if not profiles:
+        return None, {}
+
+    name, within_budget = policy.select(profiles)
+    for profile in profiles.values():
+        profile['budget_violations'] = policy.violations(profile)
+    if not within_budget:
+        logging.warning(f"No model fits the selection budgets; falling back to the fastest, {name}")
+    chosen = next(result for result in results if result['name'] == name)
+    return chosen, {
+        'policy': asdict(policy),
+        'selected': name,
+        'within_budget': within_budget,
+        'pareto_front': pareto_front(profiles),
+        'candidates': profiles,
+    }
@@ -8,360 +8,214 @@ from sklearn.svm import SVC
 from sklearn.neighbors import KNeighborsClassifier
 from catboost import CatBoostClassifier
 from xgboost import XGBClassifier
-from sklearn.model_selection import GridSearchCV, cross_val_score
 from sklearn.metrics import accuracy_score, confusion_matrix, classification_report, f1_score
 from src.exception import CustomException
 from src.logger import logging
-from src.utils import save_object
+from src.utils import save_object, model_variant_path
+from src.components.search_scheduler import SearchScheduler, SearchCandidate, SearchSchedulerConfig
+from src.components.training_cache import TrainingCache, TrainingCacheConfig
+from src.components.model_selection import SelectionPolicy, SelectionPolicyConfig, select_model
+from src.components.ensemble_compressor import EnsembleCompressor, EnsembleCompressorConfig
 
 @dataclass
 class ModelTrainerConfig:
     milk_trained_model_file_path = os.path.join("artifact","milk_model.pkl")
     wine_trained_model_file_path = os.path.join("artifact","wine_model.pkl")
     water_trained_model_file_path = os.path.join("artifact","water_model.pkl")
+    search_workers: int = SearchSchedulerConfig().n_workers
+    # 'grid' or 'halving'; SEARCH_MODE_MILK / _WINE / _WATER override it for one dataset
+    search_mode: str = os.environ.get('SEARCH_MODE', 'grid')
+
+# Hyper-parameter grids searched for each candidate; candidates without a grid are cross-validated as is
+PARAM_GRIDS = {
+    "LogisticRegression": {
+        'C': [0.01, 0.1, 1, 10],
+        'solver': ['lbfgs', 'liblinear']
+    },
+    "RandomForestClassifier": {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 10, 20, 30]
+    },
+    "ExtraTreesClassifier": {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 10, 20, 30]
+    },
+    "GradientBoostingClassifier": {
+        'n_estimators': [100, 200],
+        'learning_rate': [0.05, 0.1],
+        'max_depth': [3, 5]
+    },
+    "AdaBoostClassifier": {
+        'n_estimators': [50, 100, 200],
+        'learning_rate': [0.05, 0.1, 0.5]
+    },
+    "SVC": {
+        'C': [0.1, 1, 10],
+        'kernel': ['linear', 'rbf'],
+        'gamma': ['scale', 'auto']
+    },
+    "CatBoostClassifier": {
+        'iterations': [100, 200, 300],
+        'depth': [4, 6, 8],
+        'learning_rate': [0.01, 0.05, 0.1],
+        'l2_leaf_reg': [1, 3, 5]
+    }
+}
+
+# In halving mode the boosted models grow their number of boosting rounds instead of the sample count
+HALVING_RESOURCES = {
+    "GradientBoostingClassifier": 'n_estimators',
+    "AdaBoostClassifier": 'n_estimators',
+    "CatBoostClassifier": 'iterations',
+}
 
 class ModelTrainer:
-    def __init__(self, dataset_name='milk', max_iter=10, target_accuracy=0.85):
+    def __init__(self, dataset_name='milk', max_iter=10, target_accuracy=0.85, n_workers=None, search_mode=None,
+                 training_cache=None, selection_policy=None, compressor=None):
         self.dataset_name = dataset_name.lower()
         self.model_trainer_config = ModelTrainerConfig()
         self.max_iter = max_iter
         self.target_accuracy = target_accuracy
+        self.n_workers = self.model_trainer_config.search_workers if n_workers is None else n_workers
+        self.search_mode = search_mode or os.environ.get(
+            f"SEARCH_MODE_{self.dataset_name.upper()}", self.model_trainer_config.search_mode
+        )
+        if training_cache is None and TrainingCacheConfig().enabled:
+            training_cache = TrainingCache()
+        self.training_cache = training_cache
+        self.selection_config = SelectionPolicyConfig()
+        self.selection_policy = selection_policy or SelectionPolicy.from_config(self.selection_config)
+        if compressor is None and EnsembleCompressorConfig().enabled:
+            compressor = EnsembleCompressor()
+        self.compressor = compressor
+
+    def get_models(self):
+        '''Candidate models for the dataset; wine classes are imbalanced, so weight them'''
+        class_weight = 'balanced' if self.dataset_name == 'wine' else None
+        return {
+            "LogisticRegression": LogisticRegression(max_iter=1000, class_weight=class_weight),
+            "DecisionTreeClassifier": DecisionTreeClassifier(),
+            "RandomForestClassifier": RandomForestClassifier(class_weight=class_weight),
+            "ExtraTreesClassifier": ExtraTreesClassifier(class_weight=class_weight),
+            "SVC": SVC(probability=True, class_weight=class_weight),
+            "KNeighborsClassifier": KNeighborsClassifier(),
+            "GradientBoostingClassifier": GradientBoostingClassifier(),
+            "AdaBoostClassifier": AdaBoostClassifier(),
+            "CatBoostClassifier": CatBoostClassifier(verbose=0)
+        }
+
+    def get_model_path(self):
+        if self.dataset_name == 'wine':
+            return self.model_trainer_config.wine_trained_model_file_path
+        if self.dataset_name == 'water':
+            return self.model_trainer_config.water_trained_model_file_path
+        return self.model_trainer_config.milk_trained_model_file_path
+
+    def search_models(self, X_train, y_train, model_names=None):
+        '''
+        Cross-validate every candidate (or only those in model_names) in one shared worker pool;
+        returns the per-candidate results
+        '''
+        candidates = [
+            SearchCandidate(
+                model_name, model, PARAM_GRIDS[model_name], cv=3,
+                resource=HALVING_RESOURCES.get(model_name, 'n_samples')
+            ) if model_name in PARAM_GRIDS
+            else SearchCandidate(model_name, model, None, cv=5)
+            for model_name, model in self.get_models().items()
+            if model_names is None or model_name in model_names
+        ]
+        scheduler = SearchScheduler(
+            n_workers=self.n_workers, scoring='accuracy', mode=self.search_mode, cache=self.training_cache
+        )
+        results, search_wall = scheduler.run(candidates, X_train, y_train)
+        return results, search_wall
 
     def initiate_model_trainer(self, train_array, test_array):
+        '''train_array/test_array: features with the label as last column, or (features, labels) tuples'''
         try:
             logging.info("Split training and test input data")
-            X_train, y_train, X_test, y_test = (
-                train_array[:,:-1],
-                train_array[:,-1],
-                test_array[:,:-1],
-                test_array[:,-1],
-            )
-
-            if self.dataset_name == 'wine':
-                models = {
-                    "LogisticRegression": LogisticRegression(max_iter=1000, class_weight='balanced'),
-                    "DecisionTreeClassifier": DecisionTreeClassifier(),
-                    "RandomForestClassifier": RandomForestClassifier(class_weight='balanced'),
-                    "ExtraTreesClassifier": ExtraTreesClassifier(class_weight='balanced'),
-                    "SVC": SVC(probability=True, class_weight='balanced'),
-                    "KNeighborsClassifier": KNeighborsClassifier(),
-                    "GradientBoostingClassifier": GradientBoostingClassifier(),
-                    "AdaBoostClassifier": AdaBoostClassifier(),
-                    "CatBoostClassifier": CatBoostClassifier(verbose=0)
-                }
-
-                param_grids = {
-                    "LogisticRegression": {
-                        'C': [0.01, 0.1, 1, 10],
-                        'solver': ['lbfgs', 'liblinear']
-                    },
-                    "RandomForestClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "ExtraTreesClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "GradientBoostingClassifier": {
-                        'n_estimators': [100, 200],
-                        'learning_rate': [0.05, 0.1],
-                        'max_depth': [3, 5]
-                    },
-                    "AdaBoostClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'learning_rate': [0.05, 0.1, 0.5]
-                    },
-                    "SVC": {
-                        'C': [0.1, 1, 10],
-                        'kernel': ['linear', 'rbf'],
-                        'gamma': ['scale', 'auto']
-                    },
-                    "CatBoostClassifier": {
-                        'iterations': [100, 200, 300],
-                        'depth': [4, 6, 8],
-                        'learning_rate': [0.01, 0.05, 0.1],
-                        'l2_leaf_reg': [1, 3, 5]
-                    }
-                }
-
-                best_model = None
-                best_score = 0
-                best_model_name = None
-
-                for model_name, model in models.items():
-                    logging.info(f"Evaluating model: {model_name}")
-                    try:
-                        if model_name in param_grids:
-                            grid = GridSearchCV(model, param_grids[model_name], cv=3, scoring='accuracy', n_jobs=-1)
-                            grid.fit(X_train, y_train)
-                            mean_accuracy = grid.best_score_
-                            best_estimator = grid.best_estimator_
-                            logging.info(f"Best params for {model_name}: {grid.best_params_}")
-                        else:
-                            accuracies = cross_val_score(model, X_train, y_train, scoring='accuracy', cv=5)
-                            mean_accuracy = accuracies.mean()
-                            best_estimator = model
-                            best_estimator.fit(X_train, y_train)
-
-                        logging.info(f"Cross-validation accuracy for {model_name}: {mean_accuracy:.4f}")
-
-                        if mean_accuracy > best_score:
-                            best_score = mean_accuracy
-                            best_model = best_estimator
-                            best_model_name = model_name
-
-                    except Exception as e:
-                        logging.error(f"Model {model_name} failed during evaluation: {e}")
-
-                if best_model is None:
-                    raise CustomException("No best model found after evaluation", sys)
-
-                logging.info(f"Best model selected: {best_model_name} with accuracy: {best_score:.4f}")
-
-                y_pred = best_model.predict(X_test)
-                test_accuracy = accuracy_score(y_test, y_pred)
-                conf_matrix = confusion_matrix(y_test, y_pred)
-                class_report = classification_report(y_test, y_pred)
-                f1 = f1_score(y_test, y_pred, average='weighted')
-
-                logging.info(f"Test accuracy of best model {best_model_name}: {test_accuracy:.4f}")
-                logging.info(f"Confusion Matrix:\\n{conf_matrix}")
-                logging.info(f"Classification Report:\\n{class_report}")
-                logging.info(f"F1 Score: {f1:.4f}")
-
-                model_path = self.model_trainer_config.wine_trained_model_file_path
-
-                save_object(
-                    file_path=model_path,
-                    obj=best_model
+            if isinstance(train_array, tuple):
+                # Compact mode: features and labels arrive as separate arrays with their own dtypes
+                (X_train, y_train), (X_test, y_test) = train_array, test_array
+            else:
+                X_train, y_train, X_test, y_test = (
+                    train_array[:,:-1],
+                    train_array[:,-1],
+                    test_array[:,:-1],
+                    test_array[:,-1],
                 )
 
-                return {
-                    "model_name": best_model_name,
-                    "test_accuracy": test_accuracy,
-                    "confusion_matrix": conf_matrix,
-                    "classification_report": class_report,
-                    "f1_score": f1
-                }
-
-            elif self.dataset_name == 'water':
-                models = {
-                    "LogisticRegression": LogisticRegression(max_iter=1000),
-                    "DecisionTreeClassifier": DecisionTreeClassifier(),
-                    "RandomForestClassifier": RandomForestClassifier(),
-                    "ExtraTreesClassifier": ExtraTreesClassifier(),
-                    "SVC": SVC(probability=True),
-                    "KNeighborsClassifier": KNeighborsClassifier(),
-                    "GradientBoostingClassifier": GradientBoostingClassifier(),
-                    "AdaBoostClassifier": AdaBoostClassifier(),
-                    "CatBoostClassifier": CatBoostClassifier(verbose=0)
-                }
-
-                param_grids = {
-                    "LogisticRegression": {
-                        'C': [0.01, 0.1, 1, 10],
-                        'solver': ['lbfgs', 'liblinear']
-                    },
-                    "RandomForestClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "ExtraTreesClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "GradientBoostingClassifier": {
-                        'n_estimators': [100, 200],
-                        'learning_rate': [0.05, 0.1],
-                        'max_depth': [3, 5]
-                    },
-                    "AdaBoostClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'learning_rate': [0.05, 0.1, 0.5]
-                    },
-                    "SVC": {
-                        'C': [0.1, 1, 10],
-                        'kernel': ['linear', 'rbf'],
-                        'gamma': ['scale', 'auto']
-                    },
-                    "CatBoostClassifier": {
-                        'iterations': [100, 200, 300],
-                        'depth': [4, 6, 8],
-                        'learning_rate': [0.01, 0.05, 0.1],
-                        'l2_leaf_reg': [1, 3, 5]
-                    }
-                }
-
-                best_model = None
-                best_score = 0
-                best_model_name = None
-
-                for model_name, model in models.items():
-                    logging.info(f"Evaluating model: {model_name}")
-                    try:
-                        if model_name in param_grids:
-                            grid = GridSearchCV(model, param_grids[model_name], cv=3, scoring='accuracy', n_jobs=-1)
-                            grid.fit(X_train, y_train)
-                            mean_accuracy = grid.best_score_
-                            best_estimator = grid.best_estimator_
-                            logging.info(f"Best params for {model_name}: {grid.best_params_}")
-                        else:
-                            accuracies = cross_val_score(model, X_train, y_train, scoring='accuracy', cv=5)
-                            mean_accuracy = accuracies.mean()
-                            best_estimator = model
-                            best_estimator.fit(X_train, y_train)
-
-                        logging.info(f"Cross-validation accuracy for {model_name}: {mean_accuracy:.4f}")
-
-                        if mean_accuracy > best_score:
-                            best_score = mean_accuracy
-                            best_model = best_estimator
-                            best_model_name = model_name
-
-                    except Exception as e:
-                        logging.error(f"Model {model_name} failed during evaluation: {e}")
-
-                if best_model is None:
-                    raise CustomException("No best model found after evaluation", sys)
-
-                logging.info(f"Best model selected: {best_model_name} with accuracy: {best_score:.4f}")
-
-                y_pred = best_model.predict(X_test)
-
-                test_accuracy = accuracy_score(y_test, y_pred)
-                conf_matrix = confusion_matrix(y_test, y_pred)
-                class_report = classification_report(y_test, y_pred)
-                f1 = f1_score(y_test, y_pred, average='weighted')
-
-                logging.info(f"Test accuracy of best model {best_model_name}: {test_accuracy:.4f}")
-                logging.info(f"Confusion Matrix:\\n{conf_matrix}")
-                logging.info(f"Classification Report:\\n{class_report}")
-                logging.info(f"F1 Score: {f1:.4f}")
-
-                model_path = self.model_trainer_config.water_trained_model_file_path
-
-                save_object(
-                    file_path=model_path,
-                    obj=best_model
+            results, search_wall = self.search_models(X_train, y_train)
+            # Estimated against the exhaustive grid; always 0 in grid mode
+            fit_seconds_saved = sum(result.get('estimated_fit_seconds_saved', 0.0) for result in results)
+
+            for result in results:
+                model_name = result['name']
+                if result['estimator'] is None:
+                    logging.error(f"Model {model_name} failed during evaluation")
+                    continue
+                if result['best_params']:
+                    logging.info(f"Best params for {model_name}: {result['best_params']}")
+                logging.info(
+                    f"Cross-validation accuracy for {model_name}: {result['cv_score']:.4f} "
+                    f"({result['n_fits']} fits, {result['fit_wall_seconds']:.1f}s wall, {result['fit_cpu_seconds']:.1f}s CPU)"
                 )
 
-                return {
-                    "model_name": best_model_name,
-                    "test_accuracy": test_accuracy,
-                    "confusion_matrix": conf_matrix,
-                    "classification_report": class_report,
-                    "f1_score": f1
-                }
+            # Every finalist is timed on the test rows; the policy weighs accuracy against serving cost
+            chosen, selection = select_model(results, X_test, self.selection_policy, self.selection_config)
+            if chosen is None:
+                raise CustomException("No best model found after evaluation", sys)
+            best_model, best_score, best_model_name = chosen['estimator'], chosen['cv_score'], chosen['name']
 
-            else:
-                models = {
-                    "LogisticRegression": LogisticRegression(max_iter=1000),
-                    "DecisionTreeClassifier": DecisionTreeClassifier(),
-                    "RandomForestClassifier": RandomForestClassifier(),
-                    "ExtraTreesClassifier": ExtraTreesClassifier(),
-                    "SVC": SVC(probability=True),
-                    "KNeighborsClassifier": KNeighborsClassifier(),
-                    "GradientBoostingClassifier": GradientBoostingClassifier(),
-                    "AdaBoostClassifier": AdaBoostClassifier(),
-                    "CatBoostClassifier": CatBoostClassifier(verbose=0)
-                }
+            logging.info(f"Best model selected: {best_model_name} with accuracy: {best_score:.4f}")
 
-                param_grids = {
-                    "LogisticRegression": {
-                        'C': [0.01, 0.1, 1, 10],
-                        'solver': ['lbfgs', 'liblinear']
-                    },
-                    "RandomForestClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "ExtraTreesClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'max_depth': [None, 10, 20, 30]
-                    },
-                    "GradientBoostingClassifier": {
-                        'n_estimators': [100, 200],
-                        'learning_rate': [0.05, 0.1],
-                        'max_depth': [3, 5]
-                    },
-                    "AdaBoostClassifier": {
-                        'n_estimators': [50, 100, 200],
-                        'learning_rate': [0.05, 0.1, 0.5]
-                    },
-                    "SVC": {
-                        'C': [0.1, 1, 10],
-                        'kernel': ['linear', 'rbf'],
-                        'gamma': ['scale', 'auto']
-                    },
-                    "CatBoostClassifier": {
-                        'iterations': [100, 200, 300],
-                        'depth': [4, 6, 8],
-                        'learning_rate': [0.01, 0.05, 0.1],
-                        'l2_leaf_reg': [1, 3, 5]
-                    }
-                }
+            y_pred = best_model.predict(X_test)
+            test_accuracy = accuracy_score(y_test, y_pred)
+            conf_matrix = confusion_matrix(y_test, y_pred)
+            class_report = classification_report(y_test, y_pred)
+            f1 = f1_score(y_test, y_pred, average='weighted')
 
-                best_model = None
-                best_score = 0
-                best_model_name = None
+            logging.info(f"Test accuracy of best model {best_model_name}: {test_accuracy:.4f}")
+            logging.info(f"Confusion Matrix:\\n{conf_matrix}")
+            logging.info(f"Classification Report:\\n{class_report}")
+            logging.info(f"F1 Score: {f1:.4f}")
 
-                for model_name, model in models.items():
-                    logging.info(f"Evaluating model: {model_name}")
-                    try:
-                        if model_name in param_grids:
-                            grid = GridSearchCV(model, param_grids[model_name], cv=3, scoring='accuracy', n_jobs=-1)
-                            grid.fit(X_train, y_train)
-                            mean_accuracy = grid.best_score_
-                            best_estimator = grid.best_estimator_
-                            logging.info(f"Best params for {model_name}: {grid.best_params_}")
-                        else:
-                            accuracies = cross_val_score(model, X_train, y_train, scoring='accuracy', cv=5)
-                            mean_accuracy = accuracies.mean()
-                            best_estimator = model
-                            best_estimator.fit(X_train, y_train)
-
-                        logging.info(f"Cross-validation accuracy for {model_name}: {mean_accuracy:.4f}")
-
-                        if mean_accuracy > best_score:
-                            best_score = mean_accuracy
-                            best_model = best_estimator
-                            best_model_name = model_name
-
-                    except Exception as e:
-                        logging.error(f"Model {model_name} failed during evaluation: {e}")
-
-                if best_model is None:
-                    raise CustomException("No best model found after evaluation", sys)
-
-                logging.info(f"Best model selected: {best_model_name} with accuracy: {best_score:.4f}")
-
-                y_pred = best_model.predict(X_test)
-
-                test_accuracy = accuracy_score(y_test, y_pred)
-                conf_matrix = confusion_matrix(y_test, y_pred)
-                class_report = classification_report(y_test, y_pred)
-                f1 = f1_score(y_test, y_pred, average='weighted')
-
-                logging.info(f"Test accuracy of best model {best_model_name}: {test_accuracy:.4f}")
-                logging.info(f"Confusion Matrix:\\n{conf_matrix}")
-                logging.info(f"Classification Report:\\n{class_report}")
-                logging.info(f"F1 Score: {f1:.4f}")
-
-                model_path = self.model_trainer_config.milk_trained_model_file_path
-
-                save_object(
-                    file_path=model_path,
-                    obj=best_model
-                )
+            save_object(
+                file_path=self.get_model_path(),
+                obj=best_model
+            )
 
-                return {
-                    "model_name": best_model_name,
-                    "test_accuracy": test_accuracy,
-                    "confusion_matrix": conf_matrix,
-                    "classification_report": class_report,
-                    "f1_score": f1
+            compression = None
+            compressed_path = model_variant_path(self.get_model_path(), 'compressed')
+            if self.compressor is not None:
+                compressed_model, compression = self.compressor.compress(best_model, X_test, y_test)
+                if compressed_model is not None:
+                    save_object(file_path=compressed_path, obj=compressed_model)
+                    compression['artifact'] = compressed_path
+            if (compression is None or 'artifact' not in compression) and os.path.exists(compressed_path):
+                # A variant cut from the previous model must not be served next to the new one
+                os.remove(compressed_path)
+
+            return {
+                "model_name": best_model_name,
+                "test_accuracy": test_accuracy,
+                "confusion_matrix": conf_matrix,
+                "classification_report": class_report,
+                "f1_score": f1,
+                "fit_seconds_saved": fit_seconds_saved,
+                "selection": selection,
+                "compression": compression,
+                "search": {
+                    "mode": self.search_mode,
+                    "wall_seconds": search_wall,
+                    "n_workers": self.n_workers,
+                    "candidates": {
+                        result['name']: {key: value for key, value in result.items() if key not in ('name', 'estimator')}
+                        for result in results
+                    }
                 }
+            }
 
         except Exception as e:
             raise CustomException(e, sys)
@@ -0,0 +1,367 @@
+import os
+import sys
+import math
+import time
+from dataclasses import dataclass
+import numpy as np
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from src.exception import CustomException
+from src.logger import logging
+from src.components.training_cache import array_digest
+
+# Estimator parameters that start their own thread pools (sklearn/XGBoost, CatBoost, LightGBM-style)
+THREAD_PARAMS = ('n_jobs', 'thread_count', 'nthread')
+
+@dataclass
+class SearchSchedulerConfig:
+    # Size of the single process pool shared by every candidate; -1 uses all cores
+    n_workers: int = int(os.environ.get('SEARCH_WORKERS', -1))
+    # Share of the configurations kept after each successive-halving round
+    halving_factor: int = int(os.environ.get('SEARCH_HALVING_FACTOR', 3))
+
+@dataclass
+class SearchCandidate:
+    name: str
+    estimator: object
+    param_grid: dict = None
+    cv: int = 3
+    # What successive halving grows per round: 'n_samples' or an estimator parameter such as
+    # 'iterations'; a parameter resource is taken out of the grid and its largest value is the budget
+    resource: str = 'n_samples'
+
+def _single_threaded(estimator):
+    '''Pin every thread-count parameter of the estimator to 1; returns the original values'''
+    params = estimator.get_params(deep=False)
+    originals = {key: params[key] for key in THREAD_PARAMS if key in params}
+    if originals:
+        estimator.set_params(**{key: 1 for key in originals})
+    return originals
+
+def _fit_and_score(estimator, params, X, y, train, test, scoring):
+    '''One (candidate, param combo, fold) task; runs inside a pool worker with one thread'''
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with threadpool_limits(limits=1):
+            model = clone(estimator).set_params(**params)
+            _single_threaded(model)
+            model.fit(X[train], y[train])
+            score = get_scorer(scoring)(model, X[test], y[test])
+        error = None
+    except Exception as e:
+        score, error = np.nan, str(e)
+    return score, error, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def _refit(estimator, params, X, y):
+    '''Fit the winning params of one candidate on the full training data'''
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with threadpool_limits(limits=1):
+            model = clone(estimator).set_params(**params)
+            originals = _single_threaded(model)
+            model.fit(X, y)
+        try:
+            # Hand back the thread settings the model was configured with; CatBoost
+            # refuses parameter changes once fitted and stays single-threaded
+            model.set_params(**originals)
+        except Exception:
+            pass
+        error = None
+    except Exception as e:
+        model, error = None, str(e)
+    return model, error, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def _task_cost(params, n_train):
+    '''Rough relative cost used to start the longest tasks first'''
+    cost = float(n_train)
+    for key in ('iterations', 'n_estimators'):
+        if params.get(key):
+            cost *= params[key]
+    depth = params.get('depth') or params.get('max_depth')
+    if depth:
+        cost *= depth
+    return cost
+
+
+class _CandidateSearch:
+    '''Search state of one candidate: its configurations, folds and resource per round'''
+    def __init__(self, candidate, X, y, mode, factor):
+        self.candidate = candidate
+        cv = check_cv(candidate.cv, y, classifier=is_classifier(candidate.estimator))
+        self.splits = list(cv.split(X, y))
+        self.n_samples = len(y)
+        param_grid = dict(candidate.param_grid or {})
+
+        self.resource = None
+        self.resource_values = None
+        if mode == 'halving' and candidate.resource != 'n_samples':
+            self.resource = candidate.resource
+            if candidate.resource in param_grid:
+                self.resource_values = list(param_grid.pop(candidate.resource))
+                max_resource = max(self.resource_values)
+            else:
+                max_resource = candidate.estimator.get_params()[candidate.resource]
+                if not max_resource:
+                    raise ValueError(f"{candidate.name} needs an explicit {candidate.resource} to use it as the halving resource")
+        else:
+            max_resource = self.n_samples
+        self.grid = list(ParameterGrid(param_grid)) if param_grid else [{}]
+
+        if mode == 'halving' and len(self.grid) > 1:
+            n_rounds = 1 + int(math.floor(math.log(len(self.grid), factor)))
+            if self.resource is None:
+                # Every fold needs a couple of samples of each class to fit and score
+                smallest = 2 * len(self.splits) * len(np.unique(y))
+            else:
+                smallest = 1
+            min_resource = max(max_resource // factor ** (n_rounds - 1), smallest)
+            n_rounds = min(n_rounds, 1 + int(math.floor(math.log(max(max_resource / min_resource, 1), factor))))
+            # The last round always runs at the full budget, so its scores compare with grid mode
+            self.schedule = [min_resource * factor ** i for i in range(n_rounds - 1)] + [max_resource]
+        else:
+            self.schedule = [max_resource]
+        self.factor = factor
+        self.max_resource = max_resource
+
+        self.alive = list(range(len(self.grid)))
+        self.scores = {}
+        self.fit_wall = 0.0
+        self.fit_cpu = 0.0
+        self.cached_fits = 0
+        self.cached_fit_seconds = 0.0
+        self.rounds = []
+
+    def tasks(self, round_index, random_state):
+        '''(candidate search, combo index, params, fold index, train, test) for one round'''
+        resource = self.schedule[round_index]
+        tasks = []
+        for combo_index in self.alive:
+            params = dict(self.grid[combo_index])
+            if self.resource is not None:
+                params[self.resource] = resource
+            for fold_index, (train, test) in enumerate(self.splits):
+                if self.resource is None and resource < self.n_samples:
+                    # Subsample the training part of each fold; the scoring part stays whole
+                    size = max(int(len(train) * resource / self.n_samples), 1)
+                    train = np.sort(random_state.choice(train, size=size, replace=False))
+                tasks.append((self, combo_index, params, fold_index, train, test))
+        return tasks
+
+    def finish_round(self, round_index, fold_scores):
+        '''Keep the best 1/factor of the configurations for the next round'''
+        mean_scores = {combo_index: float(np.mean(scores)) for combo_index, scores in fold_scores.items()}
+        self.scores = mean_scores
+        self.rounds.append({
+            'resource': self.schedule[round_index],
+            'n_configurations': len(self.alive),
+            'n_fits': len(self.alive) * len(self.splits),
+        })
+        if round_index + 1 < len(self.schedule):
+            n_keep = max(int(math.ceil(len(self.alive) / self.factor)), 1)
+            # A failed configuration scores nan and is dropped first; ties keep the grid order
+            ranked = sorted(
+                self.alive,
+                key=lambda combo_index: (np.isnan(mean_scores[combo_index]), -np.nan_to_num(mean_scores[combo_index], nan=0.0), combo_index)
+            )
+            self.alive = sorted(ranked[:n_keep])
+
+    def best(self):
+        '''(params, mean score) of the best configuration of the last round, or None if all failed'''
+        scored = [(combo_index, score) for combo_index, score in self.scores.items() if not np.isnan(score)]
+        if not scored:
+            return None
+        combo_index, score = max(scored, key=lambda item: (item[1], -item[0]))
+        params = dict(self.grid[combo_index])
+        if self.resource is not None:
+            params[self.resource] = self.max_resource
+        return params, score
+
+    def exhaustive_fit_seconds(self, last_round_wall):
+        '''
+        Estimated fit time of the exhaustive grid, scaling the last round's time per unit of
+        resource linearly to every configuration of the full grid at its own budget
+        '''
+        last = self.rounds[-1]
+        per_unit = last_round_wall / (last['n_fits'] * last['resource'])
+        if self.resource_values is not None:
+            budget = sum(self.resource_values)
+        else:
+            budget = self.max_resource
+        return per_unit * len(self.grid) * len(self.splits) * budget
+
+class SearchScheduler:
+    '''
+    Cross-validated search over several candidate models in one process pool. Every
+    (candidate, param combo, fold) is an independent single-threaded task, so the pool size
+    is the whole CPU budget instead of each GridSearchCV claiming every core in turn.
+
+    mode='grid' scores every configuration on the full data, like GridSearchCV.
+    mode='halving' runs successive halving: each round scores the surviving configurations
+    on a larger resource (training samples, or boosting iterations for candidates that set
+    resource) and keeps the best 1/factor of them, so clearly losing ones stop early.
+
+    With a TrainingCache, fold scores and refitted estimators computed by earlier runs on the
+    same data are reused and only new grid points are sent to the pool.
+    '''
+    def __init__(self, n_workers=None, scoring='accuracy', mode='grid', factor=None, random_state=42, cache=None):
+        config = SearchSchedulerConfig()
+        self.n_workers = config.n_workers if n_workers is None else n_workers
+        self.factor = config.halving_factor if factor is None else factor
+        self.scoring = scoring
+        self.mode = mode
+        self.random_state = random_state
+        self.cache = cache
+        if mode not in ('grid', 'halving'):
+            raise ValueError(f"Unknown search mode: {mode}")
+
+    def run(self, candidates, X, y):
+        '''
+        Returns one result dict per candidate, in the given order, with the mean CV score,
+        best params, refitted estimator (None if every fit failed) and its fit timings.
+        In grid mode scores follow GridSearchCV/cross_val_score: same folds, first best combo on ties.
+        '''
+        try:
+            random_state = np.random.RandomState(self.random_state)
+            searches = [_CandidateSearch(candidate, X, y, self.mode, self.factor) for candidate in candidates]
+            n_rounds = max(len(search.schedule) for search in searches)
+            logging.info(
+                f"{self.mode} search of {len(candidates)} candidates in up to {n_rounds} rounds on {self.n_workers} workers"
+            )
+
+            search_start = time.perf_counter()
+            data_digest = array_digest(X, y) if self.cache is not None else None
+            last_round_wall = {}
+            with Parallel(n_jobs=self.n_workers) as parallel:
+                # Candidates run their rounds side by side, so one pass keeps the whole pool busy
+                for round_index in range(n_rounds):
+                    tasks = [
+                        task for search in searches if round_index < len(search.schedule)
+                        for task in search.tasks(round_index, random_state)
+                    ]
+                    tasks.sort(key=lambda task: _task_cost(task[2], len(task[4])), reverse=True)
+                    outcomes, keys = self._lookup(
+                        [(search.candidate.estimator, params, train, test) for search, _, params, _, train, test in tasks],
+                        data_digest,
+                    )
+                    pending = [i for i, outcome in enumerate(outcomes) if outcome is None]
+                    computed = parallel(
+                        delayed(_fit_and_score)(tasks[i][0].candidate.estimator, tasks[i][2], X, y, tasks[i][4], tasks[i][5], self.scoring)
+                        for i in pending
+                    )
+                    for i, outcome in zip(pending, computed):
+                        outcomes[i] = outcome
+                        if self.cache is not None and outcome[1] is None:
+                            self.cache.put(keys[i], outcome)
+
+                    fold_scores = {}
+                    round_wall = {}
+                    for i, ((search, combo_index, _, fold_index, _, _), (score, error, wall, cpu)) in enumerate(zip(tasks, outcomes)):
+                        fold_scores.setdefault(search, {}).setdefault(combo_index, []).append(score)
+                        # Cached fits count with the time they originally took for the halving estimate
+                        round_wall[search] = round_wall.get(search, 0.0) + wall
+                        if i in pending:
+                            search.fit_wall += wall
+                            search.fit_cpu += cpu
+                        else:
+                            search.cached_fits += 1
+                            search.cached_fit_seconds += wall
+                        if error is not None:
+                            logging.warning(f"{search.candidate.name} fit failed on fold {fold_index}: {error}")
+                    for search, scores in fold_scores.items():
+                        search.finish_round(round_index, scores)
+                        last_round_wall[search] = round_wall[search]
+
+                best = {search: search.best() for search in searches}
+                refit_searches = [search for search in searches if best[search] is not None]
+                refits, refit_keys = self._lookup(
+                    [(search.candidate.estimator, best[search][0], None, None) for search in refit_searches],
+                    data_digest,
+                )
+                pending = [i for i, refit in enumerate(refits) if refit is None]
+                computed = parallel(
+                    delayed(_refit)(refit_searches[i].candidate.estimator, best[refit_searches[i]][0], X, y)
+                    for i in pending
+                )
+                for i, refit in zip(pending, computed):
+                    refits[i] = refit
+                    if self.cache is not None and refit[1] is None:
+                        self.cache.put(refit_keys[i], refit)
+            search_wall = time.perf_counter() - search_start
+            refit_cached = {refit_searches[i] for i in range(len(refit_searches)) if i not in pending}
+            refits = dict(zip(refit_searches, refits))
+            if self.cache is not None:
+                self.cache.enforce_size_limit()
+
+            results = []
+            for search in searches:
+                name = search.candidate.name
+                result = {
+                    'name': name,
+                    'cv_score': np.nan,
+                    'best_params': None,
+                    'estimator': None,
+                    'n_fits': sum(round_info['n_fits'] for round_info in search.rounds),
+                    'rounds': search.rounds,
+                    'fit_wall_seconds': search.fit_wall,
+                    'fit_cpu_seconds': search.fit_cpu,
+                    'refit_wall_seconds': 0.0,
+                    'refit_cpu_seconds': 0.0,
+                    'cached_fits': search.cached_fits,
+                    'cached_fit_seconds': search.cached_fit_seconds,
+                    'refit_cached': search in refit_cached,
+                }
+                if self.mode == 'halving':
+                    exhaustive = search.exhaustive_fit_seconds(last_round_wall[search])
+                    result['estimated_exhaustive_fit_seconds'] = exhaustive
+                    # Negative when the extra early rounds cost more than the grid points they pruned
+                    result['estimated_fit_seconds_saved'] = exhaustive - search.fit_wall
+                if best[search] is not None:
+                    params, score = best[search]
+                    model, error, refit_wall, refit_cpu = refits[search]
+                    if error is not None:
+                        logging.error(f"Refitting {name} with {params} failed: {error}")
+                    if search not in refit_cached:
+                        result.update(refit_wall_seconds=refit_wall, refit_cpu_seconds=refit_cpu)
+                    result.update(cv_score=score, best_params=params, estimator=model)
+                results.append(result)
+
+            busy = sum(result['fit_wall_seconds'] + result['refit_wall_seconds'] for result in results)
+            logging.info(
+                f"Search finished in {search_wall:.1f}s wall for {busy:.1f}s of fitting "
+                f"({busy / search_wall if search_wall else 0.0:.1f}x parallel speedup)"
+            )
+            if self.cache is not None:
+                reused = sum(result['cached_fits'] for result in results)
+                logging.info(
+                    f"Reused {reused} cached fits worth "
+                    f"{sum(result['cached_fit_seconds'] for result in results):.1f}s from {self.cache.cache_dir}"
+                )
+            if self.mode == 'halving':
+                saved = sum(result['estimated_fit_seconds_saved'] for result in results)
+                logging.info(f"Successive halving saved an estimated {saved:.1f}s of fitting over the exhaustive grid")
+            return results, search_wall
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _lookup(self, tasks, data_digest):
+        '''
+        Cached outcome (or None) and cache key per (estimator, params, train, test) task;
+        train None means a refit on all the data
+        '''
+        outcomes = [None] * len(tasks)
+        keys = [None] * len(tasks)
+        if self.cache is None:
+            return outcomes, keys
+        for i, (estimator, params, train, test) in enumerate(tasks):
+            if train is None:
+                keys[i] = self.cache.refit_key(data_digest, estimator, params)
+            else:
+                keys[i] = self.cache.fold_key(data_digest, estimator, params, train, test, self.scoring)
+            outcomes[i] = self.cache.get(keys[i])
+        return outcomes, keys
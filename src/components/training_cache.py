@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import hashlib
+from dataclasses import dataclass
+import numpy as np
+import dill
+
+from src.exception import CustomException
+from src.logger import logging
+
+@dataclass
+class TrainingCacheConfig:
+    enabled: bool = os.environ.get('TRAINING_CACHE', '1') == '1'
+    cache_dir: str = os.environ.get('TRAINING_CACHE_DIR', os.path.join('artifact', 'training_cache'))
+    max_size_mb: float = float(os.environ.get('TRAINING_CACHE_MAX_MB', 1024))
+
+# Parameters that only change how fast a model fits, not what it learns
+IGNORED_PARAMS = ('n_jobs', 'thread_count', 'nthread', 'verbose')
+
+def array_digest(*arrays):
+    '''sha256 over the dtype, shape and bytes of the given arrays'''
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape};".encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+def _library_versions(estimator):
+    modules = {'numpy', 'sklearn', type(estimator).__module__.split('.')[0]}
+    return {name: getattr(sys.modules.get(name), '__version__', None) for name in sorted(modules)}
+
+def _estimator_identity(estimator, params):
+    '''Class, constructor params with the searched params applied, and library versions'''
+    settings = estimator.get_params(deep=False)
+    settings.update(params)
+    settings = {key: repr(value) for key, value in sorted(settings.items()) if key not in IGNORED_PARAMS}
+    return {
+        'class': f"{type(estimator).__module__}.{type(estimator).__qualname__}",
+        'params': settings,
+        'versions': _library_versions(estimator),
+    }
+
+class TrainingCache:
+    '''
+    Content-addressed on-disk cache of fold scores and refitted estimators. A key hashes the
+    training data, the estimator class and params, the exact train/test indices (which fix the
+    CV split, its seed, the fold and any subsample) and the library versions, so an entry is
+    only reused when the fit would be identical. Least recently used entries are evicted once
+    the cache grows past max_size_mb.
+    '''
+    def __init__(self, cache_dir=None, max_size_mb=None):
+        config = TrainingCacheConfig()
+        self.cache_dir = config.cache_dir if cache_dir is None else cache_dir
+        self.max_size_mb = config.max_size_mb if max_size_mb is None else max_size_mb
+        self.hits = 0
+        self.misses = 0
+
+    def fold_key(self, data_digest, estimator, params, train, test, scoring):
+        return self._key({
+            'kind': 'fold',
+            'data': data_digest,
+            'estimator': _estimator_identity(estimator, params),
+            'train': array_digest(train),
+            'test': array_digest(test),
+            'scoring': scoring,
+        })
+
+    def refit_key(self, data_digest, estimator, params):
+        return self._key({
+            'kind': 'refit',
+            'data': data_digest,
+            'estimator': _estimator_identity(estimator, params),
+        })
+
+    def _key(self, identity):
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def get(self, key):
+        '''Cached value for key, or None'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = dill.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.warning(f"Discarding unreadable training cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        # The modification time doubles as the last-use time for LRU eviction
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        try:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                dill.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        '''(last use, size, path) of every entry'''
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.pkl'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def enforce_size_limit(self):
+        '''Evict least recently used entries until the cache fits in max_size_mb; returns the count'''
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size_mb * 1024 * 1024
+        evicted = 0
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            self._remove(path)
+            total -= size
+            evicted += 1
+        if evicted:
+            logging.info(f"Evicted {evicted} training cache entries, {total / (1024 * 1024):.1f} MB left")
+        return evicted
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'entries': len(entries),
+            'size_mb': sum(size for _, size, _ in entries) / (1024 * 1024),
+            'max_size_mb': self.max_size_mb,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
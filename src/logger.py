@@ -1,28 +1,191 @@
 import logging
+import logging.handlers
 import os
-from datetime import datetime
 import sys
+import time
+import queue
+import atexit
+import threading
+from dataclasses import dataclass
 
-LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-log_path = os.path.join(os.getcwd(), "logs", LOG_FILE)
-os.makedirs(log_path, exist_ok=True)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-LOG_FILE_PATH = os.path.join(log_path, LOG_FILE)
+# Module prefixes that make up each area; levels are configured per area or per prefix
+LOG_AREAS = {
+    'training': ['src.components', 'src.scripts'],
+    'serving': ['app', 'serve', 'src.pipeline', 'src.utils', 'src.artifact_store', 'src.exception'],
+}
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+def _default_service():
+    script = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else ''))[0]
+    return script if script and script not in ('-c', '-m') else 'app'
 
-# File handler
-file_handler = logging.FileHandler(LOG_FILE_PATH)
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter("[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(file_formatter)
+@dataclass
+class LoggingConfig:
+    """Settings of the logging subsystem, overridable through environment variables"""
+    service: str = os.environ.get('LOG_SERVICE', _default_service())
+    log_dir: str = os.environ.get('LOG_DIR', os.path.join(os.getcwd(), 'logs'))
+    level: str = os.environ.get('LOG_LEVEL', 'INFO')
+    training_level: str = os.environ.get('LOG_LEVEL_TRAINING', '')
+    serving_level: str = os.environ.get('LOG_LEVEL_SERVING', '')
+    # Extra per-module levels, e.g. "src.pipeline.model_registry=DEBUG,src.components=WARNING"
+    module_levels: str = os.environ.get('LOG_MODULE_LEVELS', '')
+    max_bytes: int = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    rotate_seconds: int = int(os.environ.get('LOG_ROTATE_SECONDS', 24 * 60 * 60))
+    backup_count: int = int(os.environ.get('LOG_BACKUP_COUNT', 7))
+    queue_size: int = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    console: bool = os.environ.get('LOG_CONSOLE', '1') == '1'
 
-# Console handler
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s")
-console_handler.setFormatter(console_formatter)
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates when the file reaches max_bytes or rotate_seconds have passed, whichever is first"""
+    def __init__(self, filename, max_bytes, rotate_seconds, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.rollover_at = time.time() + rotate_seconds if rotate_seconds > 0 else None
 
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.rotate_seconds
+
+class ModuleLevelFilter(logging.Filter):
+    """Applies a level per module prefix; the repo logs through the root logger, so the module comes from the file path"""
+    def __init__(self, levels, default_level):
+        super().__init__()
+        # Longest prefix wins
+        self.levels = sorted(levels.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_level = default_level
+        self._cache = {}
+
+    def _module_name(self, record):
+        if record.name != 'root':
+            return record.name
+        path = os.path.abspath(record.pathname)
+        if not path.startswith(PROJECT_ROOT):
+            return ''
+        return os.path.splitext(os.path.relpath(path, PROJECT_ROOT))[0].replace(os.sep, '.')
+
+    def level_for(self, record):
+        key = (record.name, record.pathname)
+        level = self._cache.get(key)
+        if level is None:
+            module = self._module_name(record)
+            level = next(
+                (level for prefix, level in self.levels if module == prefix or module.startswith(prefix + '.')),
+                self.default_level
+            )
+            self._cache[key] = level
+        return level
+
+    def filter(self, record):
+        return record.levelno >= self.level_for(record)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records that do not fit in the bounded queue are counted and dropped"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener runs in this process, so the record can be handed over as is and
+        # formatted on the listener thread instead of the caller's
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def _parse_levels(config):
+    levels = {}
+    for area, level in (('training', config.training_level), ('serving', config.serving_level)):
+        if level:
+            for prefix in LOG_AREAS[area]:
+                levels[prefix] = logging.getLevelName(level.upper())
+    for item in filter(None, (part.strip() for part in config.module_levels.split(','))):
+        prefix, _, level = item.partition('=')
+        levels[prefix.strip()] = logging.getLevelName(level.strip().upper())
+    return {prefix: level for prefix, level in levels.items() if isinstance(level, int)}
+
+_state = {'listener': None, 'handler': None, 'config': None}
+_state_lock = threading.Lock()
+
+def _build_output_handlers(config):
+    service_dir = os.path.join(config.log_dir, config.service)
+    os.makedirs(service_dir, exist_ok=True)
+    file_handler = SizeAndTimeRotatingFileHandler(
+        os.path.join(service_dir, f"{config.service}.log"),
+        max_bytes=config.max_bytes,
+        rotate_seconds=config.rotate_seconds,
+        backup_count=config.backup_count,
+    )
+    file_handler.setFormatter(logging.Formatter("[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s"))
+    handlers = [file_handler]
+    if config.console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s"))
+        handlers.append(console_handler)
+    return handlers
+
+def setup_logging(config=None):
+    """(Re)configure the root logger to write through a bounded queue and a background listener"""
+    with _state_lock:
+        config = config or _state['config'] or LoggingConfig()
+        _shutdown_locked()
+
+        default_level = logging.getLevelName(config.level.upper())
+        if not isinstance(default_level, int):
+            default_level = logging.INFO
+        levels = _parse_levels(config)
+
+        log_queue = queue.Queue(maxsize=config.queue_size)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(ModuleLevelFilter(levels, default_level))
+        listener = logging.handlers.QueueListener(log_queue, *_build_output_handlers(config), respect_handler_level=False)
+        listener.start()
+
+        root = logging.getLogger()
+        root.setLevel(min([default_level] + list(levels.values())))
+        root.addHandler(handler)
+        _state.update(listener=listener, handler=handler, config=config)
+        return handler
+
+def _shutdown_locked():
+    listener, handler = _state['listener'], _state['handler']
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+        for output in listener.handlers:
+            output.close()
+    _state.update(listener=None, handler=None)
+
+def shutdown_logging():
+    """Flush everything still queued and stop the listener"""
+    with _state_lock:
+        _shutdown_locked()
+
+def dropped_records():
+    handler = _state['handler']
+    return handler.dropped if handler is not None else 0
+
+def _restart_in_child():
+    # The listener thread does not survive fork; give the child its own queue and listener
+    global _state_lock
+    _state_lock = threading.Lock()
+    handler = _state['handler']
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+        _state.update(listener=None, handler=None)
+        setup_logging()
+
+setup_logging()
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
@@ -0,0 +1,116 @@
+import sys
+import math
+import time
+import numpy as np
+import pandas as pd
+from src.exception import CustomException
+from src.pipeline.request_trace import trace_event
+from src.pipeline.metrics import prediction_stage_seconds
+
+# Feature order used for ndarray input and for the matrix handed to the preprocessor
+FEATURE_COLUMNS = {
+    'milk': ['pH', 'Temprature', 'Taste', 'Odor', 'Fat', 'Turbidity', 'Colour'],
+    'wine': ['fixed acidity', 'volatile acidity', 'citric acid', 'residual sugar', 'chlorides',
+             'free sulfur dioxide', 'total sulfur dioxide', 'density', 'pH', 'sulphates', 'alcohol'],
+    'water': ['ph', 'Hardness', 'Solids', 'Chloramines', 'Sulfate', 'Conductivity',
+              'Organic_carbon', 'Trihalomethanes', 'Turbidity'],
+}
+
+def _validate_row(row, feature_columns):
+    '''Convert one input row to a list of floats, raising ValueError on bad input'''
+    if isinstance(row, dict):
+        missing = [col for col in feature_columns if col not in row]
+        if missing:
+            raise ValueError(f"Missing features: {missing}")
+        values = [row[col] for col in feature_columns]
+    elif isinstance(row, (list, tuple, np.ndarray)):
+        values = list(row)
+        if len(values) != len(feature_columns):
+            raise ValueError(f"Expected {len(feature_columns)} values, got {len(values)}")
+    else:
+        raise ValueError(f"Expected a dict or a list of feature values, got {type(row).__name__}")
+
+    vector = []
+    for col, value in zip(feature_columns, values):
+        if value is None:
+            # Missing readings are filled in by the fitted imputer
+            vector.append(np.nan)
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for '{col}': {value!r}")
+        if math.isinf(number):
+            raise ValueError(f"Invalid value for '{col}': {value!r}")
+        vector.append(number)
+    return vector
+
+def prepare_batch(rows, feature_columns):
+    '''
+    rows: list of dicts (feature_name: value) or 2D ndarray with columns in feature_columns order
+    Returns (feature matrix of the valid rows, their positions in rows, list of per-row errors)
+    '''
+    if isinstance(rows, np.ndarray):
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if rows.ndim != 2 or rows.shape[1] != len(feature_columns):
+            raise CustomException(
+                f"Expected an array of shape (n, {len(feature_columns)}), got {rows.shape}", sys)
+        if rows.dtype.kind == 'f':
+            # Fast path: only infinities need rejecting, NaN is imputed
+            bad_rows = np.isinf(rows).any(axis=1)
+            valid_index = np.flatnonzero(~bad_rows).tolist()
+            errors = [
+                {'index': int(i), 'message': "Invalid value: infinite reading"}
+                for i in np.flatnonzero(bad_rows)
+            ]
+            return np.asarray(rows[~bad_rows], dtype=np.float64), valid_index, errors
+
+    vectors = []
+    valid_index = []
+    errors = []
+    for i, row in enumerate(rows):
+        try:
+            vectors.append(_validate_row(row, feature_columns))
+            valid_index.append(i)
+        except ValueError as e:
+            errors.append({'index': i, 'message': str(e)})
+
+    X = np.array(vectors, dtype=np.float64).reshape(len(vectors), len(feature_columns))
+    return X, valid_index, errors
+
+def run_batch_prediction(predictor, rows):
+    '''
+    Runs one preprocessor transform and one model call for all valid rows.
+    Returns (labels in input order with None for rejected rows, list of per-row errors)
+    '''
+    dataset_name = predictor.dataset_name
+    start = time.perf_counter()
+    X, valid_index, errors = prepare_batch(rows, predictor.feature_columns)
+    predictions = [None] * (len(valid_index) + len(errors))
+    validated = time.perf_counter()
+    prediction_stage_seconds.observe((dataset_name, 'validate'), validated - start)
+
+    if valid_index:
+        trace_event('input', X)
+        if predictor.compiled_preprocessor is not None:
+            input_processed = predictor.compiled_preprocessor.transform(X)
+        else:
+            input_df = pd.DataFrame(X, columns=predictor.feature_columns)
+            input_processed = predictor.preprocessor.transform(input_df)
+        transformed = time.perf_counter()
+        trace_event('processed', input_processed)
+        model = getattr(predictor, 'compiled_model', None) or predictor.model
+        prediction = model.predict(input_processed)
+        predicted = time.perf_counter()
+        trace_event('raw_prediction', prediction)
+        labels = predictor.decode_predictions(prediction)
+        decoded = time.perf_counter()
+        trace_event('label', labels)
+        for i, label in zip(valid_index, labels):
+            predictions[i] = label
+        prediction_stage_seconds.observe((dataset_name, 'transform'), transformed - validated)
+        prediction_stage_seconds.observe((dataset_name, 'predict'), predicted - transformed)
+        prediction_stage_seconds.observe((dataset_name, 'decode'), decoded - predicted)
+
+    return predictions, errors
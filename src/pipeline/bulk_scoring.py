@@ -0,0 +1,318 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from itertools import islice
+from dataclasses import dataclass, replace
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS
+from src.components.columnar_cache import MANIFEST_FILE
+
+OUTPUT_COLUMNS = ['prediction', 'error']
+
+@dataclass
+class BulkScoringConfig:
+    # Input lines handed to a worker at a time; memory use is about two chunks per worker
+    chunk_rows: int = int(os.environ.get('BULK_CHUNK_ROWS', 100000))
+    # Size of the process pool; -1 uses all cores, 1 scores in this process
+    n_workers: int = int(os.environ.get('BULK_WORKERS', -1))
+    # Seconds between progress lines
+    progress_seconds: float = float(os.environ.get('BULK_PROGRESS_SECONDS', 5))
+
+# Predictors of this process, loaded by the first chunk a worker scores and reused by the next ones
+_worker_predictors = {}
+
+def _worker_predictor(dataset_name):
+    if dataset_name not in _worker_predictors:
+        from src.pipeline.model_registry import DEFAULT_LOADERS
+        _worker_predictors[dataset_name] = DEFAULT_LOADERS[dataset_name]()
+    return _worker_predictors[dataset_name]
+
+def _factorize(values):
+    '''(int32 codes, distinct values in order of appearance); unlike pd.factorize, None stays one value'''
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+def _score_chunk(dataset_name, header, data, output_format, end_offset):
+    '''
+    Parse one block of CSV lines and score it with a single transform and model call. Every line
+    gets an output row, blank lines included, so output row i belongs to input line i.
+    Returns (end_offset, rows, rejected rows, artifact version, payload): CSV bytes, or for
+    'columnar' the factorized (codes, values) of each output column
+    '''
+    predictor = _worker_predictor(dataset_name)
+    feature_columns = predictor.feature_columns
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    blank = np.array([not line.strip() for line in lines], dtype=bool)
+
+    by_name = {column.strip(): column for column in header}
+    try:
+        # Blank lines are kept as rows so the row count stays the line count
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=header, usecols=[by_name[c] for c in feature_columns],
+                            skip_blank_lines=False, low_memory=False)
+    except pd.errors.ParserError as e:
+        raise ValueError(f"Lines before byte {end_offset} could not be parsed: {e}")
+    if len(frame) != len(lines):
+        raise ValueError(
+            f"{len(lines)} lines before byte {end_offset} parsed into {len(frame)} rows; "
+            f"quoted fields spanning several lines are not supported"
+        )
+    frame = frame.rename(columns=lambda column: column.strip())[feature_columns][~blank]
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in frame.dtypes):
+        rows = frame.to_numpy(dtype=np.float64)
+    else:
+        # Text in a numeric column: validate row by row so only the offending rows are rejected
+        rows = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    predictions, errors = predictor.predict_batch(rows)
+
+    # Back to line positions
+    kept = np.flatnonzero(~blank)
+    line_predictions = [None] * len(lines)
+    messages = [None] * len(lines)
+    for position, prediction in zip(kept, predictions):
+        line_predictions[position] = prediction
+    for error in errors:
+        messages[kept[error['index']]] = error['message']
+    for position in np.flatnonzero(blank):
+        messages[position] = "Empty line"
+    if output_format == 'csv':
+        payload = pd.DataFrame({'prediction': line_predictions, 'error': messages}).to_csv(index=False, header=False).encode()
+    else:
+        payload = {'prediction': _factorize(line_predictions), 'error': _factorize(messages)}
+    return end_offset, len(lines), len(errors) + int(blank.sum()), predictor.artifact_version, payload
+
+class BulkScorer:
+    '''
+    Scores a CSV file of any size: the file is read in blocks of lines, the blocks are scored by a
+    pool of worker processes that each load the predictor once, and the results are written in
+    input order as CSV or as a columnar directory (the columnar cache format, readable with
+    ColumnarTable). After every block a checkpoint records the input byte offset reached, so an
+    interrupted run can be resumed.
+    '''
+    def __init__(self, dataset_name, config=None):
+        self.dataset_name = dataset_name.lower()
+        if self.dataset_name not in FEATURE_COLUMNS:
+            raise CustomException(f"Unsupported dataset: {self.dataset_name}", sys)
+        self.config = config or BulkScoringConfig()
+
+    @staticmethod
+    def checkpoint_path(output_path):
+        return output_path + '.checkpoint.json'
+
+    def _read_blocks(self, f, offset):
+        '''(end offset, bytes) of successive blocks of whole lines from offset on'''
+        f.seek(offset)
+        while True:
+            data = b''.join(islice(f, self.config.chunk_rows))
+            if not data:
+                return
+            offset += len(data)
+            yield offset, data
+
+    def _source_state(self, input_path, output_path, output_format):
+        stat = os.stat(input_path)
+        return {
+            'input_path': os.path.abspath(input_path),
+            'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns,
+            'dataset': self.dataset_name,
+            'format': output_format,
+            'output_path': os.path.abspath(output_path),
+        }
+
+    def _start(self, input_path, output_path, output_format, work_path, resume):
+        '''Checkpoint to continue from: the saved one when resuming, else a fresh one with empty outputs'''
+        source = self._source_state(input_path, output_path, output_format)
+        checkpoint_path = self.checkpoint_path(output_path)
+        if resume and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            changed = [key for key, value in source.items() if checkpoint.get(key) != value]
+            if changed:
+                raise ValueError(f"Checkpoint {checkpoint_path} does not match this run ({changed} differ); rerun without --resume")
+            # Anything written after the last checkpoint is scored again
+            if output_format == 'csv':
+                with open(work_path, 'r+b') as f:
+                    f.truncate(checkpoint['output_bytes'])
+            else:
+                for index, column in enumerate(OUTPUT_COLUMNS):
+                    with open(os.path.join(work_path, f"{index:04d}.bin"), 'r+b') as f:
+                        f.truncate(checkpoint['rows'] * np.dtype(np.int32).itemsize)
+            logging.info(f"Resuming bulk scoring of {input_path} at row {checkpoint['rows']}, byte {checkpoint['input_offset']}")
+            return checkpoint
+
+        with open(input_path, 'rb') as f:
+            header_line = f.readline()
+        header = list(pd.read_csv(io.BytesIO(header_line), nrows=0).columns)
+        missing = sorted(set(FEATURE_COLUMNS[self.dataset_name]) - {column.strip() for column in header})
+        if missing:
+            raise ValueError(f"{input_path} lacks the {self.dataset_name} features {missing}")
+
+        if output_format == 'csv':
+            with open(work_path, 'wb') as f:
+                f.write((','.join(OUTPUT_COLUMNS) + '\n').encode())
+        else:
+            shutil.rmtree(work_path, ignore_errors=True)
+            os.makedirs(work_path)
+            for index, column in enumerate(OUTPUT_COLUMNS):
+                open(os.path.join(work_path, f"{index:04d}.bin"), 'wb').close()
+        return {
+            **source,
+            'header': header,
+            'input_offset': len(header_line),
+            'rows': 0,
+            'rejected': 0,
+            'artifact_version': None,
+            'output_bytes': os.path.getsize(work_path) if output_format == 'csv' else None,
+            'categories': {column: [] for column in OUTPUT_COLUMNS} if output_format == 'columnar' else None,
+        }
+
+    @staticmethod
+    def _save_checkpoint(checkpoint, checkpoint_path):
+        tmp_path = checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def _report(self, checkpoint, start_rows, start_offset, start_time, final=False):
+        elapsed = time.perf_counter() - start_time
+        rate = (checkpoint['rows'] - start_rows) / elapsed if elapsed > 0 else 0.0
+        share = checkpoint['input_offset'] / max(checkpoint['input_size'], 1)
+        message = (
+            f"{'Scored' if final else 'Scoring'} {self.dataset_name}: {checkpoint['rows']} rows ({share:.1%} of the input), "
+            f"{checkpoint['rejected']} rejected, {rate:,.0f} rows/s"
+        )
+        read = checkpoint['input_offset'] - start_offset
+        if not final and read > 0:
+            # Remaining time from the bytes read so far in this run
+            message += f", about {(checkpoint['input_size'] - checkpoint['input_offset']) * elapsed / read:.0f} s left"
+        logging.info(message)
+        return rate
+
+    def score_file(self, input_path, output_path, output_format='csv', resume=False):
+        '''Score every row of input_path into output_path; returns a summary of the run'''
+        try:
+            if output_format not in ('csv', 'columnar'):
+                raise ValueError(f"Unknown output format {output_format!r}, expected 'csv' or 'columnar'")
+            work_path = output_path + '.tmp'
+            checkpoint_path = self.checkpoint_path(output_path)
+            checkpoint = self._start(input_path, output_path, output_format, work_path, resume)
+            dictionaries = {
+                column: {value: code for code, value in enumerate(values)}
+                for column, values in (checkpoint['categories'] or {}).items()
+            }
+            start_rows, start_offset = checkpoint['rows'], checkpoint['input_offset']
+            logging.info(
+                f"Bulk scoring {input_path} with the {self.dataset_name} model into {output_path} ({output_format}) "
+                f"in chunks of {self.config.chunk_rows} rows on {self.config.n_workers} workers"
+            )
+
+            start_time = last_report = time.perf_counter()
+            if output_format == 'csv':
+                outputs = [open(work_path, 'ab')]
+            else:
+                outputs = [open(os.path.join(work_path, f"{index:04d}.bin"), 'ab') for index in range(len(OUTPUT_COLUMNS))]
+            try:
+                with open(input_path, 'rb') as f, Parallel(n_jobs=self.config.n_workers, return_as='generator') as parallel:
+                    results = parallel(
+                        delayed(_score_chunk)(self.dataset_name, checkpoint['header'], data, output_format, end_offset)
+                        for end_offset, data in self._read_blocks(f, start_offset)
+                    )
+                    # Results arrive in input order however the chunks were spread over the workers
+                    for end_offset, n_rows, n_rejected, version, payload in results:
+                        if checkpoint['artifact_version'] is None:
+                            checkpoint['artifact_version'] = version
+                        elif version != checkpoint['artifact_version']:
+                            raise ValueError(
+                                f"The {self.dataset_name} model artifacts changed during the run; "
+                                f"rerun without --resume to score every row with the same model"
+                            )
+                        if output_format == 'csv':
+                            outputs[0].write(payload)
+                        else:
+                            for output, column in zip(outputs, OUTPUT_COLUMNS):
+                                codes, values = payload[column]
+                                dictionary = dictionaries[column]
+                                for value in values:
+                                    dictionary.setdefault(value, len(dictionary))
+                                remap = np.array([dictionary[value] for value in values], dtype=np.int32)
+                                output.write(remap[codes].tobytes())
+                        for output in outputs:
+                            output.flush()
+                            os.fsync(output.fileno())
+
+                        checkpoint['input_offset'] = end_offset
+                        checkpoint['rows'] += n_rows
+                        checkpoint['rejected'] += n_rejected
+                        if output_format == 'csv':
+                            checkpoint['output_bytes'] = outputs[0].tell()
+                        else:
+                            checkpoint['categories'] = {column: list(dictionaries[column]) for column in OUTPUT_COLUMNS}
+                        self._save_checkpoint(checkpoint, checkpoint_path)
+                        if time.perf_counter() - last_report >= self.config.progress_seconds:
+                            self._report(checkpoint, start_rows, start_offset, start_time)
+                            last_report = time.perf_counter()
+            finally:
+                for output in outputs:
+                    output.close()
+
+            if output_format == 'columnar':
+                manifest = {
+                    'source_path': input_path,
+                    'n_rows': checkpoint['rows'],
+                    'columns': [
+                        {'name': column, 'file': f"{index:04d}.bin", 'dtype': 'int32', 'categories': checkpoint['categories'][column]}
+                        for index, column in enumerate(OUTPUT_COLUMNS)
+                    ],
+                    'scoring': {'dataset': self.dataset_name, 'artifact_version': checkpoint['artifact_version']},
+                }
+                with open(os.path.join(work_path, MANIFEST_FILE), 'w') as f:
+                    json.dump(manifest, f, indent=2)
+                shutil.rmtree(output_path, ignore_errors=True)
+            os.replace(work_path, output_path)
+            os.remove(checkpoint_path)
+
+            rate = self._report(checkpoint, start_rows, start_offset, start_time, final=True)
+            return {
+                'dataset': self.dataset_name,
+                'output': output_path,
+                'rows': checkpoint['rows'],
+                'rejected': checkpoint['rejected'],
+                'resumed_at_row': start_rows,
+                'seconds': time.perf_counter() - start_time,
+                'rows_per_second': rate,
+                'artifact_version': checkpoint['artifact_version'],
+            }
+        except Exception as e:
+            logging.error(f"Bulk scoring of {input_path} failed: {e}")
+            raise CustomException(e, sys)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='app.py --bulk', description="Score a CSV file of readings with a trained model")
+    parser.add_argument('input_file')
+    parser.add_argument('--dataset', required=True, choices=sorted(FEATURE_COLUMNS))
+    parser.add_argument('--output', help="output file (CSV) or directory (columnar); defaults to <input>.predictions")
+    parser.add_argument('--format', default='csv', choices=['csv', 'columnar'])
+    parser.add_argument('--resume', action='store_true', help="continue from the checkpoint of an interrupted run")
+    parser.add_argument('--chunk-rows', type=int)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    overrides = {key: value for key, value in (('chunk_rows', args.chunk_rows), ('n_workers', args.workers)) if value is not None}
+    output = args.output or f"{os.path.splitext(args.input_file)[0]}.predictions{'.csv' if args.format == 'csv' else ''}"
+    summary = BulkScorer(args.dataset, replace(BulkScoringConfig(), **overrides)).score_file(
+        args.input_file, output, args.format, args.resume
+    )
+    print(json.dumps(summary, indent=2))
+    return summary
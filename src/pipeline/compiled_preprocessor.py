@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+from sklearn.tree import DecisionTreeClassifier, ExtraTreeClassifier
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier
+
+from src.logger import logging
+
+class CompiledPreprocessor:
+    '''
+    NumPy-only replacement for a fitted ColumnTransformer made of
+    SimpleImputer / PolynomialFeatures / StandardScaler pipelines.
+    Takes a matrix with columns in feature_columns order and returns the model input.
+    Arithmetic is float64 like sklearn; dtype only sets the output, so a float32 model input
+    equals the sklearn output cast to float32.
+    '''
+    def __init__(self, preprocessor, feature_columns, tolerance=1e-9, dtype=np.float64):
+        self.feature_columns = list(feature_columns)
+        self.tolerance = tolerance
+        self.dtype = np.dtype(dtype)
+        self.blocks = []
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str):
+                if transformer == 'drop':
+                    continue
+                raise ValueError(f"Unsupported transformer '{transformer}' in block {name}")
+
+            steps = transformer.steps if isinstance(transformer, Pipeline) else [(name, transformer)]
+            block = {'columns': self._column_indices(columns, preprocessor), 'ops': []}
+            for step_name, step in steps:
+                block['ops'].append(self._compile_step(step_name, step))
+            self.blocks.append(block)
+
+        if not self.blocks:
+            raise ValueError("Preprocessor has no transformers to compile")
+
+        self.n_features_out = sum(self._block_width(block) for block in self.blocks)
+        self.verify(preprocessor)
+
+    def _column_indices(self, columns, preprocessor):
+        '''Resolve the block's column selection to positions in feature_columns'''
+        if isinstance(columns, slice) or np.asarray(columns).dtype == bool:
+            columns = list(np.asarray(preprocessor.feature_names_in_)[columns])
+        indices = []
+        for col in columns:
+            if isinstance(col, (int, np.integer)):
+                col = preprocessor.feature_names_in_[col]
+            if col not in self.feature_columns:
+                raise ValueError(f"Column '{col}' is not one of the predictor features")
+            indices.append(self.feature_columns.index(col))
+        return np.asarray(indices, dtype=np.intp)
+
+    @staticmethod
+    def _compile_step(step_name, step):
+        '''Pull the fitted statistics of one pipeline step into contiguous arrays'''
+        if isinstance(step, SimpleImputer):
+            statistics = np.asarray(step.statistics_, dtype=np.float64)
+            if not (isinstance(step.missing_values, float) and np.isnan(step.missing_values)):
+                raise ValueError(f"Step {step_name}: only NaN missing_values are supported")
+            if np.isnan(statistics).any() or getattr(step, 'add_indicator', False):
+                raise ValueError(f"Step {step_name}: empty features and indicators are not supported")
+            return ('impute', np.ascontiguousarray(statistics))
+        if isinstance(step, PolynomialFeatures):
+            return ('poly', np.ascontiguousarray(step.powers_, dtype=np.int64))
+        if isinstance(step, StandardScaler):
+            mean = None if step.mean_ is None or not step.with_mean else np.ascontiguousarray(step.mean_, dtype=np.float64)
+            scale = None if step.scale_ is None or not step.with_std else np.ascontiguousarray(step.scale_, dtype=np.float64)
+            return ('scale', (mean, scale))
+        raise ValueError(f"Step {step_name}: unsupported transformer {type(step).__name__}")
+
+    @staticmethod
+    def _block_width(block):
+        width = len(block['columns'])
+        for op, params in block['ops']:
+            if op == 'poly':
+                width = params.shape[0]
+        return width
+
+    @staticmethod
+    def _apply_block(X, block):
+        Z = X[:, block['columns']]
+        for op, params in block['ops']:
+            if op == 'impute':
+                Z = np.where(np.isnan(Z), params, Z)
+            elif op == 'poly':
+                # Each output column is prod(x_j ** p_j); x**0 and x**1 are exact so this matches sklearn
+                Z = np.prod(np.power(Z[:, None, :], params[None, :, :]), axis=2)
+            else:
+                mean, scale = params
+                if mean is not None:
+                    Z = Z - mean
+                if scale is not None:
+                    Z = Z / scale
+        return Z
+
+    def _transform64(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(self.blocks) == 1:
+            return self._apply_block(X, self.blocks[0])
+        return np.hstack([self._apply_block(X, block) for block in self.blocks])
+
+    def transform(self, X):
+        '''X: (n, n_features) array or single feature vector in feature_columns order'''
+        return self._transform64(X).astype(self.dtype, copy=False)
+
+    def max_abs_error(self, preprocessor, X):
+        '''Largest absolute difference between this path and preprocessor.transform on X'''
+        X = np.asarray(X, dtype=np.float64)
+        expected = preprocessor.transform(pd.DataFrame(X, columns=self.feature_columns))
+        # Compared before the output cast, which is the same for both paths
+        return float(np.max(np.abs(np.asarray(expected) - self._transform64(X)))) if len(X) else 0.0
+
+    def verify(self, preprocessor, X=None):
+        '''Check the compiled path against the fitted preprocessor, raising if outside tolerance'''
+        if X is None:
+            X = self._probe_rows()
+        error = self.max_abs_error(preprocessor, X)
+        if error > self.tolerance:
+            raise ValueError(f"Compiled preprocessor differs from the fitted one by {error:.3g}")
+        return error
+
+    def _probe_rows(self):
+        '''Rows around the imputer medians plus an all-missing row'''
+        center = np.ones(len(self.feature_columns))
+        for block in self.blocks:
+            for op, params in block['ops']:
+                if op == 'impute':
+                    center[block['columns']] = params
+        return np.vstack([
+            center,
+            center * 1.5 + 1.0,
+            -center * 0.5,
+            np.full(len(self.feature_columns), np.nan),
+        ])
+
+def model_input_dtype(model):
+    '''float32 for sklearn tree models, which cast their input to float32 anyway; float64 otherwise'''
+    if isinstance(model, (DecisionTreeClassifier, ExtraTreeClassifier, RandomForestClassifier,
+                          ExtraTreesClassifier, GradientBoostingClassifier)):
+        return np.float32
+    return np.float64
+
+def compile_preprocessor(preprocessor, feature_columns, dtype=np.float64):
+    '''Returns a CompiledPreprocessor, or None when the preprocessor cannot be compiled'''
+    try:
+        return CompiledPreprocessor(preprocessor, feature_columns, dtype=dtype)
+    except Exception as e:
+        logging.warning(f"Falling back to the sklearn preprocessor: {e}")
+        return None
@@ -0,0 +1,214 @@
+import bisect
+import threading
+
+class Histogram:
+    '''Fixed-bucket histogram; bucket bounds are upper limits (le) as in Prometheus'''
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        '''Cumulative counts per bucket plus sum and count'''
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + [float('inf')], counts):
+            running += count
+            cumulative['+Inf' if bound == float('inf') else str(bound)] = running
+        return {'buckets': cumulative, 'sum': total, 'count': running}
+
+# Latency buckets in seconds, from 100 µs up to 10 s
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    value = float(value)
+    if value == float('inf'):
+        return '+Inf'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def histogram_samples(snapshot, labels=()):
+    '''(suffix, labels, value) samples of a Histogram snapshot in the Prometheus layout'''
+    samples = [
+        ('_bucket', tuple(labels) + (('le', bound),), count)
+        for bound, count in snapshot['buckets'].items()
+    ]
+    samples.append(('_sum', tuple(labels), snapshot['sum']))
+    samples.append(('_count', tuple(labels), snapshot['count']))
+    return samples
+
+class _Metric:
+    def __init__(self, registry, name, kind, help_text, labelnames):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+
+class Counter(_Metric):
+    def inc(self, labels=(), amount=1.0):
+        shard = self.registry._shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+class Gauge(Counter):
+    '''Summed over threads, so a thread that adds must also subtract (e.g. in-flight requests)'''
+    def add(self, labels=(), amount=1.0):
+        self.inc(labels, amount)
+
+class ShardedHistogram(_Metric):
+    def __init__(self, registry, name, help_text, labelnames, buckets):
+        super().__init__(registry, name, 'histogram', help_text, labelnames)
+        self.buckets = sorted(buckets)
+
+    def observe(self, labels, value):
+        shard = self.registry._shard()
+        key = (self.name, labels)
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum
+            counts = shard[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+class MetricsRegistry:
+    '''
+    Counters, gauges and histograms kept in one shard per thread. A thread only ever writes to
+    its own shard, so recording takes no lock and threads never contend; shards are summed when
+    the metrics are rendered. Shards of finished threads are folded into one retired shard.
+    Collectors add values computed at scrape time (e.g. cache statistics).
+    '''
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, shard) of every live recording thread
+        self._retired = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(self, name, 'counter', help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(self, name, 'gauge', help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(ShardedHistogram(self, name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def register_collector(self, collector):
+        '''collector() returns [(name, kind, help, [(suffix, labels, value), ...]), ...]'''
+        self._collectors.append(collector)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_finished_threads()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _retire_finished_threads(self):
+        '''Fold the shards of threads that have exited into the retired shard; caller holds the lock'''
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self._retired, list(shard.items()))
+        self._shards = live
+
+    @staticmethod
+    def _merge(total, items):
+        for key, value in items:
+            if isinstance(value, list):
+                counts = total.get(key)
+                if counts is None:
+                    total[key] = list(value)
+                else:
+                    for i, count in enumerate(value):
+                        counts[i] += count
+            else:
+                total[key] = total.get(key, 0.0) + value
+
+    def collect(self):
+        '''Sum of every shard, {(name, label values): value or histogram slots}'''
+        with self._lock:
+            self._retire_finished_threads()
+            total = {}
+            self._merge(total, list(self._retired.items()))
+            for _, shard in self._shards:
+                # Another thread may be adding keys; copying the items is atomic under the GIL
+                self._merge(total, [(key, list(value) if isinstance(value, list) else value)
+                                    for key, value in list(shard.items())])
+        return total
+
+    def render(self):
+        '''Every metric in the Prometheus text exposition format'''
+        values = self.collect()
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in sorted(by_name.get(metric.name, []), key=lambda item: item[0]):
+                named = tuple(zip(metric.labelnames, labels))
+                if metric.kind != 'histogram':
+                    lines.append(f"{metric.name}{_format_labels(named)} {_format_value(value)}")
+                    continue
+                running = 0
+                for bound, count in zip(metric.buckets + [float('inf')], value[:-1]):
+                    running += count
+                    bucket_labels = named + (('le', _format_value(float(bound))),)
+                    lines.append(f"{metric.name}_bucket{_format_labels(bucket_labels)} {running}")
+                lines.append(f"{metric.name}_sum{_format_labels(named)} {_format_value(value[-1])}")
+                lines.append(f"{metric.name}_count{_format_labels(named)} {running}")
+
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for suffix, labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry served by the /metrics endpoint
+REGISTRY = MetricsRegistry()
+
+# Time spent in each stage of run_batch_prediction, per dataset
+prediction_stage_seconds = REGISTRY.histogram(
+    'prediction_stage_seconds', 'Time spent in each prediction stage', ('dataset', 'stage')
+)
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.metrics import Histogram
+
+@dataclass
+class MicroBatcherConfig:
+    # 0 disables coalescing and every request calls the predictor directly
+    max_wait_ms: float = float(os.environ.get('MICRO_BATCH_WINDOW_MS', 0))
+    max_batch_size: int = int(os.environ.get('MICRO_BATCH_SIZE', 64))
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+QUEUE_WAIT_MS_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100]
+
+class MicroBatcher:
+    '''
+    Coalesces concurrent single-sample requests for one dataset into one predict_batch call.
+    A batch is dispatched when it reaches max_batch_size, when max_wait_ms has passed since
+    its first request arrived, or as soon as every caller currently waiting is in it.
+    '''
+    def __init__(self, predict_batch, max_batch_size=None, max_wait_ms=None, name=''):
+        config = MicroBatcherConfig()
+        self.predict_batch = predict_batch
+        self.max_batch_size = config.max_batch_size if max_batch_size is None else max_batch_size
+        self.max_wait = (config.max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000.0
+        self.name = name
+
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_MS_BUCKETS)
+
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._pid = None
+        self._queue = None
+
+    def _ensure_worker(self):
+        '''Start the dispatch thread on first use, and again in a process forked after that'''
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            thread = threading.Thread(target=self._run, name=f"micro-batcher-{self.name}", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, row, timeout=None):
+        '''Queue one sample and block until its label is ready'''
+        self._ensure_worker()
+        future = Future()
+        with self._lock:
+            self._inflight += 1
+        try:
+            self._queue.put((row, future, time.perf_counter()))
+            return future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Requests that queued up while the previous batch ran are taken without waiting
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # Nobody else is waiting, so holding the batch open would only add latency
+            if len(batch) >= self._inflight:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            dispatched_at = time.perf_counter()
+            self.batch_size_histogram.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                self.queue_wait_histogram.observe((dispatched_at - enqueued_at) * 1000)
+
+            try:
+                predictions, errors = self.predict_batch([row for row, _, _ in batch])
+            except Exception as e:
+                logging.error(f"Micro-batch of {len(batch)} {self.name} samples failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            row_errors = {error['index']: error['message'] for error in errors}
+            for i, (_, future, _) in enumerate(batch):
+                if i in row_errors:
+                    future.set_exception(CustomException(row_errors[i], sys))
+                else:
+                    future.set_result(predictions[i])
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'queue_wait_ms': self.queue_wait_histogram.snapshot(),
+        }
@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import estimate_object_size, artifact_version
+from src.pipeline.prediction_cache import CachedPredictor
+from src.pipeline.metrics import REGISTRY
+
+@dataclass
+class ModelRegistryConfig:
+    # 0 means no limit; otherwise least-recently-used predictors are evicted above this size
+    memory_budget_mb: float = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+    # Comma separated datasets to load up front, or "all"
+    preload: str = os.environ.get('PRELOAD_MODELS', '')
+    # How often a resident predictor checks whether its artifact files changed on disk
+    artifact_check_seconds: float = float(os.environ.get('ARTIFACT_CHECK_SECONDS', 5))
+
+def _load_milk():
+    from src.pipeline.predict_pipeline import Predictor
+    return Predictor(dataset_name='milk')
+
+def _load_water():
+    from src.pipeline.water_predict_pipeline import WaterPredictor
+    return WaterPredictor()
+
+def _load_wine():
+    from src.pipeline.wine_predict_pipeline import WinePredictor
+    return WinePredictor()
+
+model_load_seconds = REGISTRY.histogram(
+    'model_load_seconds', 'Time to load a predictor from its artifacts', ('dataset',),
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+)
+
+DEFAULT_LOADERS = {
+    'milk': _load_milk,
+    'water': _load_water,
+    'wine': _load_wine,
+}
+
+class ModelRegistry:
+    '''
+    Loads predictors on first use and keeps their total resident size under a memory budget.
+    Predictors whose artifact files change on disk are reloaded, and when a prediction cache
+    is given every predictor is served through it.
+    '''
+    def __init__(self, loaders=None, memory_budget_mb=None, prediction_cache=None):
+        self.config = ModelRegistryConfig()
+        self.loaders = dict(loaders or DEFAULT_LOADERS)
+        self.prediction_cache = prediction_cache
+        budget = self.config.memory_budget_mb if memory_budget_mb is None else memory_budget_mb
+        self.memory_budget_bytes = int(budget * 1024 * 1024)
+
+        self._entries = OrderedDict()  # dataset -> entry dict, least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.loaders}
+        self.evictions = 0
+
+    def get(self, dataset_name):
+        '''Return the predictor for dataset_name, loading it if it is not resident'''
+        dataset_name = dataset_name.lower()
+        if dataset_name not in self.loaders:
+            raise CustomException(f"Unsupported dataset: {dataset_name}", sys)
+
+        entry = self._touch(dataset_name)
+        if entry is not None and not self._artifacts_changed(entry):
+            return entry['predictor']
+
+        # Only one thread loads a given dataset; the others wait and reuse its result
+        with self._load_locks[dataset_name]:
+            entry = self._touch(dataset_name)
+            if entry is not None and not self._artifacts_changed(entry):
+                return entry['predictor']
+            return self._load(dataset_name)
+
+    def _artifacts_changed(self, entry):
+        '''Re-stat the artifact files at most once per artifact_check_seconds'''
+        now = time.monotonic()
+        if entry['stale'] or now - entry['checked_at'] < self.config.artifact_check_seconds:
+            return entry['stale']
+        entry['checked_at'] = now
+        paths = getattr(entry['predictor'], 'artifact_paths', None)
+        if paths and artifact_version(paths) != entry['artifact_version']:
+            logging.info(f"Artifacts of {entry['dataset_name']} changed on disk, reloading")
+            entry['stale'] = True
+        return entry['stale']
+
+    def _touch(self, dataset_name):
+        with self._lock:
+            entry = self._entries.get(dataset_name)
+            if entry is not None:
+                self._entries.move_to_end(dataset_name)
+                entry['hits'] += 1
+                entry['last_used'] = time.time()
+            return entry
+
+    def _load(self, dataset_name):
+        start_time = time.perf_counter()
+        predictor = self.loaders[dataset_name]()
+        load_seconds = time.perf_counter() - start_time
+        model_load_seconds.observe((dataset_name,), load_seconds)
+        size_bytes = estimate_object_size(predictor)
+        logging.info(f"Loaded {dataset_name} predictor in {load_seconds:.3f}s ({size_bytes / 1e6:.2f} MB)")
+
+        version = getattr(predictor, 'artifact_version', None)
+        if self.prediction_cache is not None:
+            # Entries computed with older artifacts can never be hit again
+            self.prediction_cache.invalidate(dataset_name, keep_version=version)
+            predictor = CachedPredictor(predictor, self.prediction_cache)
+
+        with self._lock:
+            self._entries[dataset_name] = {
+                'dataset_name': dataset_name,
+                'predictor': predictor,
+                'artifact_version': version,
+                'checked_at': time.monotonic(),
+                'stale': False,
+                'size_bytes': size_bytes,
+                'load_seconds': load_seconds,
+                'loaded_at': time.time(),
+                'last_used': time.time(),
+                'hits': 0,
+            }
+            self._evict_over_budget(keep=dataset_name)
+        return predictor
+
+    def _evict_over_budget(self, keep):
+        '''Drop least-recently-used predictors until the budget is met; caller holds the lock'''
+        if self.memory_budget_bytes <= 0:
+            return
+        for name in list(self._entries):
+            if self.resident_bytes() <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            del self._entries[name]
+            self.evictions += 1
+            logging.info(f"Evicted {name} predictor to stay within the model memory budget")
+
+    def resident_bytes(self):
+        return sum(entry['size_bytes'] for entry in self._entries.values())
+
+    def preload(self, dataset_names=None):
+        '''Load the given datasets (default: the configured PRELOAD_MODELS) ahead of traffic'''
+        if dataset_names is None:
+            dataset_names = self.config.preload
+        if isinstance(dataset_names, str):
+            dataset_names = list(self.loaders) if dataset_names.strip() == 'all' else \
+                [name.strip() for name in dataset_names.split(',') if name.strip()]
+        for dataset_name in dataset_names:
+            self.get(dataset_name)
+
+    def evict(self, dataset_name):
+        with self._lock:
+            if self._entries.pop(dataset_name.lower(), None) is not None:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_budget_mb': self.memory_budget_bytes / (1024 * 1024),
+                'resident_mb': self.resident_bytes() / (1024 * 1024),
+                'evictions': self.evictions,
+                'prediction_cache': self.prediction_cache.stats() if self.prediction_cache is not None else None,
+                'models': {
+                    name: {
+                        'artifact_version': entry['artifact_version'],
+                        'size_mb': entry['size_bytes'] / (1024 * 1024),
+                        'load_seconds': entry['load_seconds'],
+                        'hits': entry['hits'],
+                        'last_used': entry['last_used'],
+                    }
+                    for name, entry in self._entries.items()
+                },
+            }
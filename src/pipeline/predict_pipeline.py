@@ -1,30 +1,43 @@
 import os
 import sys
-import numpy as np
-import pandas as pd
-from src.utils import load_object
+from src.utils import load_object, artifact_version, served_model_path
 from src.exception import CustomException
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS, run_batch_prediction
+from src.pipeline.compiled_preprocessor import compile_preprocessor, model_input_dtype
+from src.pipeline.tree_engine import compile_model
 
 class Predictor:
     def __init__(self, dataset_name='milk'):
         self.dataset_name = dataset_name.lower()
         if self.dataset_name == 'milk':
-            self.model_path = os.path.join('artifact', 'milk_model.pkl')
+            self.model_path = served_model_path(os.path.join('artifact', 'milk_model.pkl'))
             self.preprocessor_path = os.path.join('artifact', 'milk_preprocessor.pkl')
             self.quality_mapping = {0: 'bad', 1: 'medium', 2: 'good'}
         elif self.dataset_name == 'wine':
-            self.model_path = os.path.join('artifact', 'wine_model.pkl')
+            self.model_path = served_model_path(os.path.join('artifact', 'wine_model.pkl'))
             self.preprocessor_path = os.path.join('artifact', 'wine_preprocessor.pkl')
             self.quality_mapping = {0: 'bad', 1: 'medium', 2: 'good'}
         elif self.dataset_name == 'water':
-            self.model_path = os.path.join('artifact', 'water_model.pkl')
+            self.model_path = served_model_path(os.path.join('artifact', 'water_model.pkl'))
             self.preprocessor_path = os.path.join('artifact', 'water_preprocessor.pkl')
             self.quality_mapping = {0: 'bad', 1: 'good'}  # Assuming water quality is binary
         else:
             raise CustomException(f"Unsupported dataset: {self.dataset_name}", sys)
 
+        self.feature_columns = FEATURE_COLUMNS[self.dataset_name]
+        self.artifact_paths = [self.model_path, self.preprocessor_path]
+        self.artifact_version = artifact_version(self.artifact_paths)
         self.model = load_object(self.model_path)
         self.preprocessor = load_object(self.preprocessor_path)
+        self.compiled_preprocessor = compile_preprocessor(
+            self.preprocessor, self.feature_columns, dtype=model_input_dtype(self.model)
+        )
+        # Array-backed copy of tree ensembles for low-latency predict; None for other models
+        self.compiled_model = compile_model(self.model)
+
+    def decode_predictions(self, prediction):
+        """Map raw model outputs to quality labels"""
+        return [self.quality_mapping.get(value, "Unknown") for value in prediction]
 
     def predict(self, input_data: dict):
         """
@@ -32,19 +45,22 @@ class Predictor:
         Returns predicted quality label (good, medium, bad)
         """
         try:
-            # Convert input_data dict to DataFrame
-            input_df = pd.DataFrame([input_data])
-
-            # Preprocess input features
-            input_processed = self.preprocessor.transform(input_df)
+            predictions, errors = run_batch_prediction(self, [input_data])
+            if errors:
+                raise ValueError(errors[0]['message'])
 
-            # Predict
-            prediction = self.model.predict(input_processed)
+            return predictions[0]
 
-            # Map prediction to quality label
-            quality_label = self.quality_mapping.get(prediction[0], "Unknown")
-
-            return quality_label
+        except Exception as e:
+            raise CustomException(e, sys)
 
+    def predict_batch(self, input_data):
+        """
+        input_data: list of dicts of feature_name: value, or 2D array with columns in feature_columns order
+        Returns (list of quality labels in input order, list of per-row errors);
+        rejected rows get None as their label
+        """
+        try:
+            return run_batch_prediction(self, input_data)
         except Exception as e:
             raise CustomException(e, sys)
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+
+from src.exception import CustomException
+from src.pipeline.batch_pipeline import prepare_batch
+from src.pipeline.request_trace import trace_event
+from src.pipeline.metrics import prediction_stage_seconds
+
+@dataclass
+class PredictionCacheConfig:
+    # 0 disables the cache
+    max_entries: int = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+    ttl_seconds: float = float(os.environ.get('PREDICTION_CACHE_TTL', 600))
+    # Feature values are rounded to this many decimals before building the key
+    decimals: int = int(os.environ.get('PREDICTION_CACHE_DECIMALS', 6))
+
+class PredictionCache:
+    '''LRU + TTL cache of predicted labels keyed on (dataset, artifact version, quantized features)'''
+    def __init__(self, max_entries=None, ttl_seconds=None, decimals=None):
+        config = PredictionCacheConfig()
+        self.max_entries = config.max_entries if max_entries is None else max_entries
+        self.ttl_seconds = config.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.decimals = config.decimals if decimals is None else decimals
+
+        self._entries = OrderedDict()  # key -> (label, expires_at), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_keys(self, dataset_name, version, X):
+        '''One key per row of the feature matrix X'''
+        # Adding 0.0 folds -0.0 into 0.0 so both hash the same
+        quantized = np.ascontiguousarray(np.round(X, self.decimals) + 0.0)
+        return [(dataset_name, version, row.tobytes()) for row in quantized]
+
+    def get_many(self, keys):
+        '''Returns the cached label for each key, or None on a miss'''
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results.append(entry[0])
+        return results
+
+    def put_many(self, keys, labels):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, label in zip(keys, labels):
+                self._entries[key] = (label, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, dataset_name=None, keep_version=None):
+        '''Drop entries of one dataset (or all), optionally keeping those of its current version'''
+        with self._lock:
+            for key in list(self._entries):
+                if dataset_name is None or (key[0] == dataset_name and key[1] != keep_version):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+class CachedPredictor:
+    '''Answers repeat queries from a PredictionCache and sends only the misses to the predictor'''
+    def __init__(self, predictor, cache):
+        self.predictor = predictor
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+    def predict(self, input_data: dict):
+        predictions, errors = self.predict_batch([input_data])
+        if errors:
+            raise CustomException(errors[0]['message'], sys)
+        return predictions[0]
+
+    def predict_batch(self, input_data):
+        try:
+            start = time.perf_counter()
+            X, valid_index, errors = prepare_batch(input_data, self.predictor.feature_columns)
+            predictions = [None] * (len(valid_index) + len(errors))
+            if not valid_index:
+                return predictions, errors
+
+            keys = self.cache.make_keys(self.predictor.dataset_name, self.predictor.artifact_version, X)
+            cached = self.cache.get_many(keys)
+            missing = [i for i, label in enumerate(cached) if label is None]
+            # Validation plus key building and lookup; the misses then go through the full pipeline
+            prediction_stage_seconds.observe(
+                (self.predictor.dataset_name, 'cache_lookup'), time.perf_counter() - start
+            )
+            trace_event('cache', {'hits': len(cached) - len(missing), 'misses': len(missing)})
+
+            if missing:
+                labels, _ = self.predictor.predict_batch(X[missing])
+                self.cache.put_many([keys[i] for i in missing], labels)
+                for i, label in zip(missing, labels):
+                    cached[i] = label
+
+            for i, label in zip(valid_index, cached):
+                predictions[i] = label
+            return predictions, errors
+        except Exception as e:
+            raise CustomException(e, sys)
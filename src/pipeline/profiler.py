@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import hmac
+import marshal
+import pstats
+import cProfile
+import itertools
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging, PROJECT_ROOT
+
+@dataclass
+class ProfilerConfig:
+    # Profiling endpoints and request hooks exist only when a token is set
+    admin_token: str = os.environ.get('PROFILER_ADMIN_TOKEN', '')
+    sample_interval_ms: float = float(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS', 5))
+    max_seconds: float = float(os.environ.get('PROFILER_MAX_SECONDS', 300))
+    # Finished captures kept in memory for download
+    results_kept: int = int(os.environ.get('PROFILER_RESULTS_KEPT', 3))
+
+MODES = ('sampling', 'cprofile')
+
+def _frame_key(code):
+    '''pstats function key: (file, first line, name)'''
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _frame_label(key):
+    filename, line, name = key
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    return f"{name} ({filename}:{line})"
+
+class ProfileCapture:
+    '''
+    One capture over the requests that match its route or dataset. It ends after `seconds` or
+    once `max_requests` matching requests have finished, whichever comes first.
+    - sampling: a background thread records the stack of every thread that is handling a
+      matching request every sample_interval seconds
+    - cprofile: every matching request runs under its own cProfile.Profile and the results are
+      summed; gives exact call counts but slows the profiled requests down
+    '''
+    def __init__(self, capture_id, mode='sampling', seconds=30, max_requests=None, route=None, dataset=None,
+                 sample_interval=0.005):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {MODES}")
+        self.capture_id = capture_id
+        self.mode = mode
+        self.seconds = seconds
+        self.max_requests = max_requests
+        self.route = route
+        self.dataset = dataset
+        self.sample_interval = sample_interval
+
+        self.started_at = time.time()
+        self.ended_at = None
+        self.deadline = time.monotonic() + seconds
+        self.requests_started = 0
+        self.requests_profiled = 0
+        self.samples = Counter()  # stack (outermost frame first) -> number of samples
+        self.n_samples = 0
+        self.stats = None
+        self.done = threading.Event()
+
+        self._lock = threading.Lock()
+        self._threads = Counter()  # thread id -> matching requests it is handling
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{capture_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def matches(self, route, dataset):
+        return (self.route is None or self.route == route) and (self.dataset is None or self.dataset == dataset)
+
+    def begin_request(self, route, dataset):
+        '''Called when a request starts; returns a token for end_request, or None if it is not profiled'''
+        if self.done.is_set() or not self.matches(route, dataset):
+            return None
+        with self._lock:
+            if self.max_requests is not None and self.requests_started >= self.max_requests:
+                return None
+            self.requests_started += 1
+            if self.mode == 'sampling':
+                self._threads[threading.get_ident()] += 1
+                return (self, None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this interpreter (cProfile is process-wide from Python 3.12)
+            with self._lock:
+                self.requests_started -= 1
+            return None
+        return (self, profile)
+
+    def end_request(self, token):
+        _, profile = token
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            self.requests_profiled += 1
+            if profile is None:
+                thread_id = threading.get_ident()
+                self._threads[thread_id] -= 1
+                if self._threads[thread_id] <= 0:
+                    del self._threads[thread_id]
+            elif self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def _finished(self):
+        if time.monotonic() >= self.deadline:
+            return True
+        with self._lock:
+            return (self.max_requests is not None and self.requests_profiled >= self.max_requests
+                    and not self._threads)
+
+    def _run(self):
+        interval = self.sample_interval if self.mode == 'sampling' else 0.1
+        while not self._finished():
+            time.sleep(interval)
+            if self.mode == 'sampling':
+                self._sample()
+        self.ended_at = time.time()
+        self.done.set()
+        logging.info(
+            f"Profile {self.capture_id} ({self.mode}) finished: {self.requests_profiled} requests, {self.n_samples} samples"
+        )
+
+    def _sample(self):
+        with self._lock:
+            thread_ids = list(self._threads)
+        if not thread_ids:
+            return
+        frames = sys._current_frames()
+        for thread_id in thread_ids:
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+                self.n_samples += 1
+
+    def stop(self):
+        self.deadline = time.monotonic()
+        self.done.wait(timeout=5)
+
+    def collapsed_stacks(self):
+        '''Stacks in the folded format read by flamegraph.pl and speedscope: "outer;...;inner count"'''
+        if self.mode != 'sampling':
+            raise ValueError("Collapsed stacks need a sampling capture; cProfile does not record full stacks")
+        return ''.join(
+            ';'.join(_frame_label(key) for key in stack) + f" {count}\n"
+            for stack, count in sorted(self.samples.items())
+        )
+
+    def pstats_bytes(self):
+        '''Marshalled pstats data, as written by Stats.dump_stats and read by pstats.Stats or snakeviz'''
+        if self.mode == 'cprofile':
+            return marshal.dumps(self.stats.stats if self.stats is not None else {})
+        return marshal.dumps(self._sampled_stats())
+
+    def _sampled_stats(self):
+        '''
+        pstats table estimated from the samples: a sample counts as one call and sample_interval
+        seconds, so times are statistical and call counts are sample counts
+        '''
+        stats = {}
+        for stack, count in self.samples.items():
+            seconds = count * self.sample_interval
+            # Recursive functions count once per sample towards their cumulative time
+            for key in set(stack):
+                cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+                stats[key] = (cc + count, nc + count, tt, ct + seconds, callers)
+            leaf = stack[-1]
+            cc, nc, tt, ct, callers = stats[leaf]
+            stats[leaf] = (cc, nc, tt + seconds, ct, callers)
+            for caller, callee in zip(stack, stack[1:]):
+                callers = stats[callee][4]
+                c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c_cc + count, c_nc + count, c_tt, c_ct + seconds)
+        return stats
+
+    def summary(self):
+        return {
+            'id': self.capture_id,
+            'mode': self.mode,
+            'route': self.route,
+            'dataset': self.dataset,
+            'seconds': self.seconds,
+            'max_requests': self.max_requests,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
+            'running': not self.done.is_set(),
+            'requests_profiled': self.requests_profiled,
+            'samples': self.n_samples,
+        }
+
+class RequestProfiler:
+    '''
+    Runs at most one ProfileCapture at a time and keeps the last few results. The web app checks
+    `capture` once per request; with no token configured it installs no hooks at all.
+    '''
+    def __init__(self, admin_token=None):
+        self.config = ProfilerConfig()
+        self.admin_token = self.config.admin_token if admin_token is None else admin_token
+        self.capture = None
+        self.results = deque(maxlen=max(self.config.results_kept, 1))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.admin_token)
+
+    def authorized(self, token):
+        return self.enabled and token is not None and hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def start(self, mode='sampling', seconds=None, max_requests=None, route=None, dataset=None):
+        '''Start a capture; raises CustomException when one is already running'''
+        seconds = self.config.max_seconds if seconds is None else min(float(seconds), self.config.max_seconds)
+        if seconds <= 0 or (max_requests is not None and int(max_requests) <= 0):
+            raise CustomException("seconds and requests must be positive", sys)
+        with self._lock:
+            if self.capture is not None and not self.capture.done.is_set():
+                raise CustomException(f"Profile {self.capture.capture_id} is still running", sys)
+            capture = ProfileCapture(
+                next(self._ids), mode=mode, seconds=seconds,
+                max_requests=int(max_requests) if max_requests is not None else None,
+                route=route, dataset=dataset, sample_interval=self.config.sample_interval_ms / 1000.0
+            )
+            self.results.append(capture)
+            # Published last, once the capture is complete, since request threads read it without the lock
+            self.capture = capture.start()
+        logging.info(f"Profile {capture.capture_id} started: {capture.summary()}")
+        return capture
+
+    def begin_request(self, route, dataset):
+        capture = self.capture
+        if capture is None:
+            return None
+        if capture.done.is_set():
+            self.capture = None
+            return None
+        return capture.begin_request(route, dataset)
+
+    def stop(self):
+        capture = self.capture
+        if capture is not None:
+            capture.stop()
+            self.capture = None
+        return capture
+
+    def get(self, capture_id):
+        for capture in self.results:
+            if capture.capture_id == capture_id:
+                return capture
+        return None
+
+    def status(self):
+        return {
+            'running': self.capture.summary() if self.capture is not None and not self.capture.done.is_set() else None,
+            'captures': [capture.summary() for capture in self.results],
+        }
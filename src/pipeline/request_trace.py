@@ -0,0 +1,53 @@
+import time
+import contextvars
+import numpy as np
+
+# Per-request list of (stage, timestamp, value); None when the request is not traced
+_trace_buffer = contextvars.ContextVar('request_trace', default=None)
+
+def start_trace():
+    '''Start recording stage events for the current context; returns a token for end_trace'''
+    return _trace_buffer.set([])
+
+def end_trace(token):
+    '''Stop recording and return the raw events'''
+    events = _trace_buffer.get()
+    _trace_buffer.reset(token)
+    return events or []
+
+def is_tracing():
+    return _trace_buffer.get() is not None
+
+def trace_event(stage, value):
+    '''Record a stage value by reference; costs one contextvar lookup when tracing is off'''
+    buffer = _trace_buffer.get()
+    if buffer is not None:
+        buffer.append((stage, time.perf_counter(), value))
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    return value
+
+def format_trace(events):
+    '''Render events as JSON-friendly dicts with the time since the first event'''
+    if not events:
+        return []
+    start = events[0][1]
+    return [
+        {'stage': stage, 'elapsed_ms': round((timestamp - start) * 1000, 3), 'value': _to_json(value)}
+        for stage, timestamp, value in events
+    ]
+
+def format_trace_text(events):
+    '''One line per event, in the style of the application log'''
+    return ''.join(
+        f"[{event['elapsed_ms']:.3f} ms] {event['stage']}: {event['value']}\n"
+        for event in format_trace(events)
+    )
@@ -1,55 +1,82 @@
 import os
 import sys
-import pandas as pd
-from src.utils import load_object
+from src.utils import load_object, artifact_version, served_model_path
 from src.exception import CustomException
 from src.logger import logging
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS, run_batch_prediction
+from src.pipeline.compiled_preprocessor import compile_preprocessor, model_input_dtype
+from src.pipeline.tree_engine import compile_model
+from src.pipeline.request_trace import trace_event
 
 class WinePredictor:
     def __init__(self):
         try:
-            self.model_path = os.path.join('artifact', 'wine_model.pkl')
+            self.dataset_name = 'wine'
+            self.model_path = served_model_path(os.path.join('artifact', 'wine_model.pkl'))
             self.preprocessor_path = os.path.join('artifact', 'wine_preprocessor.pkl')
             self.label_encoder_path = os.path.join('artifact', 'wine_label_encoder.pkl')
+            self.feature_columns = FEATURE_COLUMNS['wine']
 
+            self.artifact_paths = [self.model_path, self.preprocessor_path, self.label_encoder_path]
+            self.artifact_version = artifact_version(self.artifact_paths)
             self.model = load_object(self.model_path)
             self.preprocessor = load_object(self.preprocessor_path)
+            self.compiled_preprocessor = compile_preprocessor(
+                self.preprocessor, self.feature_columns, dtype=model_input_dtype(self.model)
+            )
+            # Array-backed copy of tree ensembles for low-latency predict; None for other models
+            self.compiled_model = compile_model(self.model)
             self.label_encoder = load_object(self.label_encoder_path)
         except Exception as e:
             logging.error(f"Error loading model, preprocessor or label encoder: {e}")
             raise CustomException(e, sys)
+
+    def decode_predictions(self, prediction):
+        """Decode model outputs with the label encoder and map quality scores to categories"""
+        # Convert prediction to int type before inverse_transform
+        prediction_int = prediction.astype(int)
+        quality_labels = self.label_encoder.inverse_transform(prediction_int)
+        trace_event('decoded_quality', quality_labels)
+
+        return [self.map_quality(quality_label) for quality_label in quality_labels]
+
+    @staticmethod
+    def map_quality(quality_label):
+        """Map quality to categories: >7 good, <5 bad, 5-7 average"""
+        try:
+            quality_value = float(quality_label)
+            if quality_value > 7:
+                return 'good'
+            elif quality_value < 5:
+                return 'bad'
+            else:
+                return 'average'
+        except ValueError:
+            return quality_label  # fallback to original label if conversion fails
+
     def predict(self, input_data: dict):
         """
         input_data: dict of feature_name: value
-        Returns predicted quality label (good, medium, bad)
+        Returns predicted quality label (good, average, bad)
         """
         try:
-            input_df = pd.DataFrame([input_data])
-            logging.info(f"Input data for prediction: {input_df}")
-            input_processed = self.preprocessor.transform(input_df)
-            logging.info(f"Processed input data: {input_processed}")
-            prediction = self.model.predict(input_processed)
-            logging.info(f"Raw prediction output: {prediction}")
-            # Convert prediction to int type before inverse_transform
-            prediction_int = prediction.astype(int)
-            quality_label = self.label_encoder.inverse_transform(prediction_int)[0]
-            logging.info(f"Decoded quality label: {quality_label}")
-
-            # Map quality to categories: >7 good, <5 bad, 5-7 average
-            try:
-                quality_value = float(quality_label)
-                if quality_value > 7:
-                    mapped_label = 'good'
-                elif quality_value < 5:
-                    mapped_label = 'bad'
-                else:
-                    mapped_label = 'average'
-            except ValueError:
-                mapped_label = quality_label  # fallback to original label if conversion fails
-
-            logging.info(f"Mapped quality category: {mapped_label}")
-            return mapped_label
+            predictions, errors = run_batch_prediction(self, [input_data])
+            if errors:
+                raise ValueError(errors[0]['message'])
+
+            return predictions[0]
         except Exception as e:
             logging.error(f"Error during prediction: {e}")
             raise CustomException(e, sys)
+
+    def predict_batch(self, input_data):
+        """
+        input_data: list of dicts of feature_name: value, or 2D array with columns in feature_columns order
+        Returns (list of quality labels in input order, list of per-row errors);
+        rejected rows get None as their label
+        """
+        try:
+            return run_batch_prediction(self, input_data)
+        except Exception as e:
+            logging.error(f"Error during batch prediction: {e}")
             raise CustomException(e, sys)
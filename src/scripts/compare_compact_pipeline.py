@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import RandomForestClassifier
+
+from src.components.data_transformation import DataTransformation, DataTransformationWine, DataTransformationWater
+from src.components.data_ingestion import DataIngestionConfig
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS
+from src.pipeline.compiled_preprocessor import compile_preprocessor, model_input_dtype
+from src.utils import load_object
+
+TRANSFORMATIONS = {'milk': DataTransformation, 'wine': DataTransformationWine, 'water': DataTransformationWater}
+
+# Representative models: one that consumes float32 natively and one that upcasts to float64
+MODELS = {
+    'RandomForestClassifier': lambda: RandomForestClassifier(n_estimators=100, random_state=42),
+    'LogisticRegression': lambda: LogisticRegression(max_iter=1000),
+}
+
+def measure(function):
+    '''(result, seconds, peak traced allocation in MB) of one call'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+def split_arrays(data):
+    if isinstance(data, tuple):
+        return data
+    return data[:, :-1], data[:, -1]
+
+def run_mode(dataset_name, compact, work_dir, throughput_rows):
+    transformation = TRANSFORMATIONS[dataset_name](compact=compact)
+    config = transformation.data_transformation_config
+    mode = 'compact' if compact else 'float64'
+    config.cache_dir = os.path.join(work_dir, 'transform_cache', mode)
+    preprocessor_path = os.path.join(work_dir, f"{dataset_name}_{mode}_preprocessor.pkl")
+    setattr(config, f"{dataset_name}_preprocessor_ob_file_path", preprocessor_path)
+    setattr(config, f"{dataset_name}_label_encoder_path", os.path.join(work_dir, f"{dataset_name}_{mode}_label_encoder.pkl"))
+
+    ingestion_config = DataIngestionConfig()
+    train_path = getattr(ingestion_config, f"{dataset_name}_train_data_path")
+    test_path = getattr(ingestion_config, f"{dataset_name}_test_data_path")
+
+    (train, test, _), transform_seconds, transform_peak = measure(
+        lambda: transformation.initiate_data_transformation(train_path, test_path)
+    )
+    X_train, y_train = split_arrays(train)
+    X_test, y_test = split_arrays(test)
+    report = {
+        'transform_seconds': transform_seconds,
+        'transform_peak_mb': transform_peak,
+        'train_bytes': X_train.nbytes + y_train.nbytes,
+        'feature_dtype': str(X_train.dtype),
+        'label_dtype': str(y_train.dtype),
+        'models': {},
+    }
+
+    preprocessor = load_object(preprocessor_path)
+    feature_columns = FEATURE_COLUMNS[dataset_name]
+    test_df = pd.read_csv(test_path)
+    test_df.columns = test_df.columns.str.strip()
+    raw = test_df[feature_columns].to_numpy(dtype=np.float64)
+    raw = np.resize(raw, (throughput_rows, raw.shape[1]))
+
+    predictions = {}
+    for model_name, make_model in MODELS.items():
+        model = make_model()
+        _, fit_seconds, fit_peak = measure(lambda: model.fit(X_train, y_train))
+        y_pred = model.predict(X_test)
+        # Serving throughput: the predictors feed float32 only to models that use it natively
+        dtype = model_input_dtype(model) if compact else np.float64
+        compiled = compile_preprocessor(preprocessor, feature_columns, dtype=dtype)
+        predict_seconds = min(
+            measure(lambda: model.predict(compiled.transform(raw)))[1] for _ in range(3)
+        )
+        predictions[model_name] = np.asarray(y_pred, dtype=np.int64)
+        report['models'][model_name] = {
+            'fit_seconds': fit_seconds,
+            'fit_peak_mb': fit_peak,
+            'test_accuracy': float((np.asarray(y_pred) == np.asarray(y_test)).mean()),
+            'rows_per_second': throughput_rows / predict_seconds,
+        }
+    return report, predictions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the float64 pipeline with the compact float32 one")
+    parser.add_argument('--datasets', nargs='+', default=['milk', 'wine', 'water'], choices=sorted(TRANSFORMATIONS))
+    parser.add_argument('--throughput-rows', type=int, default=100000)
+    parser.add_argument('--output', help="also write the comparison as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for dataset_name in args.datasets:
+            baseline, baseline_predictions = run_mode(dataset_name, False, work_dir, args.throughput_rows)
+            compact, compact_predictions = run_mode(dataset_name, True, work_dir, args.throughput_rows)
+            for model_name in MODELS:
+                compact['models'][model_name]['prediction_agreement'] = float(
+                    (baseline_predictions[model_name] == compact_predictions[model_name]).mean()
+                )
+            results[dataset_name] = {'float64': baseline, 'compact': compact}
+
+            print(f"\n{dataset_name}: train arrays {baseline['train_bytes'] / 1024:.0f} KB -> {compact['train_bytes'] / 1024:.0f} KB "
+                  f"({compact['feature_dtype']} features, {compact['label_dtype']} labels), "
+                  f"transform peak {baseline['transform_peak_mb']:.2f} MB -> {compact['transform_peak_mb']:.2f} MB")
+            for model_name in MODELS:
+                before, after = baseline['models'][model_name], compact['models'][model_name]
+                print(f"  {model_name:24s} fit peak {before['fit_peak_mb']:7.2f} -> {after['fit_peak_mb']:7.2f} MB  "
+                      f"predict {before['rows_per_second']:10.0f} -> {after['rows_per_second']:10.0f} rows/s  "
+                      f"accuracy {before['test_accuracy']:.4f} -> {after['test_accuracy']:.4f}  "
+                      f"agreement {after['prediction_agreement']:.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
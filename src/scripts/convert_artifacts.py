@@ -0,0 +1,24 @@
+import os
+import sys
+import dill
+
+from src.artifact_store import convert_pickle_to_bundle, verify_artifact_bundle
+
+ARTIFACTS = [
+    os.path.join('artifact', f"{dataset}_{kind}.pkl")
+    for dataset in ('milk', 'water', 'wine')
+    for kind in ('model', 'preprocessor', 'label_encoder')
+]
+
+def load_pickle(file_path):
+    with open(file_path, 'rb') as f:
+        return dill.load(f)
+
+if __name__ == "__main__":
+    # Convert the given pickles (default: the served artifacts) to memory-mappable bundles
+    paths = sys.argv[1:] or [path for path in ARTIFACTS if os.path.exists(path)]
+    for path in paths:
+        bundle_path = convert_pickle_to_bundle(path, load_pickle)
+        corrupted = verify_artifact_bundle(bundle_path)
+        status = "ok" if not corrupted else f"checksum mismatch in {corrupted}"
+        print(f"{path} -> {bundle_path}: {status}")
@@ -1,5 +1,24 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
+from joblib import Parallel, delayed
+
+from src.exception import CustomException
+from src.logger import logging
+from src.artifact_store import file_sha256
+from src.components.columnar_cache import MANIFEST_FILE
+
+@dataclass
+class AugmentationConfig:
+    # Output is fixed by the seed and the chunk size; the worker count only changes the speed
+    chunk_rows: int = int(os.environ.get('AUGMENT_CHUNK_ROWS', 100000))
+    n_workers: int = int(os.environ.get('AUGMENT_WORKERS', -1))
+    seed: int = int(os.environ.get('AUGMENT_SEED', 42))
 
 def generate_augmented_dataset(input_file: str, output_file: str, target_column: str, target_rows: int = 1000, noise_level: float = 0.1):
     df = pd.read_csv(input_file)
@@ -43,8 +62,175 @@ def generate_augmented_dataset(input_file: str, output_file: str, target_column:
     replicated_df.to_csv(output_file, index=False)
     print(f"Augmented dataset saved to {output_file}")
 
+class AugmentationPlan:
+    '''
+    Everything needed to build any slice of the augmented dataset without materializing it:
+    output row r is unique row r % n_unique for the first reps * n_unique rows and one of the
+    sampled remainder rows after that, the same order generate_augmented_dataset produces
+    '''
+    def __init__(self, input_file, target_column, target_rows, noise_level, chunk_rows, seed):
+        unique_df = pd.read_csv(input_file).drop_duplicates()
+        if unique_df.shape[0] == 0:
+            raise ValueError("No unique rows found in the dataset.")
+        self.n_unique = unique_df.shape[0]
+        self.reps, remainder = divmod(target_rows, self.n_unique)
+        # Positions of the same sample generate_augmented_dataset appends
+        sample = unique_df.sample(n=remainder, random_state=42) if remainder else unique_df.iloc[:0]
+        self.remainder_rows = unique_df.index.get_indexer(sample.index)
+        self.unique_df = unique_df.reset_index(drop=True)
+        self.target_rows = target_rows
+        self.chunk_rows = chunk_rows
+        self.seed = seed
+
+        self.numeric_columns = self.unique_df.select_dtypes(include=[np.number]).columns.tolist()
+        if target_column in self.numeric_columns:
+            self.numeric_columns.remove(target_column)
+        self.values = self.unique_df[self.numeric_columns].to_numpy(dtype=np.float64)
+        counts = np.full(self.n_unique, self.reps, dtype=np.float64)
+        np.add.at(counts, self.remainder_rows, 1)
+        # Standard deviation of each column over the replicated rows, from the copy counts
+        self.noise_scale = noise_level * self._weighted_std(self.values, counts)
+
+    @staticmethod
+    def _weighted_std(values, counts):
+        '''pandas' std (ddof=1, NaN skipped) of a column in which row i appears counts[i] times'''
+        weights = np.where(np.isnan(values), 0.0, counts[:, None])
+        filled = np.where(np.isnan(values), 0.0, values)
+        n = weights.sum(axis=0)
+        mean = (weights * filled).sum(axis=0) / np.maximum(n, 1)
+        variance = (weights * (filled - mean) ** 2).sum(axis=0) / np.maximum(n - 1, 1)
+        return np.where(n > 1, np.sqrt(variance), np.nan)
+
+    @property
+    def n_chunks(self):
+        return -(-self.target_rows // self.chunk_rows)
+
+    def source_rows(self, start, end):
+        rows = np.arange(start, end)
+        source = rows % self.n_unique
+        replicated = self.reps * self.n_unique
+        tail = rows >= replicated
+        source[tail] = self.remainder_rows[rows[tail] - replicated]
+        return source
+
+    def chunk(self, chunk_index):
+        '''(first output row, DataFrame) of one chunk; its noise comes from its own seeded generator'''
+        start = chunk_index * self.chunk_rows
+        source = self.source_rows(start, min(start + self.chunk_rows, self.target_rows))
+        frame = self.unique_df.iloc[source].reset_index(drop=True)
+        # Child chunk_index of SeedSequence(seed), the stream spawn() would hand to this chunk
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(chunk_index,)))
+        noise = rng.standard_normal((len(source), len(self.numeric_columns))) * self.noise_scale
+        frame[self.numeric_columns] = np.round(self.values[source] + noise, 3)
+        return start, frame
+
+def _write_csv_part(plan, chunk_index, part_path):
+    _, frame = plan.chunk(chunk_index)
+    frame.to_csv(part_path, index=False, header=chunk_index == 0)
+    return len(frame)
+
+def _write_columnar_slice(plan, chunk_index, output_dir, columns):
+    start, frame = plan.chunk(chunk_index)
+    for column in columns:
+        data = np.memmap(os.path.join(output_dir, column['file']), dtype=column['dtype'], mode='r+',
+                         shape=(plan.target_rows,))
+        values = frame[column['name']]
+        if column['categories'] is not None:
+            values = values.map({value: code for code, value in enumerate(column['categories'])})
+        data[start:start + len(frame)] = values.to_numpy(dtype=column['dtype'])
+        data.flush()
+        del data
+    return len(frame)
+
+def generate_augmented_dataset_streaming(input_file: str, output_file: str, target_column: str, target_rows: int = 1000,
+                                         noise_level: float = 0.1, output_format: str = 'csv', config=None):
+    '''
+    Same recipe as generate_augmented_dataset, built chunk by chunk in a pool of worker processes:
+    every chunk draws its noise in one call from a generator seeded with (seed, chunk index), so
+    the output is identical for any worker count. 'csv' writes one part per chunk and joins them
+    in order; 'columnar' writes a directory in the columnar cache format (readable with
+    ColumnarTable), each worker filling its rows of the preallocated column files.
+    '''
+    try:
+        config = config or AugmentationConfig()
+        plan = AugmentationPlan(input_file, target_column, target_rows, noise_level, config.chunk_rows, config.seed)
+        logging.info(
+            f"Generating {target_rows} rows from {plan.n_unique} unique rows of {input_file} "
+            f"in {plan.n_chunks} chunks on {config.n_workers} workers"
+        )
+        work_dir = output_file + '.tmp'
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+
+        if output_format == 'csv':
+            part_paths = [os.path.join(work_dir, f"part-{index:06d}.csv") for index in range(plan.n_chunks)]
+            Parallel(n_jobs=config.n_workers)(
+                delayed(_write_csv_part)(plan, index, path) for index, path in enumerate(part_paths)
+            )
+            with open(os.path.join(work_dir, 'joined.csv'), 'wb') as output:
+                for path in part_paths:
+                    with open(path, 'rb') as part:
+                        shutil.copyfileobj(part, output, 1 << 20)
+            os.replace(os.path.join(work_dir, 'joined.csv'), output_file)
+            shutil.rmtree(work_dir)
+        elif output_format == 'columnar':
+            columns = []
+            for index, name in enumerate(plan.unique_df.columns):
+                values = plan.unique_df[name]
+                if name in plan.numeric_columns:
+                    dtype, categories = 'float64', None
+                elif pd.api.types.is_numeric_dtype(values):
+                    dtype, categories = str(values.dtype), None
+                else:
+                    dtype, categories = 'int32', list(pd.unique(values))
+                columns.append({'name': name, 'file': f"{index:04d}.bin", 'dtype': dtype, 'categories': categories})
+                with open(os.path.join(work_dir, columns[-1]['file']), 'wb') as f:
+                    f.truncate(np.dtype(dtype).itemsize * target_rows)
+            Parallel(n_jobs=config.n_workers)(
+                delayed(_write_columnar_slice)(plan, index, work_dir, columns) for index in range(plan.n_chunks)
+            )
+            manifest = {
+                'source_path': input_file,
+                'source_sha256': file_sha256(input_file),
+                'n_rows': target_rows,
+                'columns': columns,
+                'augmentation': {'noise_level': noise_level, 'seed': config.seed, 'chunk_rows': config.chunk_rows},
+            }
+            with open(os.path.join(work_dir, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2, default=str)
+            shutil.rmtree(output_file, ignore_errors=True)
+            os.replace(work_dir, output_file)
+        else:
+            raise ValueError(f"Unknown output format {output_format!r}, expected 'csv' or 'columnar'")
+        logging.info(f"Augmented dataset saved to {output_file}")
+        print(f"Augmented dataset saved to {output_file}")
+    except Exception as e:
+        raise CustomException(e, sys)
+
 if __name__ == "__main__":
-    input_file = "Dataset/milk/milk.csv"
-    output_file = "Dataset/milk/augmented_milk_dataset.csv"
-    target_column = "Grade"
-    generate_augmented_dataset(input_file, output_file, target_column)
+    parser = argparse.ArgumentParser(description="Generate a noisy augmented copy of a dataset")
+    parser.add_argument('input_file', nargs='?', default="Dataset/milk/milk.csv")
+    parser.add_argument('output_file', nargs='?', default="Dataset/milk/augmented_milk_dataset.csv")
+    parser.add_argument('--target', default="Grade", help="target column, left without noise")
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.1, help="noise standard deviation as a share of each column's")
+    parser.add_argument('--streaming', action='store_true',
+                        help="build the output chunk by chunk in parallel, reproducibly from --seed")
+    parser.add_argument('--format', default='csv', choices=['csv', 'columnar'], help="output format of --streaming")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--chunk-rows', type=int)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    if args.streaming:
+        config = AugmentationConfig()
+        for key in ('seed', 'chunk_rows'):
+            if getattr(args, key) is not None:
+                setattr(config, key, getattr(args, key))
+        if args.workers is not None:
+            config.n_workers = args.workers
+        generate_augmented_dataset_streaming(
+            args.input_file, args.output_file, args.target, args.rows, args.noise, args.format, config
+        )
+    else:
+        generate_augmented_dataset(args.input_file, args.output_file, args.target, args.rows, args.noise)
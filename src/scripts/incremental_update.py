@@ -0,0 +1,21 @@
+import sys
+import pandas as pd
+
+from src.components.incremental_trainer import IncrementalModelTrainer
+
+if __name__ == "__main__":
+    # Usage: python src/scripts/incremental_update.py <milk|water|wine> <labeled_rows.csv> [more.csv ...]
+    if len(sys.argv) < 3:
+        print("Usage: incremental_update.py <milk|water|wine> <labeled_rows.csv> [more.csv ...]")
+        sys.exit(1)
+
+    trainer = IncrementalModelTrainer(dataset_name=sys.argv[1])
+    for csv_path in sys.argv[2:]:
+        report = trainer.update(pd.read_csv(csv_path))
+        print(
+            f"{csv_path}: {report['n_rows']} rows, {report['model']} via {report['strategy']}, "
+            f"batch accuracy {report['batch_accuracy_before']:.4f} -> {report['batch_accuracy_after']:.4f}, "
+            f"version {report['artifact_version']} in {report['elapsed_seconds']:.2f}s"
+        )
+        if report['retrain_required']:
+            print(f"{csv_path}: the model reached INCREMENTAL_MAX_STAGES; run a full retrain to keep updating it")
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import importlib
+import numpy as np
+import pandas as pd
+
+from src.components.data_ingestion import DataIngestionConfig
+from src.components.data_transformation import DataTransformation, DataTransformationWine, DataTransformationWater
+from src.components.model_trainer import ModelTrainer
+from src.components.training_cache import TrainingCache
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS
+from src.logger import logging
+
+# (module, class, constructor kwargs) of each dataset's predictor
+PREDICTORS = {
+    'milk': ('src.pipeline.predict_pipeline', 'Predictor', {'dataset_name': 'milk'}),
+    'wine': ('src.pipeline.wine_predict_pipeline', 'WinePredictor', {}),
+    'water': ('src.pipeline.water_predict_pipeline', 'WaterPredictor', {}),
+}
+TRANSFORMATIONS = {'milk': DataTransformation, 'wine': DataTransformationWine, 'water': DataTransformationWater}
+STAGES = ['startup', 'latency', 'throughput', 'transformation', 'training']
+
+# Metrics where a larger value is better; every other metric is a time where smaller is better
+HIGHER_IS_BETTER = ('rows_per_second', 'cv_score')
+
+# Runs in a fresh interpreter so the import cost includes numpy, pandas and sklearn
+STARTUP_CODE = '''
+import sys, json, time, importlib
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+getattr(module, sys.argv[2])(**json.loads(sys.argv[3]))
+loaded = time.perf_counter()
+print(json.dumps({'import_seconds': imported - start, 'load_seconds': loaded - imported}))
+'''
+
+def library_versions():
+    versions = {'python': platform.python_version()}
+    for name in ('numpy', 'pandas', 'sklearn', 'catboost', 'xgboost', 'joblib'):
+        try:
+            versions[name] = importlib.import_module(name).__version__
+        except ImportError:
+            versions[name] = None
+    return versions
+
+def test_features(dataset_name):
+    '''Raw feature matrix of the committed test split, in FEATURE_COLUMNS order'''
+    test_path = getattr(DataIngestionConfig(), f"{dataset_name}_test_data_path")
+    test_df = pd.read_csv(test_path)
+    test_df.columns = test_df.columns.str.strip()
+    return test_df[FEATURE_COLUMNS[dataset_name]]
+
+def load_predictor(dataset_name):
+    module_name, class_name, kwargs = PREDICTORS[dataset_name]
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
+def bench_startup(dataset_name, runs):
+    '''Median cold import and model load time over fresh interpreters'''
+    module_name, class_name, kwargs = PREDICTORS[dataset_name]
+    env = dict(os.environ, LOG_CONSOLE='0', PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', STARTUP_CODE, module_name, class_name, json.dumps(kwargs)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        key: float(np.median([sample[key] for sample in samples]))
+        for key in ('import_seconds', 'load_seconds')
+    }
+
+def bench_latency(predictor, rows, iterations, warmup):
+    '''Single-row predict() latency percentiles in milliseconds, cycling through the test rows'''
+    for row in rows[:warmup]:
+        predictor.predict(row)
+    timings = np.empty(iterations)
+    for i in range(iterations):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        predictor.predict(row)
+        timings[i] = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(timings * 1000, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def bench_throughput(predictor, features, batch_size, min_seconds):
+    '''predict_batch() rows per second on an ndarray batch, repeated for at least min_seconds'''
+    batch = np.resize(features, (batch_size, features.shape[1]))
+    predictor.predict_batch(batch)
+    repeats = 0
+    start = time.perf_counter()
+    while True:
+        predictor.predict_batch(batch)
+        repeats += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds and repeats >= 3:
+            break
+    return {'rows_per_second': batch_size * repeats / elapsed}
+
+def run_transformation(dataset_name, work_dir):
+    '''Transform the committed split into a scratch cache; returns (train, test, cold seconds, warm seconds)'''
+    transformation = TRANSFORMATIONS[dataset_name]()
+    config = transformation.data_transformation_config
+    config.cache_dir = os.path.join(work_dir, 'transform_cache')
+    setattr(config, f"{dataset_name}_preprocessor_ob_file_path", os.path.join(work_dir, f"{dataset_name}_preprocessor.pkl"))
+    setattr(config, f"{dataset_name}_label_encoder_path", os.path.join(work_dir, f"{dataset_name}_label_encoder.pkl"))
+    ingestion_config = DataIngestionConfig()
+    train_path = getattr(ingestion_config, f"{dataset_name}_train_data_path")
+    test_path = getattr(ingestion_config, f"{dataset_name}_test_data_path")
+
+    start = time.perf_counter()
+    train, test, _ = transformation.initiate_data_transformation(train_path, test_path)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    transformation.initiate_data_transformation(train_path, test_path)
+    warm = time.perf_counter() - start
+    return train, test, cold, warm
+
+def bench_training(dataset_name, train, work_dir, n_workers, search_mode, model_names=None):
+    '''Per-candidate search time with an empty training cache, so every fit really runs'''
+    X_train, y_train = train if isinstance(train, tuple) else (train[:, :-1], train[:, -1])
+    trainer = ModelTrainer(
+        dataset_name=dataset_name, n_workers=n_workers, search_mode=search_mode,
+        training_cache=TrainingCache(cache_dir=os.path.join(work_dir, 'training_cache', dataset_name))
+    )
+    results, search_wall = trainer.search_models(X_train, y_train, model_names=model_names)
+    metrics = {'search_wall_seconds': search_wall}
+    for result in results:
+        prefix = result['name']
+        metrics[f"{prefix}.fit_wall_seconds"] = result['fit_wall_seconds']
+        metrics[f"{prefix}.fit_cpu_seconds"] = result['fit_cpu_seconds']
+        metrics[f"{prefix}.refit_wall_seconds"] = result['refit_wall_seconds']
+        metrics[f"{prefix}.cv_score"] = float(result['cv_score'])
+    return metrics
+
+def run_benchmarks(datasets, stages, args):
+    '''Flat {metric name: value} of every requested stage'''
+    metrics = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for dataset_name in datasets:
+            if 'startup' in stages:
+                for key, value in bench_startup(dataset_name, args.startup_runs).items():
+                    metrics[f"startup.{dataset_name}.{key}"] = value
+
+            if 'latency' in stages or 'throughput' in stages:
+                predictor = load_predictor(dataset_name)
+                features = test_features(dataset_name)
+                if 'latency' in stages:
+                    rows = features.to_dict('records')
+                    for key, value in bench_latency(predictor, rows, args.iterations, args.warmup).items():
+                        metrics[f"latency.{dataset_name}.{key}"] = value
+                if 'throughput' in stages:
+                    matrix = features.to_numpy(dtype=np.float64)
+                    for batch_size in args.batch_sizes:
+                        result = bench_throughput(predictor, matrix, batch_size, args.min_seconds)
+                        metrics[f"throughput.{dataset_name}.batch_{batch_size}.rows_per_second"] = result['rows_per_second']
+
+            if 'transformation' in stages or 'training' in stages:
+                train, _, cold, warm = run_transformation(dataset_name, work_dir)
+                if 'transformation' in stages:
+                    metrics[f"transformation.{dataset_name}.cold_seconds"] = cold
+                    metrics[f"transformation.{dataset_name}.cached_seconds"] = warm
+                if 'training' in stages:
+                    for key, value in bench_training(
+                        dataset_name, train, work_dir, args.workers, args.search_mode, args.candidates
+                    ).items():
+                        metrics[f"training.{dataset_name}.{key}"] = value
+            logging.info(f"Benchmarks of {dataset_name} finished")
+    return metrics
+
+def compare(current, baseline, tolerance):
+    '''Metrics that got worse than the baseline by more than tolerance (relative), worst first'''
+    regressions = []
+    for name, value in current.items():
+        before = baseline.get(name)
+        if before is None or not np.isfinite(before) or not np.isfinite(value) or before == 0:
+            continue
+        higher_is_better = name.endswith(HIGHER_IS_BETTER)
+        change = (value - before) / abs(before)
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append({'metric': name, 'baseline': before, 'current': value, 'change': change})
+    return sorted(regressions, key=lambda item: -abs(item['change']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark model startup, inference, transformation and training offline")
+    parser.add_argument('--datasets', nargs='+', default=['milk', 'wine', 'water'], choices=sorted(PREDICTORS))
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results as JSON")
+    parser.add_argument('--baseline', help="results JSON of an earlier run to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument('--startup-runs', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=1000, help="single-row predictions per dataset")
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 16, 128, 1024])
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="minimum time per throughput measurement")
+    parser.add_argument('--workers', type=int, default=1, help="search workers for the training stage")
+    parser.add_argument('--search-mode', default='grid', choices=['grid', 'halving'])
+    parser.add_argument('--candidates', nargs='+', help="only time these ModelTrainer candidates, e.g. RandomForestClassifier")
+    args = parser.parse_args()
+
+    started = time.time()
+    metrics = run_benchmarks(args.datasets, args.stages, args)
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'duration_seconds': time.time() - started,
+        'environment': {'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'versions': library_versions()},
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'metrics': metrics,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(metrics, baseline['metrics'], args.tolerance)
+        results['comparison'] = {'baseline': args.baseline, 'tolerance': args.tolerance, 'regressions': regressions}
+        changed = {
+            name: (before, after)
+            for name, before in baseline.get('environment', {}).get('versions', {}).items()
+            if (after := results['environment']['versions'].get(name)) != before
+        }
+        for name, (before, after) in changed.items():
+            print(f"{name}: {before} -> {after}")
+        for item in regressions:
+            print(f"REGRESSION {item['metric']}: {item['baseline']:.6g} -> {item['current']:.6g} ({item['change']:+.1%})")
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%} against {args.baseline}")
+        exit_code = 1 if regressions else 0
+    else:
+        for name, value in metrics.items():
+            print(f"{name:70s} {value:.6g}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    sys.exit(exit_code)
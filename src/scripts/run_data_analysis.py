@@ -1,12 +1,31 @@
-from src.components.data_analysis import analyze_duplicates_and_leakage
+import argparse
+from dataclasses import replace
+
+from src.components.data_analysis import analyze_duplicates_and_leakage, analyze_duplicates_streaming, DataAnalysisConfig
 
 if __name__ == "__main__":
-    file_path = "Dataset/milk/synthetic_milkoutput_unique.csv"
-    target_column = "Grade"
+    parser = argparse.ArgumentParser(description="Check a dataset for duplicate rows, label conflicts and target leakage")
+    parser.add_argument('file_path', nargs='?', default="Dataset/milk/synthetic_milkoutput_unique.csv")
+    parser.add_argument('--target', default="Grade", help="target column")
+    parser.add_argument('--streaming', action='store_true',
+                        help="stream the file in chunks and also look for approximate duplicates (for large files)")
+    parser.add_argument('--chunk-rows', type=int)
+    parser.add_argument('--tolerance', type=float, help="approximate duplicate tolerance in standard deviations")
+    parser.add_argument('--rounds', type=int, help="shifted grids searched for approximate duplicates")
+    args = parser.parse_args()
 
-    report = analyze_duplicates_and_leakage(file_path, target_column)
+    if args.streaming:
+        overrides = {key: value for key, value in
+                     (('chunk_rows', args.chunk_rows), ('tolerance', args.tolerance), ('rounds', args.rounds))
+                     if value is not None}
+        report = analyze_duplicates_streaming(args.file_path, args.target, replace(DataAnalysisConfig(), **overrides))
+    else:
+        report = analyze_duplicates_and_leakage(args.file_path, args.target)
 
     print("Data Analysis Report:")
     print(f"Number of duplicate rows: {report['num_duplicates']}")
     print(f"Number of near-duplicate rows with different target values: {report['num_near_duplicates']}")
+    if args.streaming:
+        print(f"Rows within {report['tolerance']} std of a different row: {report['num_approximate_duplicate_rows']}")
+        print(f"Rows within {report['tolerance']} std of a row with another target: {report['num_approximate_conflict_rows']}")
     print(f"Features highly correlated with target (>|0.95|): {report['high_corr_features']}")
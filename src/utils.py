@@ -1,5 +1,7 @@
 import os
 import sys
+import types
+import hashlib
 import numpy as np
 import pandas as pd
 import dill
@@ -7,6 +9,8 @@ from sklearn.metrics import r2_score
 from sklearn.model_selection import GridSearchCV
 
 from src.exception import CustomException
+from src.logger import logging
+from src.artifact_store import preferred_bundle, load_artifact_bundle
 
 def save_object(file_path, obj):
     try:
@@ -50,8 +54,95 @@ def evaluate_models(X_train,y_train,X_test,y_test,models,param, scoring='r2'):
         raise CustomException(e, sys)
     
 def load_object(file_path):
+    """Load a dill pickle, or its bundle when one is up to date and chosen by ARTIFACT_BUNDLES"""
     try:
+        if os.path.isdir(file_path):
+            return load_artifact_bundle(file_path)
+
+        bundle_path = preferred_bundle(file_path)
+        if bundle_path is not None:
+            return load_artifact_bundle(bundle_path)
+
         with open(file_path, 'rb') as f:
             return dill.load(f)
     except Exception as e:
-        raise CustomException(e, sys)
\ No newline at end of file
+        raise CustomException(e, sys)
+
+def estimate_object_size(obj):
+    """Approximate resident size in bytes of an object graph, counting each numpy buffer once"""
+    # Keep visited objects alive so ids of temporary __getstate__ dicts are never reused
+    seen = {}
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or callable(item) or isinstance(item, types.ModuleType):
+            continue
+        seen[id(item)] = item
+
+        if isinstance(item, np.ndarray):
+            total += item.nbytes
+            if item.dtype == object:
+                stack.extend(item.ravel().tolist())
+            continue
+
+        total += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        else:
+            # __getstate__ also exposes the buffers of extension types such as sklearn's Tree
+            try:
+                state = item.__getstate__()
+            except Exception:
+                state = getattr(item, '__dict__', None)
+            if state is not None:
+                stack.append(state)
+    return total
+
+def artifact_version(paths):
+    """Short fingerprint of the size and modification time of the given artifact files"""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:12]
+
+def model_variant_path(path, variant):
+    """artifact/milk_model.pkl -> artifact/milk_model_compressed.pkl"""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{variant}{ext}"
+
+def served_model_path(path):
+    """The MODEL_VARIANT variant of a model artifact when one was saved, the artifact itself otherwise"""
+    variant = os.environ.get('MODEL_VARIANT', '')
+    if variant and os.path.exists(model_variant_path(path, variant)):
+        return model_variant_path(path, variant)
+    return path
+
+def memory_usage_mb():
+    """Resident and private memory of the current process in MB (private only on Linux)"""
+    usage = {'rss_mb': None, 'private_mb': None}
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        usage['rss_mb'] = resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        # Private pages show how much of the RSS is not shared copy-on-write with the parent
+        with open('/proc/self/smaps_rollup') as f:
+            private_kb = sum(
+                int(line.split()[1]) for line in f
+                if line.startswith(('Private_Clean:', 'Private_Dirty:'))
+            )
+        usage['private_mb'] = private_kb / 1024
+    except (OSError, ValueError, IndexError):
+        if usage['rss_mb'] is None:
+            import resource
+            usage['rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
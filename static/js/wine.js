@@ -55,7 +55,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         try {
             // Get prediction
-            const predResponse = await fetch('/api/predict_wine', {
+            const predResponse = await fetch('/api/predict_wine?trace=1', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
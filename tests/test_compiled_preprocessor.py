@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler
+
+from src.utils import load_object
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS, run_batch_prediction
+from src.pipeline.compiled_preprocessor import CompiledPreprocessor, compile_preprocessor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASETS = {
+    'milk': os.path.join('Dataset', 'milk', 'milk.csv'),
+    'water': os.path.join('Dataset', 'water', 'water.csv'),
+    'wine': os.path.join('Dataset', 'wine', 'wine.csv'),
+}
+TOLERANCE = 1e-9
+
+def _rows(dataset_name, n_realistic=300):
+    '''Sampled rows of the dataset plus missing, out-of-range and extreme readings'''
+    frame = pd.read_csv(os.path.join(ROOT, DATASETS[dataset_name]))
+    frame.columns = [column.strip() for column in frame.columns]
+    X = frame[FEATURE_COLUMNS[dataset_name]].to_numpy(dtype=np.float64)
+    rng = np.random.RandomState(0)
+    realistic = X[rng.choice(len(X), n_realistic, replace=len(X) < n_realistic)]
+    low, high = np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+
+    # One missing reading per column, then a few missing at random, then an all-missing row
+    single_missing = np.repeat(realistic[:1], X.shape[1], axis=0)
+    single_missing[np.arange(X.shape[1]), np.arange(X.shape[1])] = np.nan
+    random_missing = realistic[:50].copy()
+    random_missing[rng.rand(*random_missing.shape) < 0.3] = np.nan
+    out_of_range = np.vstack([
+        low - (high - low),
+        high + (high - low),
+        np.zeros(X.shape[1]),
+        -np.abs(high) * 10,
+        np.full(X.shape[1], 1e4),
+    ])
+    return np.vstack([realistic, single_missing, random_missing, out_of_range, np.full((1, X.shape[1]), np.nan)])
+
+def _shipped_preprocessor(dataset_name):
+    return load_object(os.path.join(ROOT, 'artifact', f"{dataset_name}_preprocessor.pkl"))
+
+@pytest.mark.parametrize('dataset_name', sorted(DATASETS))
+def test_compiled_matches_sklearn(dataset_name):
+    preprocessor = _shipped_preprocessor(dataset_name)
+    compiled = compile_preprocessor(preprocessor, FEATURE_COLUMNS[dataset_name])
+    assert isinstance(compiled, CompiledPreprocessor)
+
+    X = _rows(dataset_name)
+    expected = np.asarray(preprocessor.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS[dataset_name])))
+    result = compiled.transform(X)
+    assert result.shape == expected.shape
+    assert not np.isnan(result).any()
+    assert np.allclose(result, expected, rtol=0, atol=TOLERANCE)
+    assert compiled.max_abs_error(preprocessor, X) <= TOLERANCE
+
+@pytest.mark.parametrize('dataset_name', sorted(DATASETS))
+def test_float32_output_is_sklearn_output_cast(dataset_name):
+    preprocessor = _shipped_preprocessor(dataset_name)
+    compiled = compile_preprocessor(preprocessor, FEATURE_COLUMNS[dataset_name], dtype=np.float32)
+
+    X = _rows(dataset_name)
+    expected = np.asarray(preprocessor.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS[dataset_name])))
+    result = compiled.transform(X)
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected.astype(np.float32), rtol=0, atol=np.finfo(np.float32).eps * np.abs(expected).max())
+
+def _unsupported_preprocessor():
+    features = FEATURE_COLUMNS['water']
+    X = pd.DataFrame(np.random.RandomState(0).rand(20, len(features)), columns=features)
+    preprocessor = ColumnTransformer([
+        ('num_pipeline', Pipeline([('imputer', SimpleImputer(strategy='median')), ('scaler', MinMaxScaler())]), features),
+    ])
+    return preprocessor.fit(X), X.to_numpy()
+
+def test_unsupported_step_falls_back_to_sklearn():
+    preprocessor, X = _unsupported_preprocessor()
+    assert compile_preprocessor(preprocessor, FEATURE_COLUMNS['water']) is None
+
+    class StubModel:
+        def predict(self, X):
+            # Echo the first transformed feature so the test sees what the model was given
+            return X[:, 0]
+
+    class StubPredictor:
+        dataset_name = 'water'
+        feature_columns = FEATURE_COLUMNS['water']
+        compiled_preprocessor = compile_preprocessor(preprocessor, FEATURE_COLUMNS['water'])
+        model = StubModel()
+
+        def __init__(self):
+            self.preprocessor = preprocessor
+
+        @staticmethod
+        def decode_predictions(prediction):
+            return list(prediction)
+
+    predictions, errors = run_batch_prediction(StubPredictor(), X)
+    assert errors == []
+    expected = preprocessor.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS['water']))[:, 0]
+    assert np.array_equal(predictions, expected)
+
+def test_verify_rejects_out_of_tolerance_path():
+    preprocessor = _shipped_preprocessor('wine')
+    compiled = compile_preprocessor(preprocessor, FEATURE_COLUMNS['wine'])
+    # Corrupt one fitted scale; verification has to catch it
+    _, (mean, scale) = compiled.blocks[0]['ops'][-1]
+    compiled.blocks[0]['ops'][-1] = ('scale', (mean, scale * (1 + 1e-6)))
+    with pytest.raises(ValueError):
+        compiled.verify(preprocessor, _rows('wine'))
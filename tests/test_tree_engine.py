@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+
+from src.utils import load_object
+from src.pipeline.batch_pipeline import FEATURE_COLUMNS
+from src.pipeline.tree_engine import CompiledTreeEnsemble
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASETS = {
+    'milk': (os.path.join('Dataset', 'milk', 'milk.csv'), 'Grade'),
+    'water': (os.path.join('Dataset', 'water', 'water.csv'), 'Potability'),
+    'wine': (os.path.join('Dataset', 'wine', 'wine.csv'), 'quality'),
+}
+MAX_ROWS = 256
+
+def _model_input(dataset_name):
+    '''Dataset rows through the shipped preprocessor as float32, with their labels'''
+    path, target = DATASETS[dataset_name]
+    frame = pd.read_csv(os.path.join(ROOT, path))
+    frame.columns = [column.strip() for column in frame.columns]
+    preprocessor = load_object(os.path.join(ROOT, 'artifact', f"{dataset_name}_preprocessor.pkl"))
+    X = preprocessor.transform(frame[FEATURE_COLUMNS[dataset_name]])
+    return np.asarray(X, dtype=np.float32), frame[target].to_numpy()
+
+def _shipped(dataset_name):
+    return load_object(os.path.join(ROOT, 'artifact', f"{dataset_name}_model.pkl"))
+
+def _fitted(estimator, dataset_name):
+    X, y = _model_input(dataset_name)
+    return estimator.fit(X, y)
+
+MODELS = {
+    'milk_random_forest': lambda: _shipped('milk'),
+    'wine_random_forest': lambda: _shipped('wine'),
+    'wine_extra_trees': lambda: _fitted(ExtraTreesClassifier(n_estimators=30, random_state=0), 'wine'),
+    'water_boosting_binary': lambda: _fitted(GradientBoostingClassifier(n_estimators=30, random_state=0), 'water'),
+    'milk_boosting_multiclass': lambda: _fitted(GradientBoostingClassifier(n_estimators=20, random_state=0), 'milk'),
+}
+DATASET_OF = {name: name.split('_')[0] for name in MODELS}
+
+@pytest.fixture(scope='module', params=sorted(MODELS))
+def case(request):
+    model = MODELS[request.param]()
+    assert isinstance(model, (RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier))
+    X, _ = _model_input(DATASET_OF[request.param])
+    return model, X
+
+def _threshold_rows(model, X, n_rows=400):
+    '''Dataset rows with features set exactly at, and one float32 step around, the float32-rounded split thresholds'''
+    trees = [estimator.tree_ for estimator in np.ravel(model.estimators_)]
+    rng = np.random.RandomState(0)
+    rows = X[rng.choice(len(X), n_rows)].copy()
+    for f in range(X.shape[1]):
+        thresholds = np.concatenate([tree.threshold[tree.feature == f] for tree in trees]).astype(np.float32)
+        if len(thresholds):
+            candidates = np.concatenate([
+                thresholds,
+                np.nextafter(thresholds, np.float32(np.inf)),
+                np.nextafter(thresholds, np.float32(-np.inf)),
+            ])
+            rows[:, f] = rng.choice(candidates, size=n_rows)
+    return rows
+
+def _nan_rows(X, n_rows=200):
+    rng = np.random.RandomState(1)
+    rows = X[rng.choice(len(X), n_rows)].copy()
+    rows[rng.rand(*rows.shape) < 0.3] = np.nan
+    rows[0] = np.nan
+    return rows
+
+def _assert_identical(compiled, model, X):
+    assert np.array_equal(compiled.predict(X), model.predict(X))
+    assert np.array_equal(compiled.predict_proba(X), model.predict_proba(X))
+    if isinstance(model, GradientBoostingClassifier):
+        assert np.array_equal(compiled.decision_function(X), model.decision_function(X))
+
+def test_dataset_rows(case):
+    model, X = case
+    compiled = CompiledTreeEnsemble(model)
+    _assert_identical(compiled, model, X)
+
+def test_rows_at_float32_thresholds(case):
+    model, X = case
+    for threshold_dtype in ('float32', 'float64'):
+        compiled = CompiledTreeEnsemble(model, threshold_dtype=threshold_dtype)
+        _assert_identical(compiled, model, _threshold_rows(model, X))
+
+def test_rows_with_nan(case):
+    model, X = case
+    compiled = CompiledTreeEnsemble(model)
+    rows = _nan_rows(X)
+    if compiled.allows_nan:
+        _assert_identical(compiled, model, rows)
+    else:
+        # Models that reject NaN keep rejecting it through the engine
+        with pytest.raises(ValueError):
+            model.predict(rows)
+        with pytest.raises(ValueError):
+            compiled.predict(rows)
+
+@pytest.mark.parametrize('n_rows', [1, MAX_ROWS - 1, MAX_ROWS, MAX_ROWS + 1, 3000])
+def test_batches_around_max_rows(case, n_rows):
+    model, X = case
+    # Small chunks so the larger engine batches also cross chunk boundaries
+    compiled = CompiledTreeEnsemble(model, max_rows=MAX_ROWS, chunk_rows=100)
+    rows = np.resize(_threshold_rows(model, X), (n_rows, X.shape[1]))
+    assert compiled._delegate(rows) == (n_rows > MAX_ROWS)
+    _assert_identical(compiled, model, rows)
+    # The same batch through the arrays, whatever its size
+    _assert_identical(CompiledTreeEnsemble(model, chunk_rows=100), model, rows)